@@ -0,0 +1,69 @@
+"""
+Mede a taxa de compressão e o custo de CPU de cada codec registrado
+Usa o master do servidor (ou um arquivo informado); sem arquivo, gera texto sintético
+
+Uso: python -m benchmarks.bench_compression [--file server/master.txt] [--levels 1 6 9]
+"""
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from common.compression import CODECS, compress, decompress
+from server.file_handler import FileHandler
+
+
+def sample_text(size):
+    rng = random.Random(0)
+    words = ['sincronização', 'arquivo', 'versão', 'servidor', 'cliente', 'master',
+             'hash', 'bloco', 'protocolo', 'requisição', 'resposta', 'log']
+    lines = []
+    total = 0
+    while total < size:
+        line = ' '.join(rng.choice(words) for _ in range(12)) + f" {rng.randint(0, 10 ** 6)}\n"
+        lines.append(line)
+        total += len(line.encode('utf-8'))
+    return ''.join(lines).encode('utf-8')[:size]
+
+
+def measure(data, codec, level, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        compressed = compress(codec, data, level)
+    compress_time = (time.process_time() - start) / repeat
+
+    start = time.process_time()
+    for _ in range(repeat):
+        decompress(codec, compressed)
+    decompress_time = (time.process_time() - start) / repeat
+
+    return {
+        'bytes': len(compressed),
+        'ratio': round(len(compressed) / len(data), 4) if data else 0,
+        'compress_ms': round(compress_time * 1000, 3),
+        'decompress_ms': round(decompress_time * 1000, 3),
+        'compress_mb_s': round(len(data) / compress_time / 1e6, 1) if compress_time else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de compressão")
+    parser.add_argument('--file', default=str(FileHandler.MASTER_FILE))
+    parser.add_argument('--size', type=int, default=4 * 1024 * 1024, help='Tamanho do texto sintético')
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 6, 9])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    path = Path(args.file)
+    data = path.read_bytes() if path.exists() and path.stat().st_size else sample_text(args.size)
+
+    results = {'input_bytes': len(data), 'codecs': {}}
+    for codec in CODECS:
+        results['codecs'][codec] = {
+            str(level): measure(data, codec, level, args.repeat) for level in args.levels
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+"""
+Benchmark de ponta a ponta: servidor local, N clientes SyncMonitor e atualizações periódicas
+
+Para cada combinação de modo (R, RR, RRA), tamanho do master e taxa de
+atualização, inicia run_server num processo com diretório de dados próprio,
+roda os clientes em threads e mede:
+- requisições/s e latência p50/p99 por método RMI (medidas no stub)
+- atraso de propagação: de update_master_file até o último slave convergir
+- CPU e RSS do processo do servidor
+
+Os resultados vão para um JSON (--output) com a revisão do git; --compare
+mostra a variação em relação a um resultado anterior.
+
+Uso: python -m benchmarks.bench_e2e --clients 16 --modes R RR RRA --sizes 64K 1M --rates 1 --duration 10
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from client.stub import FileSyncStub
+from client.sync_monitor import SyncMonitor
+from common.digest import DEFAULT_ALGORITHM, hash_bytes
+
+try:
+    import psutil
+except ImportError:  # Dependência opcional; sem ela, lê /proc (Linux)
+    psutil = None
+
+USER, PASSWORD = 'admin', 'admin123'
+
+
+class Recorder:
+    """Latências por método e instantes em que cada cliente gravou cada versão"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.converged = defaultdict(dict)
+
+    def call(self, method_name, seconds, ok):
+        with self._lock:
+            self.latencies[method_name].append(seconds)
+            if not ok:
+                self.errors[method_name] += 1
+
+    def version(self, client_id, version, when):
+        with self._lock:
+            self.converged[version].setdefault(client_id, when)
+
+
+class TimedStub(FileSyncStub):
+    def __init__(self, server_url, username, password, recorder):
+        super().__init__(server_url, username, password)
+        self.recorder = recorder
+
+    def _make_request(self, method_name, http_timeout=30, headers=None, **kwargs):
+        start = time.perf_counter()
+        response = super()._make_request(method_name, http_timeout, headers, **kwargs)
+        ok = response.get('status') in ('success', 'not_modified')
+        self.recorder.call(method_name, time.perf_counter() - start, ok)
+        return response
+
+    def download_file(self, target_path, path=None, http_timeout=30):
+        start = time.perf_counter()
+        version = super().download_file(target_path, path, http_timeout)
+        self.recorder.call('download_file', time.perf_counter() - start, version is not None)
+        return version
+
+
+class TimedMonitor(SyncMonitor):
+    # Encerramento rápido no fim do cenário
+    LONG_POLL_TIMEOUT = 5
+
+    def __init__(self, stub, mode, interval, long_poll, slave_file, client_id, recorder):
+        super().__init__(stub, mode, interval, long_poll, slave_file)
+        self.client_id = client_id
+        self.recorder = recorder
+
+    def _save_state(self, version, st):
+        super()._save_state(version, st)
+        self.recorder.version(self.client_id, version, time.monotonic())
+
+
+def parse_size(text):
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper()
+    return int(float(text[:-1]) * units[text[-1]]) if text[-1] in units else int(text)
+
+
+def make_content(size, revision):
+    line = f"revisão {revision} " + 'conteúdo de teste ' * 4 + '\n'
+    repeated = (line * (size // len(line.encode('utf-8')) + 1)).encode('utf-8')[:size]
+    return repeated.decode('utf-8', 'ignore')
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else None
+
+
+def process_usage(pid):
+    """(segundos de CPU, RSS em bytes) do processo, ou None se indisponível"""
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            times = process.cpu_times()
+            return times.user + times.system, process.memory_info().rss
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rpartition(')')[2].split()
+        ticks = os.sysconf('SC_CLK_TCK')
+        cpu = (int(fields[11]) + int(fields[12])) / ticks
+        with open(f"/proc/{pid}/status") as f:
+            rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmRSS:'))
+        return cpu, rss
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+
+
+def serve(data_dir, server_kwargs):
+    """Alvo do processo do servidor: dados isolados e logs descartados"""
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    from server.file_handler import FileHandler
+    from server.server_main import run_server
+    # Logs do servidor (server.log etc.) ficam no diretório do cenário
+    os.chdir(data_dir)
+    FileHandler.use_data_dir(data_dir)
+    run_server(**server_kwargs)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenario(args, port, mode, size, rate):
+    recorder = Recorder()
+    work_dir = Path(tempfile.mkdtemp(prefix='bench_e2e_'))
+    server_kwargs = {'port': port, 'workers': args.workers, 'use_async': args.use_async, 'digest': args.digest}
+    server = multiprocessing.get_context('spawn').Process(target=serve, args=(str(work_dir), server_kwargs))
+    server.start()
+    time.sleep(args.startup)
+
+    url = f"http://localhost:{port}"
+    admin = FileSyncStub(url, USER, PASSWORD)
+    admin.update_master_file(make_content(size, 0), admin.auth_token)
+
+    monitors = []
+    for index in range(args.clients):
+        stub = TimedStub(url, USER, PASSWORD, recorder)
+        slave = work_dir / f"client_{index}" / 'slave.txt'
+        slave.parent.mkdir()
+        monitors.append(TimedMonitor(stub, mode, args.interval, args.long_poll, slave, index, recorder))
+
+    updates = {}
+    samples = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for monitor in monitors:
+            monitor.start()
+        usage_start = process_usage(server.pid)
+        start = time.monotonic()
+        next_update = start
+        revision = 0
+        while time.monotonic() - start < args.duration:
+            now = time.monotonic()
+            if rate > 0 and now >= next_update:
+                revision += 1
+                content = make_content(size, revision)
+                issued_at = time.monotonic()
+                if admin.update_master_file(content, admin.auth_token):
+                    updates[hash_bytes(content.encode('utf-8'), args.digest)] = issued_at
+                next_update += 1 / rate
+            usage = process_usage(server.pid)
+            if usage is not None:
+                samples.append(usage[1])
+            time.sleep(0.05)
+        elapsed = time.monotonic() - start
+        usage_end = process_usage(server.pid)
+        # Tempo para os clientes alcançarem a última atualização
+        time.sleep(args.settle)
+        for monitor in monitors:
+            monitor.running = False
+        for monitor in monitors:
+            monitor.stop()
+            monitor.stub.close()
+    admin.close()
+    server.terminate()
+    server.join()
+
+    methods = {}
+    for method_name, values in sorted(recorder.latencies.items()):
+        methods[method_name] = {
+            'calls': len(values),
+            'errors': recorder.errors[method_name],
+            'per_second': round(len(values) / elapsed, 1),
+            'p50_ms': round(percentile(values, 0.5) * 1000, 3),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 3)
+        }
+
+    delays, missing = [], 0
+    for version, updated_at in updates.items():
+        clients = recorder.converged.get(version, {})
+        if len(clients) < args.clients:
+            # Versão substituída antes de chegar a todos (ou não propagada)
+            missing += 1
+            continue
+        delays.append(max(clients.values()) - updated_at)
+
+    return {
+        'mode': mode,
+        'size': size,
+        'update_rate': rate,
+        'clients': args.clients,
+        'duration_s': round(elapsed, 2),
+        'requests_per_second': round(sum(len(v) for v in recorder.latencies.values()) / elapsed, 1),
+        'methods': methods,
+        'propagation': {
+            'updates': len(updates),
+            'fully_converged': len(delays),
+            'not_converged': missing,
+            'p50_ms': round(percentile(delays, 0.5) * 1000, 1) if delays else None,
+            'p99_ms': round(percentile(delays, 0.99) * 1000, 1) if delays else None,
+            'max_ms': round(max(delays) * 1000, 1) if delays else None
+        },
+        'server': {
+            'cpu_percent': round((usage_end[0] - usage_start[0]) / elapsed * 100, 1)
+            if usage_start and usage_end else None,
+            'max_rss_bytes': max(samples) if samples else None
+        }
+    }
+
+
+def scenario_key(scenario):
+    return f"{scenario['mode']}/{scenario['size']}/{scenario['update_rate']}"
+
+
+def compare(results, baseline_path):
+    """Imprime a variação das métricas principais em relação a um resultado anterior"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {scenario_key(s): s for s in json.load(f)['scenarios']}
+
+    def change(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if new is not None and old else 'n/a'
+
+    for scenario in results['scenarios']:
+        old = baseline.get(scenario_key(scenario))
+        if old is None:
+            continue
+        print(f"{scenario_key(scenario)}: req/s {change(scenario['requests_per_second'], old['requests_per_second'])}, "
+              f"propagação p99 {change(scenario['propagation']['p99_ms'], old['propagation']['p99_ms'])}")
+        for method_name, stats in scenario['methods'].items():
+            previous = old['methods'].get(method_name)
+            if previous:
+                print(f"  {method_name}: p50 {change(stats['p50_ms'], previous['p50_ms'])}, "
+                      f"p99 {change(stats['p99_ms'], previous['p99_ms'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ponta a ponta do sistema de sincronização")
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--modes', nargs='+', choices=['R', 'RR', 'RRA'], default=['R', 'RR', 'RRA'])
+    parser.add_argument('--sizes', nargs='+', default=['64K'], help='Tamanhos do master (ex.: 64K 1M)')
+    parser.add_argument('--rates', nargs='+', type=float, default=[1.0], help='Atualizações por segundo')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--interval', type=float, default=1, help='Intervalo de verificação dos clientes')
+    parser.add_argument('--long-poll', action='store_true', help='Clientes em long-poll')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Servidor asyncio')
+    parser.add_argument('--workers', type=int, default=None, help='Workers do servidor (padrão: o do servidor)')
+    parser.add_argument('--digest', default=DEFAULT_ALGORITHM)
+    parser.add_argument('--startup', type=float, default=1.5, help='Espera pela subida do servidor')
+    parser.add_argument('--settle', type=float, default=3, help='Espera final pela convergência')
+    parser.add_argument('--output', help='Arquivo JSON de resultados (padrão: benchmarks/results/<data>.json)')
+    parser.add_argument('--compare', help='Resultado anterior para comparação')
+    args = parser.parse_args()
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'scenarios': []
+    }
+    for mode in args.modes:
+        for size in args.sizes:
+            for rate in args.rates:
+                scenario = run_scenario(args, args.port, mode, parse_size(size), rate)
+                results['scenarios'].append(scenario)
+                print(f"{scenario_key(scenario)}: {scenario['requests_per_second']} req/s, "
+                      f"propagação p99 {scenario['propagation']['p99_ms']} ms")
+
+    output = Path(args.output or Path(__file__).parent / 'results' /
+                  f"e2e_{datetime.now():%Y%m%d_%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Resultados gravados em {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
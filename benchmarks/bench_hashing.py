@@ -0,0 +1,42 @@
+"""
+Compara a vazão dos algoritmos de versão (common.digest), incluindo o modo
+árvore e o rehash incremental após alterar um único byte
+
+Uso: python -m benchmarks.bench_hashing --size-mb 256
+"""
+import argparse
+import json
+import os
+import time
+from common.digest import available_algorithms, hash_bytes, is_tree, tree_hash
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos algoritmos de hash")
+    parser.add_argument('--size-mb', type=int, default=256)
+    args = parser.parse_args()
+
+    data = os.urandom(args.size_mb * 1024 * 1024)
+    changed = bytearray(data)
+    changed[len(data) // 2] ^= 1
+    changed = bytes(changed)
+
+    results = {'input_bytes': len(data), 'cpus': os.cpu_count(), 'algorithms': {}}
+    for algorithm in available_algorithms():
+        elapsed = timed(hash_bytes, data, algorithm)
+        result = {'seconds': round(elapsed, 4), 'mb_s': round(len(data) / elapsed / 1e6, 1)}
+        if is_tree(algorithm):
+            _, leaves = tree_hash(data, algorithm)
+            result['incremental_seconds'] = round(timed(tree_hash, changed, algorithm, (data, leaves)), 4)
+        results['algorithms'][algorithm] = result
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
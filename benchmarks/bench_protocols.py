@@ -0,0 +1,105 @@
+"""
+Compara o JSON sobre HTTP com o protocolo binário (common.framing)
+Mede chamadas/s de check_master_version e MB/s de get_file_content e
+update_master_file; a compressão HTTP fica desligada e o servidor HTTP usa
+asyncio, como o binário, para medir só o protocolo
+
+Uso: python -m benchmarks.bench_protocols --size-mb 8 --duration 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+from benchmarks.bench_compression import sample_text
+from client.stub import FileSyncStub
+
+USER, PASSWORD = 'admin', 'admin123'
+
+
+def start_server(port, binary_port):
+    cmd = [sys.executable, '-m', 'server.server_main', '--port', str(port), '--async',
+           '--binary-port', str(binary_port)]
+    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1.5)
+    return process
+
+
+def make_stub(url, transport):
+    stub = FileSyncStub(url, USER, PASSWORD)
+    stub.compression = None
+    stub.max_retries = 1
+    stub.transport = transport
+    return stub
+
+
+def measure_calls(url, transport, clients, duration):
+    counts = [0] * clients
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        stub = make_stub(url, transport)
+        while time.monotonic() < deadline:
+            if stub.check_master_version() is not None:
+                counts[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return round(sum(counts) / duration, 1)
+
+
+def measure_transfer(stub, content, repeat):
+    size = len(content.encode('utf-8'))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        stub.update_master_file(content, stub.auth_token)
+    upload = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        # Versão inexistente: força o envio do conteúdo completo
+        stub.get_file_content_if_changed('bench')
+    download = time.perf_counter() - start
+    return {
+        'upload_mb_s': round(size * repeat / upload / 1e6, 1),
+        'download_mb_s': round(size * repeat / download / 1e6, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON/HTTP vs protocolo binário")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--binary-port', type=int, default=8766)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--size-mb', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # Aspas, barras e acentos exercitam o escape do JSON
+    text = sample_text(args.size_mb * 1024 * 1024).decode('utf-8', 'ignore')
+    content = text.replace('log', '"log"').replace('hash', 'C:\\hash')
+
+    url = f"http://localhost:{args.port}"
+    process = start_server(args.port, args.binary_port)
+    try:
+        results = {'content_bytes': len(content.encode('utf-8')), 'transports': {}}
+        for transport in ('http', 'binary'):
+            stub = make_stub(url, transport)
+            results['transports'][transport] = {
+                'calls_s': measure_calls(url, transport, args.clients, args.duration),
+                **measure_transfer(stub, content, args.repeat)
+            }
+            stub.close()
+        print(json.dumps(results, indent=2))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
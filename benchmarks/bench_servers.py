@@ -0,0 +1,101 @@
+"""
+Compara o servidor com pool de threads e o servidor asyncio
+Mede requisições/s de check_master_version e quantos long-polls simultâneos
+cada servidor consegue manter abertos
+
+Uso: python -m benchmarks.bench_servers --clients 32 --duration 5 --hold 2000
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from client.async_stub import AsyncFileSyncStub
+
+USER, PASSWORD = 'admin', 'admin123'
+
+
+def start_server(port, use_async):
+    cmd = [sys.executable, '-m', 'server.server_main', '--port', str(port)]
+    if use_async:
+        cmd.append('--async')
+    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1.5)
+    return process
+
+
+async def measure_throughput(url, clients, duration):
+    stubs = [AsyncFileSyncStub(url, USER, PASSWORD) for _ in range(clients)]
+    for stub in stubs:
+        stub.max_retries = 1
+    deadline = time.monotonic() + duration
+    counts = [0] * clients
+
+    async def worker(index):
+        while time.monotonic() < deadline:
+            if await stubs[index].check_master_version() is not None:
+                counts[index] += 1
+
+    await asyncio.gather(*(worker(i) for i in range(clients)))
+    await asyncio.gather(*(stub.close() for stub in stubs))
+    return sum(counts) / duration
+
+
+async def measure_held_connections(url, hold, wait):
+    stub = AsyncFileSyncStub(url, USER, PASSWORD)
+    version = await stub.check_master_version()
+    await stub.close()
+    body = json.dumps({
+        'method': 'wait_for_version',
+        'auth_token': stub.auth_token,
+        'since': version,
+        'timeout': wait
+    }).encode('utf-8')
+    request = (
+        f"POST /wait_for_version HTTP/1.1\r\nHost: {stub.host}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+    ).encode('ascii') + body
+
+    async def hold_one():
+        try:
+            reader, writer = await asyncio.open_connection(stub.host, stub.port)
+            writer.write(request)
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), wait + 5)
+            writer.close()
+            # Só conta quem ficou preso até o timeout do long-poll e recebeu 200
+            return b' 200 ' in status_line
+        except (OSError, asyncio.TimeoutError):
+            return False
+
+    results = await asyncio.gather(*(hold_one() for _ in range(hold)))
+    return sum(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos servidores RMI")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--hold', type=int, default=1000)
+    parser.add_argument('--wait', type=float, default=3)
+    args = parser.parse_args()
+
+    results = {}
+    for name, use_async in (('threaded', False), ('asyncio', True)):
+        process = start_server(args.port, use_async)
+        url = f"http://localhost:{args.port}"
+        try:
+            results[name] = {
+                'requests_per_second': round(asyncio.run(measure_throughput(url, args.clients, args.duration)), 1),
+                'connections_held': asyncio.run(measure_held_connections(url, args.hold, args.wait))
+            }
+        finally:
+            process.terminate()
+            process.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
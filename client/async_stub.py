@@ -0,0 +1,218 @@
+import asyncio
+import json
+import ssl
+from urllib.parse import urlsplit
+from common.auth import create_auth_token
+from common.compression import accept_header, decompress
+from interface.remote_interface import RemoteInterface
+from common.protocol import SyncProtocol
+
+
+class AsyncFileSyncStub(RemoteInterface):
+    """
+    Variante asyncio do FileSyncStub
+    Mantém uma conexão HTTP/1.1 persistente e expõe os métodos remotos como corrotinas
+    """
+
+    def __init__(self, server_url, username, password):
+        self.server_url = server_url
+        parts = urlsplit(server_url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f"Esquema não suportado: {server_url}")
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.ssl_context = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.auth_token = create_auth_token(username, password)
+        self.retry_delay = 2
+        self.max_retries = 3
+        # Codec preferido nas respostas (None desativa a compressão)
+        self.compression = 'gzip'
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        if self._writer is None or self._writer.is_closing():
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl_context)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+            self._writer = None
+
+    async def _roundtrip(self, method_name, body, http_timeout, if_none_match=None):
+        await self._connect()
+        head = (
+            f"POST /{method_name} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            + (f"Accept-Encoding: {accept_header(self.compression)}\r\n" if self.compression else "")
+            + (f"If-None-Match: \"{if_none_match}\"\r\n" if if_none_match else "") +
+            "Connection: keep-alive\r\n\r\n"
+        ).encode('ascii')
+        self._writer.write(head + body)
+        await self._writer.drain()
+
+        status_line = await asyncio.wait_for(self._reader.readline(), http_timeout)
+        if not status_line:
+            raise ConnectionError("Conexão encerrada pelo servidor")
+        status_code = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        payload = await self._reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        encoding = headers.get('content-encoding')
+        if encoding and encoding != 'identity':
+            payload = decompress(encoding, payload)
+        return status_code, headers, payload
+
+    async def _make_request(self, method_name, http_timeout=30, if_none_match=None, **kwargs):
+        request_data = {
+            'method': method_name,
+            'auth_token': self.auth_token,
+            **kwargs
+        }
+        body = json.dumps(request_data).encode('utf-8')
+
+        for attempt in range(self.max_retries):
+            try:
+                async with self._lock:
+                    status_code, headers, payload = await self._roundtrip(method_name, body, http_timeout, if_none_match)
+                if status_code == 304:
+                    return {'status': 'not_modified', 'version': headers.get('etag', '').strip('"')}
+                if status_code == 200:
+                    return json.loads(payload.decode('utf-8'))
+                if status_code < 500:
+                    # Erros do cliente (ex.: versão inexistente) não justificam nova tentativa
+                    try:
+                        return json.loads(payload.decode('utf-8'))
+                    except ValueError:
+                        return {'status': 'error', 'message': f"HTTP Error {status_code}"}
+                raise ConnectionError(f"HTTP Error {status_code}")
+
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                print(f"Tentativa {attempt + 1} falhou: {str(e)}")
+                await self.close()
+                if attempt == self.max_retries - 1:
+                    return {'status': 'error', 'message': str(e)}
+                await asyncio.sleep(self.retry_delay)
+
+    async def confirm_sync(self, protocol_type: str, version=None) -> bool:
+        params = {'version': version} if version is not None else {}
+        response = await self._make_request('confirm_sync', protocol=protocol_type, **params)
+        return response.get('status') == 'success'
+
+    async def confirm_syncs(self, confirmations) -> bool:
+        response = await self._make_request('confirm_sync', confirmations=confirmations)
+        return response.get('status') == 'success'
+
+    async def get_file_content(self, if_version_not=None):
+        _, content = await self.get_file_content_if_changed(if_version_not)
+        return content
+
+    async def get_file_content_if_changed(self, local_version):
+        response = await self._make_request('get_file_content', if_none_match=local_version)
+        if response.get('status') == 'success':
+            return response.get('version'), response.get('content')
+        if response.get('status') == 'not_modified':
+            return response.get('version'), None
+        return None, None
+
+    async def get_file_delta(self, signatures, block_size):
+        response = await self._make_request(
+            'get_file_delta',
+            signatures=signatures,
+            block_size=block_size
+        )
+        if response.get('status') == 'success':
+            return response
+        return None
+
+    async def check_master_version(self):
+        response = await self._make_request('check_master_version')
+        if response.get('status') == 'success':
+            return response.get('version')
+        return None
+
+    async def wait_for_version(self, since, timeout=30):
+        response = await self._make_request(
+            'wait_for_version',
+            http_timeout=timeout + 10,
+            since=since,
+            timeout=timeout
+        )
+        if response.get('status') == 'success':
+            if not response.get('changed') and response.get('retry_after'):
+                # Servidor sem vaga para long-poll: a espera acontece aqui
+                await asyncio.sleep(response['retry_after'])
+            return response.get('version')
+        return None
+
+    async def get_tree_manifest(self, since=None):
+        params = {'since': since} if since is not None else {}
+        response = await self._make_request('get_tree_manifest', **params)
+        if response.get('status') == 'success':
+            return response
+        return None
+
+    async def list_versions(self, limit=None):
+        params = {'limit': limit} if limit is not None else {}
+        response = await self._make_request('list_versions', **params)
+        if response.get('status') == 'success':
+            return response.get('versions')
+        return None
+
+    async def get_version_content(self, version):
+        response = await self._make_request('get_version_content', version=version)
+        if response.get('status') == 'success':
+            return response.get('content')
+        return None
+
+    async def get_version_diff(self, from_version, to_version=None):
+        params = {'to_version': to_version} if to_version is not None else {}
+        response = await self._make_request('get_version_diff', from_version=from_version, **params)
+        if response.get('status') == 'success':
+            return response
+        return None
+
+    async def get_metrics(self):
+        response = await self._make_request('get_metrics')
+        if response.get('status') == 'success':
+            return response.get('metrics')
+        return None
+
+    async def profiling(self, cpu=None, memory=None, report=False, **options):
+        params = {key: value for key, value in (('cpu', cpu), ('memory', memory)) if value is not None}
+        response = await self._make_request('profiling', report=report, **params, **options)
+        if response.get('status') == 'success':
+            return response
+        return None
+
+    async def restore_version(self, version):
+        response = await self._make_request('restore_version', version=version)
+        return response.get('status') == 'success'
+
+    async def synchronize(self, protocol: SyncProtocol = SyncProtocol.R) -> bool:
+        response = await self._make_request('synchronize', mode=protocol.value)
+        return response.get('status') == 'success'
+
+    async def update_master_file(self, new_content: str, auth_token: str) -> bool:
+        response = await self._make_request(
+            'update_master_file',
+            new_content=new_content,
+            auth_token=auth_token
+        )
+        return response.get('status') == 'success'
@@ -0,0 +1,86 @@
+import itertools
+import json
+import time
+from common.framing import HEADER, REQUEST, RESPONSE, decode_header, encode_frame, merge_payload, split_payload
+from client.connection_pool import SocketConnection
+
+# Parâmetros enviados no payload do frame em vez de dentro do JSON
+PAYLOAD_PARAMS = ('new_content',)
+
+
+class BinaryConnection(SocketConnection):
+    """
+    Conexão do protocolo binário (common.framing)
+    O servidor responde na ordem das requisições, então várias podem ser
+    enviadas antes de ler a primeira resposta
+    """
+
+    def __init__(self, host, port, connect_timeout=10):
+        super().__init__(host, port, connect_timeout)
+        self._ids = itertools.count(1)
+
+    def send(self, request_data) -> int:
+        """Envia uma requisição e retorna seu id"""
+        meta, payload = request_data, b''
+        for field in PAYLOAD_PARAMS:
+            if isinstance(request_data.get(field), str):
+                meta, payload = split_payload(request_data, field)
+                break
+        request_id = next(self._ids) & 0xFFFFFFFF
+        self._send_parts(encode_frame(REQUEST, request_id, meta, payload))
+        return request_id
+
+    def _send_parts(self, parts):
+        # sendmsg envia cabeçalho, metadados e payload juntos, sem concatená-los
+        views = [memoryview(part) for part in parts]
+        while views:
+            sent = self.sock.sendmsg(views)
+            while views and sent >= len(views[0]):
+                sent -= len(views.pop(0))
+            if sent:
+                views[0] = views[0][sent:]
+
+    def read_head(self, timeout):
+        """Lê cabeçalho e metadados; retorna (status, id, metadados, tamanho do payload)"""
+        self.sock.settimeout(timeout)
+        head = self.rfile.read(HEADER.size)
+        if len(head) < HEADER.size:
+            raise ConnectionError("Conexão encerrada pelo servidor")
+        kind, status_code, request_id, meta_len, payload_len = decode_header(head)
+        if kind != RESPONSE:
+            raise ValueError("Tipo de frame inesperado")
+        meta = self.rfile.read(meta_len)
+        if len(meta) < meta_len:
+            raise ConnectionError("Resposta incompleta")
+        return status_code, request_id, json.loads(meta), payload_len
+
+    def read_payload(self, length) -> memoryview:
+        """Recebe o payload direto num buffer pré-alocado, sem cópias intermediárias"""
+        buffer = bytearray(length)
+        view = memoryview(buffer)
+        received = 0
+        while received < length:
+            count = self.rfile.readinto(view[received:])
+            if not count:
+                raise ConnectionError("Resposta incompleta")
+            received += count
+        self.last_used = time.monotonic()
+        return view
+
+    def iter_payload(self, length, chunk_size=64 * 1024):
+        """Entrega o payload em blocos, sem carregá-lo inteiro em memória"""
+        remaining = length
+        while remaining:
+            chunk = self.rfile.read(min(chunk_size, remaining))
+            if not chunk:
+                raise ConnectionError("Resposta incompleta")
+            remaining -= len(chunk)
+            yield chunk
+        self.last_used = time.monotonic()
+
+    def read_response(self, timeout):
+        """Lê uma resposta completa e retorna (status, resposta)"""
+        status_code, _, meta, payload_len = self.read_head(timeout)
+        payload = self.read_payload(payload_len) if payload_len else b''
+        self.last_used = time.monotonic()
+        return status_code, merge_payload(meta, payload)
@@ -1,7 +1,9 @@
 import argparse
 import time
+from client.async_stub import AsyncFileSyncStub
 from client.stub import FileSyncStub
-from client.sync_monitor import SyncMonitor
+from client.sync_monitor import AsyncSyncMonitor, SyncMonitor
+from client.tree_sync import TreeSync
 
 def main():
     parser = argparse.ArgumentParser(description="Cliente de sincronização de arquivos RMI")
@@ -10,21 +12,42 @@ def main():
     parser.add_argument('--password', required=True, help='Senha')
     parser.add_argument('--mode', choices=['R', 'RR', 'RRA'], default='R', help='Modo de sincronização')
     parser.add_argument('--interval', type=int, default=5, help='Intervalo de verificação em segundos')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Usa o transporte asyncio')
+    parser.add_argument('--long-poll', action='store_true', help='Aguarda notificações do servidor em vez de verificar por intervalo')
+    parser.add_argument('--tree', help='Diretório local para espelhar a árvore do servidor')
+    parser.add_argument('--tree-workers', type=int, default=4, help='Downloads paralelos da árvore')
+    parser.add_argument('--transport', choices=['http', 'binary', 'auto'], default='http',
+                        help='Protocolo do stub síncrono (binary/auto negociam o protocolo binário)')
     
     args = parser.parse_args()
     
     # Cria o stub para comunicação com o servidor
-    stub = FileSyncStub(args.server, args.user, args.password)
+    if args.use_async:
+        stub = AsyncFileSyncStub(args.server, args.user, args.password)
+        monitor_class = AsyncSyncMonitor
+    else:
+        stub = FileSyncStub(args.server, args.user, args.password)
+        stub.transport = args.transport
+        monitor_class = SyncMonitor
     
     # Inicia o monitor de sincronização
-    monitor = SyncMonitor(stub, args.mode, args.interval)
+    monitor = monitor_class(stub, args.mode, args.interval, long_poll=args.long_poll)
     monitor.start()
     
+    # A árvore usa sempre o stub síncrono, que compartilha o pool de conexões
+    tree_sync = None
+    if args.tree:
+        tree_stub = stub if isinstance(stub, FileSyncStub) else FileSyncStub(args.server, args.user, args.password)
+        tree_sync = TreeSync(tree_stub, args.tree, args.interval, args.tree_workers)
+        tree_sync.start()
+    
     try:
         while True:  # Mantém o programa ativo
             time.sleep(1)  
     except KeyboardInterrupt:
         monitor.stop()
+        if tree_sync:
+            tree_sync.stop()
         print("Cliente encerrado.")
 
 if __name__ == '__main__':
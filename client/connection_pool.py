@@ -0,0 +1,162 @@
+import select
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class SocketConnection:
+    """Socket TCP persistente com leitura bufferizada, reaproveitável pelo pool"""
+
+    def __init__(self, host, port, connect_timeout=10, ssl_context=None):
+        self.host = host
+        self.port = port
+        self.sock = socket.create_connection((host, port), timeout=connect_timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if ssl_context is not None:
+            # https: handshake e verificação do certificado pelo nome do servidor
+            self.sock = ssl_context.wrap_socket(self.sock, server_hostname=host)
+        self.rfile = self.sock.makefile('rb')
+        self.last_used = time.monotonic()
+
+    def is_healthy(self) -> bool:
+        """Uma conexão ociosa legível foi encerrada pelo servidor (ou está dessincronizada)"""
+        if self.sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.rfile.close()
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+class PooledConnection(SocketConnection):
+    """Conexão HTTP/1.1 persistente, que permite pipelining"""
+
+    def send(self, path, body: bytes, headers=None):
+        head = [
+            f"POST {path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            "Connection: keep-alive"
+        ]
+        for key, value in (headers or {}).items():
+            head.append(f"{key}: {value}")
+        self.sock.sendall(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+
+    def read_head(self, timeout):
+        """Lê a linha de status e os cabeçalhos; retorna (status, cabeçalhos)"""
+        self.sock.settimeout(timeout)
+        status_line = self.rfile.readline()
+        if not status_line:
+            raise ConnectionError("Conexão encerrada pelo servidor")
+        status_code = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = self.rfile.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        return status_code, headers
+
+    def iter_body(self, headers, chunk_size=64 * 1024):
+        """Entrega o corpo em blocos, sem carregá-lo inteiro em memória"""
+        remaining = int(headers.get('content-length', 0))
+        while remaining:
+            chunk = self.rfile.read(min(chunk_size, remaining))
+            if not chunk:
+                raise ConnectionError("Resposta incompleta")
+            remaining -= len(chunk)
+            yield chunk
+        self.last_used = time.monotonic()
+
+    def read_response(self, timeout):
+        """Lê uma resposta completa e retorna (status, cabeçalhos, corpo)"""
+        status_code, headers = self.read_head(timeout)
+        length = int(headers.get('content-length', 0))
+        payload = self.rfile.read(length) if length else b''
+        if len(payload) < length:
+            raise ConnectionError("Resposta incompleta")
+        self.last_used = time.monotonic()
+        return status_code, headers, payload
+
+
+class ConnectionPool:
+    """
+    Pool de conexões persistentes para um servidor
+    Conexões ociosas há mais de idle_timeout são descartadas antes que o
+    servidor as encerre (o servidor fecha conexões ociosas após KEEP_ALIVE_TIMEOUT, 30 s)
+    """
+
+    def __init__(self, host, port, max_idle=4, idle_timeout=10, factory=PooledConnection, ssl_context=None):
+        self.host = host
+        self.port = port
+        self.factory = factory
+        self.ssl_context = ssl_context
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Retorna (conexão, reutilizada)"""
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if now - conn.last_used < self.idle_timeout and conn.is_healthy():
+                    return conn, True
+                conn.close()
+        return self.connect(), False
+
+    def connect(self):
+        if self.ssl_context is None:
+            return self.factory(self.host, self.port)
+        return self.factory(self.host, self.port, ssl_context=self.ssl_context)
+
+    def release(self, conn, reusable=True):
+        with self._lock:
+            if reusable and conn.sock is not None and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+# Esquemas aceitos e porta padrão; rmi é o protocolo binário (porta sempre explícita)
+DEFAULT_PORTS = {'http': 80, 'https': 443, 'rmi': None}
+
+
+def get_pool(server_url, factory=PooledConnection) -> ConnectionPool:
+    """Pool compartilhado por todos os stubs que falam com o mesmo servidor"""
+    parts = urlsplit(server_url)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS:
+        raise ValueError(f"Esquema não suportado: {server_url}")
+    key = (scheme, parts.hostname or 'localhost', parts.port or DEFAULT_PORTS[scheme], factory)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            ssl_context = ssl.create_default_context() if scheme == 'https' else None
+            pool = _pools[key] = ConnectionPool(key[1], key[2], factory=factory, ssl_context=ssl_context)
+        return pool
@@ -0,0 +1,244 @@
+"""
+Daemon de assinaturas: um processo sincroniza vários masters e árvores
+
+Uso: python -m client.daemon --config client/subscriptions.json
+
+{
+    "max_transfers": 4,
+    "servers": {
+        "origem": {"url": "http://localhost:8000", "user": "admin", "password": "admin123"}
+    },
+    "subscriptions": [
+        {"server": "origem", "local": "client/slave.txt", "mode": "RRA", "interval": 5},
+        {"server": "origem", "remote": "tree/docs", "local": "client/docs", "interval": 30}
+    ]
+}
+
+remote é "master" (padrão) ou "tree" seguido opcionalmente de um
+subdiretório. Cada servidor tem um único stub (e portanto um pool de
+conexões e uma fila de confirmações RRA) compartilhado pelas suas
+assinaturas. Um único timer agenda os ciclos, que rodam num pool com
+max_transfers threads: esse é o limite global de sincronizações simultâneas.
+"""
+import argparse
+import heapq
+import itertools
+import json
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from client.stub import FileSyncStub
+from client.sync_monitor import SyncMonitor
+from client.tree_sync import TreeSync
+from common.ack_queue import AckQueue, pending_acks_path
+from common.metrics import REGISTRY
+
+CYCLE_SECONDS = REGISTRY.histogram('daemon_cycle_seconds', 'Duração dos ciclos por assinatura', ('subscription',))
+
+
+class Subscription:
+    """Uma assinatura (servidor, caminho remoto, caminho local, modo, intervalo)"""
+
+    def __init__(self, name, server, remote, local, mode, interval, sync):
+        self.name = name
+        self.server = server
+        self.remote = remote
+        self.local = local
+        self.mode = mode
+        self.interval = interval
+        self._sync = sync
+        self.runs = 0
+        self.failures = 0
+        self.last_run = None
+
+    def run_once(self):
+        start = time.perf_counter()
+        try:
+            if self._sync() is False:
+                self.failures += 1
+        except Exception as e:
+            self.failures += 1
+            print(f"[ERRO] {self.name}: {str(e)}")
+            traceback.print_exc()
+        finally:
+            self.runs += 1
+            self.last_run = time.time()
+            CYCLE_SECONDS.observe(time.perf_counter() - start, (self.name,))
+
+    def status(self) -> dict:
+        return {
+            'server': self.server,
+            'remote': self.remote,
+            'local': str(self.local),
+            'mode': self.mode,
+            'interval': self.interval,
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_run': self.last_run
+        }
+
+
+class Scheduler:
+    """
+    Timer único para todas as assinaturas
+    Um heap guarda (instante, sequência, assinatura); a thread do timer dorme
+    até o próximo vencimento e entrega a assinatura ao pool. A assinatura só
+    volta ao heap quando o ciclo termina, então nunca roda duas vezes ao mesmo tempo.
+    """
+
+    def __init__(self, max_workers):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sync')
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopping = False
+
+    def schedule(self, subscription, delay):
+        with self._condition:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), subscription))
+            self._condition.notify()
+
+    def _execute(self, subscription):
+        try:
+            subscription.run_once()
+        finally:
+            if not self._stopping:
+                self.schedule(subscription, subscription.interval)
+
+    def run(self):
+        with self._condition:
+            while not self._stopping:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                due = self._heap[0][0] - time.monotonic()
+                if due > 0:
+                    self._condition.wait(due)
+                    continue
+                _, _, subscription = heapq.heappop(self._heap)
+                self._executor.submit(self._execute, subscription)
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        # Ciclos em andamento terminam; os agendados são descartados
+        self._executor.shutdown(wait=True)
+
+
+class SyncDaemon:
+    DEFAULT_MAX_TRANSFERS = 4
+
+    def __init__(self, config: dict, state_dir='client'):
+        self.max_transfers = int(config.get('max_transfers', self.DEFAULT_MAX_TRANSFERS))
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.stubs = {}
+        self.acks = {}
+        self.subscriptions = []
+        self.scheduler = Scheduler(self.max_transfers)
+
+        for name, server in config.get('servers', {}).items():
+            stub = FileSyncStub(server['url'], server['user'], server['password'])
+            stub.transport = server.get('transport', 'http')
+            # Até max_transfers ciclos simultâneos no mesmo servidor reaproveitam conexões
+            stub.pool.max_idle = max(stub.pool.max_idle, self.max_transfers)
+            self.stubs[name] = stub
+
+        for index, entry in enumerate(config.get('subscriptions', [])):
+            self.subscriptions.append(self._build(index, entry))
+
+    def _server_acks(self, server):
+        """Fila de confirmações RRA do servidor, compartilhada pelas suas assinaturas"""
+        if server not in self.acks:
+            stub = self.stubs[server]
+            # Chave pela URL (não pelo nome na configuração): renomear o servidor não perde as pendentes
+            path = pending_acks_path(stub.server_url, self.state_dir / 'daemon')
+            self.acks[server] = AckQueue(stub.confirm_syncs, path)
+        return self.acks[server]
+
+    def _build(self, index, entry) -> Subscription:
+        server = entry['server']
+        if server not in self.stubs:
+            raise ValueError(f"Assinatura {index}: servidor desconhecido '{server}'")
+        stub = self.stubs[server]
+        remote = entry.get('remote', 'master').strip('/')
+        local = Path(entry['local'])
+        mode = entry.get('mode', 'R')
+        interval = float(entry.get('interval', 5))
+        name = entry.get('name', f"{server}:{remote}->{local}")
+
+        if remote == 'master':
+            local.parent.mkdir(parents=True, exist_ok=True)
+            monitor = SyncMonitor(stub, mode, interval, slave_file=local,
+                                  acks=self._server_acks(server) if mode == 'RRA' else None)
+
+            def sync():
+                monitor._sync_file()
+                return monitor.last_result == 'ok'
+        elif remote == 'tree' or remote.startswith('tree/'):
+            # Downloads da árvore em série: cada ciclo ocupa uma única vaga de transferência
+            tree = TreeSync(stub, local, interval, workers=1, prefix=remote[len('tree'):])
+
+            def sync():
+                tree.sync_once()
+                return tree.last_result == 'ok'
+        else:
+            raise ValueError(f"Assinatura {index}: remote deve ser 'master' ou 'tree[/subdiretório]'")
+        return Subscription(name, server, remote, local, mode, interval, sync)
+
+    def status(self) -> list:
+        return [{'name': sub.name, **sub.status()} for sub in self.subscriptions]
+
+    def run(self):
+        for acks in self.acks.values():
+            acks.start()
+        # Espalha o primeiro ciclo de cada assinatura dentro do seu intervalo
+        count = max(1, len(self.subscriptions))
+        for index, subscription in enumerate(self.subscriptions):
+            self.scheduler.schedule(subscription, subscription.interval * index / count)
+        print(f"Daemon iniciado: {len(self.subscriptions)} assinaturas em {len(self.stubs)} servidores, "
+              f"até {self.max_transfers} transferências simultâneas")
+        self.scheduler.run()
+
+    def stop(self):
+        self.scheduler.stop()
+        for acks in self.acks.values():
+            acks.stop()
+        for stub in self.stubs.values():
+            stub.close()
+
+
+def load_config(path) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Daemon de sincronização com várias assinaturas")
+    parser.add_argument('--config', required=True, help='Arquivo JSON com servidores e assinaturas')
+    parser.add_argument('--state-dir', default='client', help='Diretório das filas de confirmação pendentes')
+    args = parser.parse_args()
+
+    daemon = SyncDaemon(load_config(args.config), args.state_dir)
+    runner = threading.Thread(target=daemon.run, name='scheduler', daemon=True)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    runner.start()
+    try:
+        while not stopping.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    daemon.stop()
+    for status in daemon.status():
+        print(f"{status['name']}: {status['runs']} ciclos, {status['failures']} falhas")
+    print("Daemon encerrado.")
+
+
+if __name__ == '__main__':
+    main()
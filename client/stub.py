@@ -1,70 +1,397 @@
 import json
-import urllib.request
+import os
 import time
-from urllib.error import URLError, HTTPError
+from urllib.parse import urlsplit
 from common.auth import create_auth_token
+from common.compression import CODECS, MIN_COMPRESS_SIZE, accept_header, compress, decompress
+from common.digest import EMPTY_VERSION, algorithm_of, format_version, new_hasher
 from interface.remote_interface import RemoteInterface
 from common.protocol import SyncProtocol, ProtocolHandler
+from client.binary_transport import BinaryConnection
+from client.connection_pool import get_pool
+
+class BatchResult:
+    """Resultado de uma chamada em lote, disponível após o envio do lote"""
+    def __init__(self, extract):
+        self._extract = extract
+        self.response = None
+    
+    @property
+    def value(self):
+        if self.response is None:
+            return None
+        return self._extract(self.response)
+
+
+class RemoteBatch:
+    """Acumula chamadas e as envia num único round trip ao sair do bloco with"""
+    def __init__(self, stub):
+        self.stub = stub
+        self._calls = []
+        self._results = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self._calls:
+            self.send()
+        return False
+    
+    def call(self, method_name, extract=None, **params) -> BatchResult:
+        result = BatchResult(extract or (lambda response: response))
+        self._calls.append({'method': method_name, 'params': params})
+        self._results.append(result)
+        return result
+    
+    def send(self):
+        response = self.stub._make_request('batch', calls=self._calls)
+        results = response.get('results') if response.get('status') == 'success' else None
+        for index, result in enumerate(self._results):
+            result.response = results[index] if results else response
+        self._calls, self._results = [], []
+    
+    @staticmethod
+    def _field(name):
+        return lambda response: response.get(name) if response.get('status') == 'success' else None
+    
+    def check_master_version(self) -> BatchResult:
+        return self.call('check_master_version', self._field('version'))
+    
+    def get_file_content(self, if_version_not=None) -> BatchResult:
+        params = {'if_version_not': if_version_not} if if_version_not else {}
+        return self.call('get_file_content', self._field('content'), **params)
+    
+    def confirm_sync(self, protocol_type: str) -> BatchResult:
+        return self.call('confirm_sync', lambda response: response.get('status') == 'success', protocol=protocol_type)
+
 
 class FileSyncStub(RemoteInterface):
+    DOWNLOAD_CHUNK_SIZE = 256 * 1024
+    
     def __init__(self, server_url, username, password):
         self.server_url = server_url
         self.auth_token = create_auth_token(username, password)
+        self._credential_token = self.auth_token
         self.protocol_handler = ProtocolHandler(self)
+        self.pool = get_pool(server_url)
         self.retry_delay = 2
         self.max_retries = 3
+        # Codec preferido nas respostas (None desativa a compressão)
+        self.compression = 'gzip'
+        # Comprime também corpos de requisição grandes (ex.: update_master_file)
+        self.compress_requests = True
+        # 'http', 'binary' ou 'auto' (protocolo binário se o servidor o oferecer)
+        self.transport = 'http'
+        self._binary_pool = None
+        self._negotiated = False
+    
+    def _request_headers(self):
+        return {'Accept-Encoding': accept_header(self.compression)} if self.compression else {}
     
-    def _make_request(self, method_name, **kwargs):
-        request_data = {
+    def _encode_body(self, request_data):
+        body = json.dumps(request_data).encode('utf-8')
+        headers = self._request_headers()
+        if self.compression and self.compress_requests and len(body) >= MIN_COMPRESS_SIZE:
+            body = compress(self.compression, body)
+            headers['Content-Encoding'] = self.compression
+            # O servidor só descomprime o corpo depois de validar o token do cabeçalho
+            if request_data.get('auth_token'):
+                headers['Authorization'] = f"Bearer {request_data['auth_token']}"
+        return body, headers
+    
+    def _build_request(self, method_name, params, headers=None):
+        return method_name, {
             'method': method_name,
             'auth_token': self.auth_token,
-            **kwargs
-        }
+            **params
+        }, headers or {}
+    
+    def _exchange(self, conn, calls, http_timeout):
+        # Todas as requisições são escritas antes de ler a primeira resposta
+        for method_name, request_data, headers in calls:
+            body, body_headers = self._encode_body(request_data)
+            conn.send(f"/{method_name}", body, {**body_headers, **headers})
+        responses = [conn.read_response(http_timeout) for _ in calls]
+        reusable = all(headers.get('connection', '').lower() != 'close' for _, headers, _ in responses)
+        self.pool.release(conn, reusable)
+        return responses
+    
+    def _on_connection(self, operation, pool=None):
+        pool = pool or self.pool
+        conn, reused = pool.acquire()
+        try:
+            return operation(conn)
+        except (OSError, ValueError):
+            conn.close()
+            if not reused:
+                raise
+        # Conexão reaproveitada pode ter sido encerrada pelo servidor: tenta uma nova
+        conn = pool.connect()
+        try:
+            return operation(conn)
+        except (OSError, ValueError):
+            conn.close()
+            raise
+    
+    def _send(self, calls, http_timeout):
+        return self._on_connection(lambda conn: self._exchange(conn, calls, http_timeout))
+    
+    def negotiate_transport(self) -> str:
+        """Consulta get_capabilities e passa a usar o protocolo binário se o servidor o oferecer"""
+        self._negotiated = True
+        if self.transport == 'http':
+            return 'http'
+        response = self._make_request('get_capabilities')
+        if response.get('status') != 'success':
+            print(f"[WARN] Falha ao negociar o protocolo ({response.get('message')}), usando HTTP")
+            return 'http'
+        port = response.get('binary_port')
+        if not port:
+            print("[WARN] Servidor sem protocolo binário, usando HTTP")
+            return 'http'
+        host = urlsplit(self.server_url).hostname or 'localhost'
+        self._binary_pool = get_pool(f"rmi://{host}:{port}", BinaryConnection)
+        return 'binary'
+    
+    def _binary(self):
+        """Pool do protocolo binário, negociado na primeira chamada; None indica HTTP"""
+        if not self._negotiated and self.transport != 'http':
+            self.negotiate_transport()
+        return self._binary_pool
+    
+    def _send_binary(self, call, timeout):
+        """Uma chamada pelo protocolo binário; retorna (status, resposta)"""
+        _, request_data, headers = call
+        if_none_match = headers.get('If-None-Match')
+        if if_none_match:
+            request_data = {**request_data, 'if_version_not': if_none_match.strip('"')}
+        
+        def exchange(conn):
+            conn.send(request_data)
+            status_code, response = conn.read_response(timeout)
+            self._binary_pool.release(conn)
+            return status_code, response
+        
+        status_code, response = self._on_connection(exchange, self._binary_pool)
+        if status_code != 200:
+            response.setdefault('message', f"Erro {status_code}")
+        return status_code, response
+    
+    @staticmethod
+    def _decode(status_code, payload, headers=None):
+        if status_code == 304:
+            # Não modificado: sem corpo, a versão vem no ETag
+            return {'status': 'not_modified', 'version': (headers or {}).get('etag', '').strip('"')}
+        try:
+            encoding = (headers or {}).get('content-encoding')
+            if encoding and encoding != 'identity':
+                payload = decompress(encoding, payload)
+            response = json.loads(payload.decode('utf-8'))
+        except ValueError:
+            response = None
+        if status_code == 200 and response is not None:
+            return response
+        if not isinstance(response, dict):
+            response = {'status': 'error'}
+        response.setdefault('message', f"HTTP Error {status_code}")
+        return response
+    
+    def _make_request(self, method_name, http_timeout=30, headers=None, **kwargs):
+        call = self._build_request(method_name, kwargs, headers)
+        binary = self._binary()
         
         for attempt in range(self.max_retries):
+            retry_after = None
             try:
-                req = urllib.request.Request(
-                    url=f"{self.server_url}/{method_name}",
-                    data=json.dumps(request_data).encode('utf-8'),
-                    headers={'Content-Type': 'application/json', 'Connection': 'keep-alive'},
-                    method='POST'
-                )
-                
-                with urllib.request.urlopen(req, timeout=30) as response:
-                    if response.status == 200:
-                        return json.loads(response.read().decode('utf-8'))
-                    else:
-                        raise URLError(f"HTTP Error {response.status}")
-                    
-            except URLError as e:
-                print(f"Tentativa {attempt + 1} falhou: {str(e)}")
-                if attempt == self.max_retries - 1:
-                    return {'status': 'error', 'message': str(e)}
-                time.sleep(self.retry_delay)
+                if binary is not None:
+                    response_headers = {}
+                    status_code, response = self._send_binary(call, http_timeout)
+                else:
+                    status_code, response_headers, payload = self._send([call], http_timeout)[0]
+                    response = self._decode(status_code, payload, response_headers)
+                # Sessão expirada: abre outra com a credencial original e repete
+                if status_code == 401 and self.auth_token != self._credential_token and self.open_session():
+                    call = self._build_request(method_name, kwargs, headers)
+                    continue
+                # Só erros do servidor (5xx) justificam nova tentativa
+                if status_code < 500:
+                    return response
+                error = response['message']
+                retry_after = response_headers.get('retry-after')
+            except (OSError, ValueError) as e:
+                error = str(e) or e.__class__.__name__
                 
-        req = urllib.request.Request(
-            url=f"{self.server_url}/{method_name}",
-            data=json.dumps(request_data).encode('utf-8'),
-            headers={'Content-Type': 'application/json'},
-            method='POST'
-        )
+            print(f"Tentativa {attempt + 1} falhou: {error}")
+            if attempt == self.max_retries - 1:
+                return {'status': 'error', 'message': error}
+            # Servidor sobrecarregado informa quando tentar novamente
+            time.sleep(float(retry_after) if retry_after else self.retry_delay)
+    
+    def pipeline(self, *calls, http_timeout=30):
+        """
+        Envia várias chamadas em pipeline numa única conexão
+        Args:
+            calls: Tuplas (método, parâmetros)
+        Retorna:
+            list: Respostas na mesma ordem das chamadas
+        """
+        requests = [self._build_request(method_name, params) for method_name, params in calls]
+        try:
+            responses = self._send(requests, http_timeout)
+        except (OSError, ValueError) as e:
+            print(f"Erro na comunicação com o servidor: {e}")
+            return [{'status': 'error', 'message': str(e)} for _ in requests]
+        return [self._decode(status_code, payload, headers) for status_code, headers, payload in responses]
+    
+    def _download(self, conn, target_path, params, http_timeout):
+        method_name, request_data, _ = self._build_request('download_file', params)
+        conn.send(f"/{method_name}", *self._encode_body(request_data))
+        status_code, headers = conn.read_head(http_timeout)
+        reusable = headers.get('connection', '').lower() != 'close'
+        
+        if status_code != 200:
+            payload = b''.join(conn.iter_body(headers))
+            self.pool.release(conn, reusable)
+            print(f"Erro no download: {self._decode(status_code, payload, headers).get('message', status_code)}")
+            return None
+        
+        encoding = headers.get('content-encoding')
+        if encoding and encoding != 'identity' and encoding not in CODECS:
+            conn.close()
+            raise ValueError(f"Content-Encoding não suportado: {encoding}")
+        chunks = conn.iter_body(headers, self.DOWNLOAD_CHUNK_SIZE)
+        if encoding in CODECS:
+            chunks = self._decompressed(chunks, CODECS[encoding].decompressor())
+        version = self._save_verified(target_path, chunks, headers.get('x-version'))
+        self.pool.release(conn, reusable)
+        return version
+    
+    def _download_binary(self, conn, target_path, params, timeout):
+        _, request_data, _ = self._build_request('download_file', params)
+        conn.send(request_data)
+        status_code, _, meta, payload_len = conn.read_head(timeout)
+        if status_code != 200 or meta.get('status') != 'success':
+            if payload_len:
+                conn.read_payload(payload_len)
+            self._binary_pool.release(conn)
+            print(f"Erro no download: {meta.get('message', status_code)}")
+            return None
+        chunks = conn.iter_payload(payload_len, self.DOWNLOAD_CHUNK_SIZE)
+        version = self._save_verified(target_path, chunks, meta.get('version'))
+        self._binary_pool.release(conn)
+        return version
+    
+    @staticmethod
+    def _decompressed(chunks, decompressor):
+        for chunk in chunks:
+            yield decompressor.decompress(chunk)
+        yield decompressor.flush()
+    
+    @staticmethod
+    def _save_verified(target_path, chunks, version):
+        """Grava e calcula o hash enquanto recebe (memória constante); descarta se não conferir"""
+        temp_path = f"{target_path}.tmp"
+        algorithm = algorithm_of(version) or 'md5'
+        hasher = new_hasher(algorithm)
+        received = 0
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                hasher.update(chunk)
+                f.write(chunk)
+                received += len(chunk)
         
+        if (format_version(algorithm, hasher.hexdigest()) if received else EMPTY_VERSION) != version:
+            os.remove(temp_path)
+            print("[WARN] Arquivo baixado não confere com a versão informada pelo servidor")
+            return None
+        os.replace(temp_path, target_path)
+        return version
+    
+    def download_file(self, target_path, path=None, http_timeout=30):
+        """
+        Baixa o master em streaming direto para target_path (via arquivo temporário)
+        Args:
+            target_path: Destino local
+            path: Caminho de um arquivo da árvore sincronizada em vez do master
+        Retorna:
+            str: Versão gravada se bem-sucedido
+            None: Se falhar
+        """
         try:
-            with urllib.request.urlopen(req) as response:
-                return json.loads(response.read().decode('utf-8'))
-        except URLError as e:
+            params = {'path': path} if path is not None else {}
+            binary = self._binary()
+            if binary is not None:
+                return self._on_connection(
+                    lambda conn: self._download_binary(conn, target_path, params, http_timeout), binary)
+            return self._on_connection(lambda conn: self._download(conn, target_path, params, http_timeout))
+        except (OSError, ValueError) as e:
             print(f"Erro na comunicação com o servidor: {e}")
-            return {'status': 'error', 'message': str(e)}
+            return None
+    
+    def open_session(self) -> bool:
+        """Troca a credencial por um token de sessão de curta duração emitido pelo servidor"""
+        self.auth_token = self._credential_token
+        response = self._make_request('open_session')
+        if response.get('status') != 'success':
+            return False
+        self.auth_token = response['session_token']
+        return True
+    
+    def batch(self):
+        """
+        Agrupa chamadas numa única requisição 'batch'
+        Uso:
+            with stub.batch() as batch:
+                version = batch.check_master_version()
+                content = batch.get_file_content(if_version_not=local)
+            version.value, content.value
+        """
+        return RemoteBatch(self)
     
-    def confirm_sync(self, protocol_type: str) -> bool:
+    def close(self):
+        # Confirmações RRA pendentes ainda seguem pelo pool antes de fechá-lo
+        self.protocol_handler.close()
+        self.pool.close_all()
+        if self._binary_pool is not None:
+            self._binary_pool.close_all()
+    
+    def confirm_sync(self, protocol_type: str, version=None) -> bool:
         """Confirma a sincronização para protocolos RR e RRA"""
-        response = self._make_request('confirm_sync', protocol=protocol_type)
+        params = {'version': version} if version is not None else {}
+        response = self._make_request('confirm_sync', protocol=protocol_type, **params)
+        return response.get('status') == 'success'
+    
+    def confirm_syncs(self, confirmations) -> bool:
+        """Várias confirmações numa requisição (fila RRA, common.ack_queue)"""
+        response = self._make_request('confirm_sync', confirmations=confirmations)
         return response.get('status') == 'success'
     
-    def get_file_content(self):
-        response = self._make_request('get_file_content')
+    def get_file_content(self, if_version_not=None):
+        _, content = self.get_file_content_if_changed(if_version_not)
+        return content
+    
+    def get_file_content_if_changed(self, local_version):
+        """
+        Busca condicional via If-None-Match: um único round trip
+        Retorna (versão remota, conteúdo ou None se não mudou); versão None indica falha
+        """
+        headers = {'If-None-Match': f'"{local_version}"'} if local_version else None
+        response = self._make_request('get_file_content', headers=headers)
         if response.get('status') == 'success':
-            return response.get('content')
+            return response.get('version'), response.get('content')
+        if response.get('status') == 'not_modified':
+            return response.get('version'), None
+        return None, None
+    
+    def get_file_delta(self, signatures, block_size):
+        response = self._make_request(
+            'get_file_delta',
+            signatures=signatures,
+            block_size=block_size
+        )
+        if response.get('status') == 'success':
+            return response
         return None
     
     def check_master_version(self):
@@ -73,6 +400,65 @@ class FileSyncStub(RemoteInterface):
             return response.get('version')
         return None
     
+    def wait_for_version(self, since, timeout=30):
+        # O timeout HTTP precisa cobrir a espera no servidor
+        response = self._make_request(
+            'wait_for_version',
+            http_timeout=timeout + 10,
+            since=since,
+            timeout=timeout
+        )
+        if response.get('status') == 'success':
+            if not response.get('changed') and response.get('retry_after'):
+                # Servidor sem vaga para long-poll: a espera acontece aqui
+                time.sleep(response['retry_after'])
+            return response.get('version')
+        return None
+    
+    def get_tree_manifest(self, since=None):
+        params = {'since': since} if since is not None else {}
+        response = self._make_request('get_tree_manifest', **params)
+        if response.get('status') == 'success':
+            return response
+        return None
+    
+    def list_versions(self, limit=None):
+        params = {'limit': limit} if limit is not None else {}
+        response = self._make_request('list_versions', **params)
+        if response.get('status') == 'success':
+            return response.get('versions')
+        return None
+    
+    def get_version_content(self, version):
+        response = self._make_request('get_version_content', version=version)
+        if response.get('status') == 'success':
+            return response.get('content')
+        return None
+    
+    def get_version_diff(self, from_version, to_version=None):
+        params = {'to_version': to_version} if to_version is not None else {}
+        response = self._make_request('get_version_diff', from_version=from_version, **params)
+        if response.get('status') == 'success':
+            return response
+        return None
+    
+    def get_metrics(self):
+        response = self._make_request('get_metrics')
+        if response.get('status') == 'success':
+            return response.get('metrics')
+        return None
+    
+    def profiling(self, cpu=None, memory=None, report=False, **options):
+        params = {key: value for key, value in (('cpu', cpu), ('memory', memory)) if value is not None}
+        response = self._make_request('profiling', report=report, **params, **options)
+        if response.get('status') == 'success':
+            return response
+        return None
+    
+    def restore_version(self, version):
+        response = self._make_request('restore_version', version=version)
+        return response.get('status') == 'success'
+    
     def synchronize(self, protocol: SyncProtocol = SyncProtocol.R) -> bool:
         response = self._make_request('synchronize', mode=protocol.value)
         return response.get('status') == 'success'
@@ -1,74 +1,360 @@
+import asyncio
+import json
 import time
 import traceback
-import hashlib
 import threading
 import os
 from pathlib import Path
+from common.ack_queue import AckQueue, pending_acks_path
+from common.delta import apply_delta, block_signatures, choose_block_size
+from common.digest import DEFAULT_ALGORITHM, algorithm_of, hash_bytes, hash_file, short
+from common.metrics import REGISTRY
+
+SYNC_CYCLES = REGISTRY.counter('sync_cycles_total', 'Ciclos de sincronização por resultado', ('result',))
+SYNC_SECONDS = REGISTRY.histogram('sync_cycle_seconds', 'Duração de um ciclo de sincronização')
 
 class SyncMonitor:
-    def __init__(self, stub, mode='R', interval=5):
+    LONG_POLL_TIMEOUT = 30
+    # Abaixo deste tamanho o conteúdo completo vem na própria consulta condicional
+    DELTA_MIN_SIZE = 256 * 1024
+
+    def __init__(self, stub, mode='R', interval=5, long_poll=False, slave_file='client/slave.txt', acks=None):
         self.stub = stub
         self.mode = mode
         self.interval = interval
+        self.long_poll = long_poll
         self.running = False
         self.thread = None
-        self.slave_file = Path('client/slave.txt')
+        self.slave_file = Path(slave_file)
+        # Versão do slave com (inode, tamanho, mtime) da última gravação ou leitura;
+        # outros nomes de slave têm estado próprio, para vários slaves no mesmo diretório
+        state_name = '.slave_state.json' if self.slave_file.name == 'slave.txt' else f'.{self.slave_file.name}.state.json'
+        self.state_file = self.slave_file.with_name(state_name)
         
         if not self.slave_file.exists():
             self.slave_file.touch()
+        self._state = self._load_state()
+        # RRA: confirmações seguem em lote por uma fila persistida ao lado do slave, própria
+        # do par (servidor, slave), ou pela fila recebida, compartilhada com outros monitores do mesmo servidor
+        if acks is None and mode == 'RRA':
+            acks = AckQueue(self._send_acks, pending_acks_path(getattr(stub, 'server_url', ''), self.slave_file))
+        self.acks = acks
+        # Resultado do último ciclo ('ok' ou 'error')
+        self.last_result = None
     
-    def _get_local_hash(self):
+    def _load_state(self):
         try:
-            with open(self.slave_file, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_state(self, version, st):
+        self._state = {
+            'version': version,
+            'inode': st.st_ino,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns
+        }
+        temp_path = f"{self.state_file}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._state, f)
+            os.replace(temp_path, self.state_file)
+        except OSError as e:
+            print(f"[WARN] Não foi possível salvar o estado local: {str(e)}")
+    
+    @property
+    def algorithm(self):
+        """Algoritmo das versões do servidor, conhecido pela última versão vista"""
+        return algorithm_of(self._state.get('version')) or DEFAULT_ALGORITHM
+    
+    def _get_local_hash(self, algorithm=None):
+        """
+        Versão do slave; só relê o arquivo se (inode, tamanho, mtime) mudou
+        desde a última gravação, ou se o servidor usa outro algoritmo
+        """
+        try:
+            st = os.stat(self.slave_file)
+            version = self._state.get('version')
+            unchanged = (self._state.get('inode'), self._state.get('size'), self._state.get('mtime_ns')) == \
+                (st.st_ino, st.st_size, st.st_mtime_ns)
+            if unchanged and version and algorithm_of(version) in (None, algorithm or self.algorithm):
+                return version
+            
+            version = hash_file(self.slave_file, algorithm or self.algorithm)
+            self._save_state(version, st)
+            return version
         except (FileNotFoundError, PermissionError) as e:
             print(f"[WARN] Não foi possível ler arquivo local: {str(e)}")
             return None
     
-    def _sync_file(self):
+    def _local_size(self):
+        try:
+            return self.slave_file.stat().st_size
+        except OSError:
+            return 0
+    
+    def _read_slave(self):
+        try:
+            with open(self.slave_file, 'rb') as f:
+                return f.read()
+        except (FileNotFoundError, PermissionError):
+            return None
+    
+    def _delta_request(self):
+        """Prepara (dados locais, assinaturas, tamanho de bloco) ou None sem cópia local"""
+        local_data = self._read_slave()
+        if not local_data:
+            return None
+        block_size = choose_block_size(len(local_data))
+        return local_data, block_signatures(local_data, block_size), block_size
+    
+    def _apply_delta_response(self, local_data, response, block_size):
+        """Retorna (dados, versão) já conferidos contra o hash da versão remota, ou (None, None)"""
+        if response is None:
+            return None, None
+        data = apply_delta(local_data, response.get('delta', []), block_size)
+        version = response.get('version')
+        if hash_bytes(data, algorithm_of(version) or self.algorithm) != version:
+            print("[WARN] Delta não confere com a versão remota, baixando arquivo completo")
+            return None, None
+        return data, version
+    
+    def _apply_version_diff(self, local_data, response):
+        if response is None:
+            return None, None
+        return self._apply_delta_response(local_data, response, response.get('block_size'))
+    
+    def _fetch_delta(self, local_version=None):
+        """Reconstrói o master a partir da cópia local e do delta do servidor; retorna (dados, versão)"""
+        if local_version:
+            # Versão local ainda no histórico do servidor: delta sem enviar assinaturas
+            local_data = self._read_slave()
+            if local_data:
+                data, version = self._apply_version_diff(local_data, self.stub.get_version_diff(local_version))
+                if data is not None:
+                    return data, version
+        request = self._delta_request()
+        if request is None:
+            return None, None
+        local_data, signatures, block_size = request
+        response = self.stub.get_file_delta(signatures, block_size)
+        return self._apply_delta_response(local_data, response, block_size)
+    
+    def _write_slave(self, data: bytes, version=None):
+        """Grava o slave e registra sua versão, evitando reler o arquivo no próximo ciclo"""
+        temp_path = f"{self.slave_file}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, self.slave_file)
+        if version is None:
+            version = hash_bytes(data, self.algorithm)
+        self._save_state(version, os.stat(self.slave_file))
+    
+    def _record_download(self, version):
+        # O download já validou o hash do conteúdo recebido
+        try:
+            self._save_state(version, os.stat(self.slave_file))
+        except OSError:
+            pass
+    
+    def _check_and_fetch(self, local_version):
+        """
+        Ciclo em um único round trip (If-None-Match com o hash local):
+        sem mudança a resposta é um 304 vazio; com mudança já traz o conteúdo
+        Retorna (versão remota, dados ou None)
+        """
+        remote_version, content = self.stub.get_file_content_if_changed(local_version)
+        if remote_version is None:
+            # Master vazio não tem conteúdo a enviar: consulta só a versão
+            return self.stub.check_master_version(), None
+        return remote_version, content.encode('utf-8') if content is not None else None
+    
+    def _send_acks(self, confirmations):
+        return self.stub.confirm_syncs(confirmations)
+    
+    def _sync_file(self, remote_version=None):
+        start = time.perf_counter()
+        result = 'ok'
         try:
-            remote_version = self.stub.check_master_version()
-            if remote_version is None:
-                print("Erro: Não foi possível obter a versão do servidor")
-                return
-            
             try:
                 local_version = self._get_local_hash()
             except FileNotFoundError:
                 local_version = None  # Arquivo slave.txt não existe ainda
+            
+            data = None
+            if remote_version is None:
+                # Arquivos grandes preferem o delta a receber o conteúdo completo
+                if self._local_size() < self.DELTA_MIN_SIZE:
+                    remote_version, data = self._check_and_fetch(local_version)
+                else:
+                    remote_version = self.stub.check_master_version()
+            if remote_version is None:
+                print("Erro: Não foi possível obter a versão do servidor")
+                return
+            if data is None and algorithm_of(remote_version) not in (None, algorithm_of(local_version)):
+                # Servidor trocou de algoritmo: recalcula a versão local para comparar
+                local_version = self._get_local_hash(algorithm_of(remote_version))
                 
             if remote_version != local_version:
-                print(f"[SYNC] Alteração detectada (Remota: {remote_version[:8]} != Local: {local_version[:8] if local_version else 'None'})")
-                content = self.stub.get_file_content()
-                if content is not None:
-                    temp_path = f"{self.slave_file}.tmp"
-                    with open(temp_path, 'w', encoding='utf-8') as f:
-                        f.write(content)
-                        
-                    os.replace(temp_path, self.slave_file)
-                    print(f"[SYNC] Concluído ({len(content)} bytes transferidos)")
-                    if self.mode in ['RR', 'RRA']:
-                        if not self.stub.confirm_sync(self.mode):
-                            print("[SYNC] Aviso: Confirmação não recebida pelo servidor")
+                print(f"[SYNC] Alteração detectada (Remota: {short(remote_version)} != Local: {short(local_version)})")
+                version = remote_version
+                if data is None:
+                    # O delta pode corresponder a uma versão mais nova; a versão vem já conferida
+                    data, version = self._fetch_delta(local_version)
+                    
+                if data is not None:
+                    self._write_slave(data, version)
+                    size = len(data)
+                else:
+                    # Download em streaming grava o slave diretamente
+                    version = self.stub.download_file(self.slave_file)
+                    if version is None:
+                        return
+                    self._record_download(version)
+                    size = self._local_size()
+                    
+                print(f"[SYNC] Concluído ({size} bytes)")
+                if self.mode == 'RRA':
+                    self.acks.add('RRA', self._state.get('version'))
+                elif self.mode == 'RR':
+                    if not self.stub.confirm_sync(self.mode, self._state.get('version')):
+                        print("[SYNC] Aviso: Confirmação não recebida pelo servidor")
     
         except Exception as e:
+            result = 'error'
             print(f"[ERRO] Falha na sincronização: {str(e)}")
             traceback.print_exc()
+        finally:
+            self.last_result = result
+            SYNC_CYCLES.inc((result,))
+            SYNC_SECONDS.observe(time.perf_counter() - start)
     
     def _monitor_loop(self):
         while self.running:
             self._sync_file()
             time.sleep(self.interval)
     
+    def _long_poll_loop(self):
+        self._sync_file()
+        while self.running:
+            remote_version = self.stub.wait_for_version(self._get_local_hash(), self.LONG_POLL_TIMEOUT)
+            if remote_version is None:
+                # Servidor indisponível: aguarda o intervalo antes de tentar de novo
+                time.sleep(self.interval)
+                continue
+            self._sync_file(remote_version)
+    
     def start(self):
         if not self.running:
             self.running = True
-            self.thread = threading.Thread(target=self._monitor_loop)
+            target = self._long_poll_loop if self.long_poll else self._monitor_loop
+            self.thread = threading.Thread(target=target)
             self.thread.daemon = True
             self.thread.start()
-            print(f"Monitor iniciado. Verificando a cada {self.interval} segundos...")
+            if self.acks:
+                self.acks.start()
+            if self.long_poll:
+                print("Monitor iniciado. Aguardando notificações de nova versão...")
+            else:
+                print(f"Monitor iniciado. Verificando a cada {self.interval} segundos...")
     
     def stop(self):
         self.running = False
         if self.thread:
-            self.thread.join()
\ No newline at end of file
+            self.thread.join()
+        if self.acks:
+            self.acks.stop()
+
+
+class AsyncSyncMonitor(SyncMonitor):
+    """Monitor que usa um stub asyncio (AsyncFileSyncStub) num loop próprio"""
+    _loop = None
+
+    def _send_acks(self, confirmations):
+        # Thread da fila de confirmações: a chamada roda no loop do monitor, que é dono do stub
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return False
+        return asyncio.run_coroutine_threadsafe(self.stub.confirm_syncs(confirmations), loop).result(60)
+
+    async def _sync_file_async(self, remote_version=None):
+        start = time.perf_counter()
+        result = 'ok'
+        try:
+            local_version = self._get_local_hash()
+            data = None
+            if remote_version is None:
+                if self._local_size() < self.DELTA_MIN_SIZE:
+                    remote_version, content = await self.stub.get_file_content_if_changed(local_version)
+                    data = content.encode('utf-8') if content is not None else None
+                if remote_version is None:
+                    remote_version = await self.stub.check_master_version()
+            if remote_version is None:
+                print("Erro: Não foi possível obter a versão do servidor")
+                return
+            if data is None and algorithm_of(remote_version) not in (None, algorithm_of(local_version)):
+                local_version = self._get_local_hash(algorithm_of(remote_version))
+            
+            if remote_version == local_version:
+                return
+            
+            print(f"[SYNC] Alteração detectada (Remota: {short(remote_version)} != Local: {short(local_version)})")
+            version = remote_version if data is not None else None
+            if data is None and local_version:
+                local_data = self._read_slave()
+                if local_data:
+                    data, version = self._apply_version_diff(local_data, await self.stub.get_version_diff(local_version))
+            request = self._delta_request() if data is None else None
+            if request is not None:
+                local_data, signatures, block_size = request
+                response = await self.stub.get_file_delta(signatures, block_size)
+                data, version = self._apply_delta_response(local_data, response, block_size)
+            if data is None:
+                version, content = await self.stub.get_file_content_if_changed(None)
+                data = content.encode('utf-8') if content is not None else None
+                
+            if data is not None:
+                self._write_slave(data, version)
+                print(f"[SYNC] Concluído ({len(data)} bytes)")
+                if self.mode == 'RRA':
+                    self.acks.add('RRA', self._state.get('version'))
+                elif self.mode == 'RR':
+                    if not await self.stub.confirm_sync(self.mode, self._state.get('version')):
+                        print("[SYNC] Aviso: Confirmação não recebida pelo servidor")
+    
+        except Exception as e:
+            result = 'error'
+            print(f"[ERRO] Falha na sincronização: {str(e)}")
+            traceback.print_exc()
+        finally:
+            self.last_result = result
+            SYNC_CYCLES.inc((result,))
+            SYNC_SECONDS.observe(time.perf_counter() - start)
+    
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        try:
+            await self._sync_file_async()
+            while self.running:
+                if self.long_poll:
+                    remote_version = await self.stub.wait_for_version(self._get_local_hash(), self.LONG_POLL_TIMEOUT)
+                    if remote_version is None:
+                        await asyncio.sleep(self.interval)
+                        continue
+                    await self._sync_file_async(remote_version)
+                else:
+                    await asyncio.sleep(self.interval)
+                    await self._sync_file_async()
+        finally:
+            if self.acks:
+                # Último envio enquanto o loop ainda atende o stub
+                await self._loop.run_in_executor(None, self.acks.stop)
+            await self.stub.close()
+    
+    def _monitor_loop(self):
+        asyncio.run(self._run())
+    
+    def _long_poll_loop(self):
+        asyncio.run(self._run())
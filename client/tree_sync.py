@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+class TreeSync:
+    """
+    Espelha a árvore de diretórios do servidor em local_root
+    A cada ciclo pede só o diff do manifesto desde a última versão aplicada
+    e baixa os arquivos alterados em paralelo. Com prefix, espelha só o
+    subdiretório indicado, com local_root correspondendo a ele
+    """
+    STATE_FILE = '.tree_state.json'
+
+    def __init__(self, stub, local_root='client/tree', interval=5, workers=4, prefix=''):
+        self.stub = stub
+        self.local_root = Path(local_root)
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.interval = interval
+        self.workers = workers
+        self.running = False
+        self.thread = None
+        self.local_root.mkdir(parents=True, exist_ok=True)
+        self.state_path = self.local_root / self.STATE_FILE
+        self.version = None
+        self.entries = {}
+        # Resultado do último ciclo ('ok' ou 'error'), como no SyncMonitor
+        self.last_result = None
+        self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.version = state.get('version')
+            self.entries = state.get('entries', {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.version, self.entries = None, {}
+
+    def _save_state(self):
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'entries': self.entries}, f)
+        os.replace(temp_path, self.state_path)
+
+    def _local_path(self, rel_path: str) -> Path:
+        root = self.local_root.resolve()
+        target = (root / rel_path[len(self.prefix):]).resolve()
+        if root not in target.parents or target == self.state_path.resolve():
+            raise PermissionError(f"Caminho inválido no manifesto: {rel_path}")
+        return target
+
+    def _fetch(self, rel_path: str):
+        target = self._local_path(rel_path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        return rel_path, self.stub.download_file(target, path=rel_path)
+
+    def sync_once(self) -> int:
+        """
+        Aplica as mudanças do servidor; retorna o número de arquivos alterados
+        last_result fica 'error' se o manifesto não veio ou algum arquivo falhou
+        """
+        self.last_result = 'error'
+        manifest = self.stub.get_tree_manifest(self.version)
+        if manifest is None:
+            print("[TREE] Erro: Não foi possível obter o manifesto do servidor")
+            return 0
+
+        entries = manifest.get('entries', {})
+        if self.prefix:
+            entries = {path: entry for path, entry in entries.items() if path.startswith(self.prefix)}
+        if manifest.get('full'):
+            removed = [path for path in self.entries if path not in entries]
+        else:
+            removed = [path for path, entry in entries.items() if entry is None]
+        changed = [path for path, entry in entries.items()
+                   if entry is not None and self.entries.get(path) != entry[2]]
+
+        failures = 0
+        if changed:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for rel_path, version in executor.map(self._fetch, changed):
+                    if version is None:
+                        failures += 1
+                    else:
+                        self.entries[rel_path] = version
+
+        for rel_path in removed:
+            try:
+                self._local_path(rel_path).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[TREE] Aviso: não foi possível remover {rel_path}: {str(e)}")
+                failures += 1
+                continue
+            self.entries.pop(rel_path, None)
+
+        # Com falhas, a versão não avança e o próximo diff repete os arquivos pendentes
+        if not failures:
+            self.version = manifest.get('version')
+            self.last_result = 'ok'
+        self._save_state()
+        if changed or removed:
+            print(f"[TREE] {len(changed)} arquivos atualizados, {len(removed)} removidos (versão {self.version})")
+        return len(changed) + len(removed)
+
+    def _monitor_loop(self):
+        while self.running:
+            try:
+                self.sync_once()
+            except Exception as e:
+                print(f"[ERRO] Falha na sincronização da árvore: {str(e)}")
+                traceback.print_exc()
+            time.sleep(self.interval)
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._monitor_loop)
+            self.thread.daemon = True
+            self.thread.start()
+            print(f"Sincronização da árvore iniciada em {self.local_root}")
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
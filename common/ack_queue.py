@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import random
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from common.metrics import REGISTRY
+
+ACKS = REGISTRY.counter('sync_acks_total', 'Confirmações RRA por resultado', ('result',))
+
+
+def pending_acks_path(server_url: str, slave_path) -> Path:
+    """
+    Arquivo da fila persistida de um par (servidor, slave), ao lado do slave
+    O nome inclui um hash dos dois, então filas de servidores ou slaves
+    diferentes no mesmo diretório não se sobrescrevem
+    """
+    slave_path = Path(slave_path).resolve()
+    key = hashlib.sha1(f"{server_url}\0{slave_path}".encode('utf-8')).hexdigest()[:12]
+    return slave_path.with_name(f".pending_acks-{key}.json")
+
+
+class AckQueue:
+    """
+    Fila de confirmações assíncronas (protocolo RRA) com uma única thread de envio
+
+    Confirmações da mesma versão são agrupadas numa entrada com contagem, e as
+    pendentes seguem juntas numa só requisição (send recebe a lista e retorna
+    True se o servidor registrou). Falhas mantêm as entradas na fila e o
+    próximo envio espera o dobro do anterior, até MAX_BACKOFF. Com path, a
+    fila é salva a cada mudança e recarregada ao iniciar, então confirmações
+    não enviadas sobrevivem a um reinício do cliente.
+    """
+    # Janela para juntar confirmações antes de enviar
+    FLUSH_DELAY = 2
+    MAX_BACKOFF = 60
+    MAX_BATCH = 100
+    # Versões distintas guardadas; acima disso as mais antigas são descartadas
+    MAX_PENDING = 1000
+
+    def __init__(self, send: Callable[[List[dict]], bool], path=None):
+        self._send = send
+        self.path = Path(path) if path else None
+        # (protocolo, versão) -> entrada; a ordem de inserção é a ordem de envio
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._load()
+
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for entry in entries:
+            self._pending[(entry['protocol'], entry.get('version'))] = entry
+        if self._pending:
+            self._wake.set()
+
+    def _save(self):
+        """Chamado com o lock: grava a fila inteira de forma atômica"""
+        if self.path is None:
+            return
+        try:
+            if not self._pending:
+                if self.path.exists():
+                    self.path.unlink()
+                return
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(list(self._pending.values()), f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"[WARN] Não foi possível salvar confirmações pendentes: {str(e)}")
+
+    def add(self, protocol: str, version: Optional[str] = None):
+        now = datetime.now().isoformat()
+        with self._lock:
+            entry = self._pending.get((protocol, version))
+            if entry is not None:
+                entry['count'] += 1
+                entry['last_at'] = now
+            else:
+                if len(self._pending) >= self.MAX_PENDING:
+                    dropped = self._pending.pop(next(iter(self._pending)))
+                    ACKS.inc(('dropped',), dropped['count'])
+                self._pending[(protocol, version)] = {
+                    'protocol': protocol,
+                    'version': version,
+                    'count': 1,
+                    'first_at': now,
+                    'last_at': now
+                }
+            self._save()
+        self._wake.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(entry['count'] for entry in self._pending.values())
+
+    def flush(self) -> bool:
+        """Envia até MAX_BATCH entradas numa requisição; retorna False se falhou"""
+        with self._lock:
+            batch = [dict(entry) for entry in list(self._pending.values())[:self.MAX_BATCH]]
+        if not batch:
+            return True
+        try:
+            sent = self._send(batch)
+        except Exception as e:
+            print(f"[WARN] Falha ao enviar confirmações: {str(e)}")
+            sent = False
+        if not sent:
+            ACKS.inc(('failed',), sum(entry['count'] for entry in batch))
+            return False
+
+        with self._lock:
+            for confirmed in batch:
+                key = (confirmed['protocol'], confirmed['version'])
+                entry = self._pending.get(key)
+                if entry is None:
+                    continue
+                # Confirmações que chegaram durante o envio continuam na fila
+                entry['count'] -= confirmed['count']
+                if entry['count'] <= 0:
+                    del self._pending[key]
+            self._save()
+            remaining = bool(self._pending)
+        ACKS.inc(('sent',), sum(entry['count'] for entry in batch))
+        if remaining:
+            self._wake.set()
+        return True
+
+    def _run(self):
+        delay = self.FLUSH_DELAY
+        while not self._stop.is_set():
+            self._wake.wait()
+            # Espera a janela de agrupamento (ou o backoff); stop() interrompe a espera
+            if self._stop.wait(delay):
+                break
+            self._wake.clear()
+            if self.flush():
+                delay = self.FLUSH_DELAY
+            else:
+                self._wake.set()
+                delay = min(self.MAX_BACKOFF, delay * 2 * random.uniform(0.8, 1.2))
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='ack-queue', daemon=True)
+            self._thread.start()
+
+    def stop(self, flush: bool = True):
+        """Encerra a thread; com flush, tenta uma última vez enviar as pendentes"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        if flush:
+            self.flush()
@@ -1,20 +1,133 @@
 import json
 import hashlib
+import hmac
+import os
+import threading
+import time
 from pathlib import Path
+from typing import NamedTuple, Optional
+
+USERS_FILE = Path(__file__).parent.parent / "server" / "users.json"
+
+# Chave das sessões; processos que compartilham sessões precisam da mesma chave
+SESSION_SECRET = os.environ.get('RMI_SESSION_SECRET', '').encode() or os.urandom(32)
+SESSION_PREFIX = 's1'
+SESSION_TTL = 3600
+# Intervalo mínimo entre verificações de alteração em users.json
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+class User(NamedTuple):
+    username: str
+    admin: bool
+
 
 def create_auth_token(username: str, password: str) -> str:
     return hashlib.sha256(f"{username}:{password}".encode()).hexdigest()
 
-def authenticate(auth_token: str) -> bool:
-    if not auth_token:
-        return False
-    users_file = Path(__file__).parent.parent / "server" / "users.json"
+
+class CredentialStore:
+    """
+    Índice token -> usuário carregado de users.json
+    O arquivo só é relido quando (inode, tamanho, mtime_ns) muda
+
+    Formatos aceitos em users.json:
+        {"usuario": "senha"}  (admin apenas para o usuário "admin")
+        {"usuario": {"password": "senha", "admin": true}}
+    """
+
+    def __init__(self, users_file: Path):
+        self.users_file = users_file
+        self._lock = threading.Lock()
+        self._key = None
+        self._checked_at = 0.0
+        self._index = {}
+        self._users = {}
+
+    def _stat_key(self):
+        try:
+            st = os.stat(self.users_file)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _load(self, key):
+        index, users = {}, {}
+        if key is not None:
+            try:
+                with open(self.users_file, 'r') as f:
+                    entries = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                # Mantém o índice anterior se o arquivo estiver sendo reescrito
+                return
+            for username, entry in entries.items():
+                if isinstance(entry, dict):
+                    password = entry.get('password', '')
+                    admin = bool(entry.get('admin', entry.get('role') == 'admin'))
+                else:
+                    password, admin = entry, username == 'admin'
+                user = User(username, admin)
+                index[create_auth_token(username, password)] = user
+                users[username] = user
+        self._index, self._users, self._key = index, users, key
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        key = self._stat_key()
+        if key != self._key:
+            with self._lock:
+                if key != self._key:
+                    self._load(key)
+
+    def lookup(self, auth_token: str) -> Optional[User]:
+        self._refresh()
+        return self._index.get(auth_token)
+
+    def get_user(self, username: str) -> Optional[User]:
+        self._refresh()
+        return self._users.get(username)
+
+
+_store = CredentialStore(USERS_FILE)
+
+
+def create_session_token(user: User, ttl: int = SESSION_TTL) -> str:
+    """Token de sessão assinado (HMAC): usuário e validade viajam no próprio token"""
+    expires = int(time.time()) + ttl
+    payload = f"{SESSION_PREFIX}.{user.username}.{expires}"
+    signature = hmac.new(SESSION_SECRET, payload.encode(), hashlib.sha256).hexdigest()
+    return f"{payload}.{signature}"
+
+
+def _verify_session(auth_token: str) -> Optional[User]:
     try:
-        with open(users_file, 'r') as f:
-            users = json.load(f)
-        for username, password in users.items():
-            if create_auth_token(username, password) == auth_token:
-                return True
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
-    return False
\ No newline at end of file
+        payload, signature = auth_token.rsplit('.', 1)
+        username, expires = payload.split('.', 1)[1].rsplit('.', 1)
+        expired = int(expires) < time.time()
+    except ValueError:
+        return None
+    expected = hmac.new(SESSION_SECRET, payload.encode(), hashlib.sha256).hexdigest()
+    # Bytes: compare_digest recusa str com caracteres fora do ASCII (TypeError)
+    if expired or not hmac.compare_digest(signature.encode(), expected.encode()):
+        return None
+    # Usuário removido de users.json perde as sessões abertas
+    return _store.get_user(username)
+
+
+def resolve_token(auth_token: str) -> Optional[User]:
+    """Retorna o usuário do token (estático ou de sessão) ou None"""
+    if not auth_token or not isinstance(auth_token, str):
+        return None
+    if auth_token.startswith(SESSION_PREFIX + '.'):
+        return _verify_session(auth_token)
+    return _store.lookup(auth_token)
+
+
+def authenticate(auth_token: str, admin: bool = False) -> bool:
+    user = resolve_token(auth_token)
+    if user is None:
+        return False
+    return user.admin or not admin
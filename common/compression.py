@@ -0,0 +1,88 @@
+import gzip
+import zlib
+from typing import Callable, Dict, NamedTuple, Optional
+
+# Respostas menores que isto não compensam o custo de comprimir
+MIN_COMPRESS_SIZE = 1024
+
+
+class Codec(NamedTuple):
+    name: str
+    compress: Callable[[bytes, int], bytes]
+    # Fábrica de descompressores incrementais (decompress(bloco[, max_length]) / flush()
+    # e unconsumed_tail, como zlib.decompressobj)
+    decompressor: Callable[[], object]
+    level: int
+
+
+# Ordem de registro define a ordem anunciada pelo cliente
+CODECS: Dict[str, Codec] = {}
+
+
+def register_codec(name: str, compress, decompressor, level: int):
+    """Registra um codec; permite plugar algoritmos fora da biblioteca padrão"""
+    CODECS[name] = Codec(name, compress, decompressor, level)
+
+
+register_codec(
+    'gzip',
+    lambda data, level: gzip.compress(data, level, mtime=0),
+    lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    6
+)
+register_codec(
+    'deflate',
+    lambda data, level: zlib.compress(data, level),
+    zlib.decompressobj,
+    6
+)
+
+
+def compress(name: str, data: bytes, level: Optional[int] = None) -> bytes:
+    codec = CODECS[name]
+    return codec.compress(data, codec.level if level is None else level)
+
+
+class DecompressionLimitExceeded(ValueError):
+    """O conteúdo descomprimido passaria do limite pedido"""
+
+
+def decompress(name: str, data: bytes, max_length: int = 0) -> bytes:
+    """Descomprime data; com max_length, nunca produz mais que isso (levanta DecompressionLimitExceeded)"""
+    decompressor = CODECS[name].decompressor()
+    if not max_length:
+        return decompressor.decompress(data) + decompressor.flush()
+    # Um byte além do limite mostra que ainda havia saída pendente
+    output = decompressor.decompress(data, max_length + 1)
+    if len(output) > max_length or decompressor.unconsumed_tail:
+        raise DecompressionLimitExceeded(f"Conteúdo descomprimido maior que {max_length} bytes")
+    return output + decompressor.flush()
+
+
+def accept_header(preferred: Optional[str] = None) -> str:
+    """Valor de Accept-Encoding anunciado pelo cliente"""
+    names = list(CODECS)
+    if preferred in CODECS:
+        names.remove(preferred)
+        names.insert(0, preferred)
+    return ', '.join(names)
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Escolhe o primeiro codec suportado do Accept-Encoding do cliente (ignorando q=0)"""
+    if not accept_encoding:
+        return None
+    for token in accept_encoding.split(','):
+        name, _, params = token.strip().partition(';')
+        name = name.strip().lower()
+        if name not in CODECS:
+            continue
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        return name
+    return None
@@ -0,0 +1,124 @@
+import base64
+import hashlib
+import math
+import zlib
+from itertools import islice
+from typing import Dict, List, Optional, Sequence, Union
+
+# Sincronização por blocos no estilo rsync:
+# o cliente envia as assinaturas (checksum fraco + hash forte) dos blocos
+# do seu arquivo e o servidor responde apenas com trechos literais e
+# referências aos blocos que o cliente já possui.
+#
+# O checksum fraco é o Adler-32 do bloco (zlib.adler32, em C): blocos novos
+# da varredura custam uma chamada, e só o deslizamento byte a byte nas
+# regiões sem correspondência roda em Python.
+
+MOD_ADLER = 65521
+MIN_BLOCK_SIZE = 2048
+MAX_BLOCK_SIZE = 128 * 1024
+# Bytes percorridos um a um sem correspondência que o servidor aceita por delta
+# (cerca de 0,4 s); edições isoladas custam no máximo um bloco cada
+MAX_SCAN = 1024 * 1024
+
+DeltaOp = Union[int, str]
+
+
+def choose_block_size(length: int) -> int:
+    """Escolhe o tamanho de bloco proporcional a sqrt(tamanho), como o rsync"""
+    size = int(math.sqrt(length)) // 1024 * 1024
+    return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, size))
+
+
+def weak_checksum(block: bytes) -> int:
+    return zlib.adler32(block)
+
+
+def strong_checksum(block: bytes) -> str:
+    return hashlib.md5(block).hexdigest()
+
+
+def block_signatures(data: bytes, block_size: int) -> List[List]:
+    """Gera a lista [fraco, forte] para cada bloco completo de data"""
+    signatures = []
+    for offset in range(0, len(data) - block_size + 1, block_size):
+        block = data[offset:offset + block_size]
+        signatures.append([weak_checksum(block), strong_checksum(block)])
+    return signatures
+
+
+def compute_delta(data: bytes, signatures: Sequence[Sequence], block_size: int,
+                  max_scan: Optional[int] = None) -> List[DeltaOp]:
+    """
+    Calcula o delta de data em relação aos blocos descritos por signatures
+    Retorna uma lista de operações: int para referência a bloco do cliente,
+    str (base64) para trecho literal. max_scan limita os bytes percorridos
+    byte a byte sem correspondência; esgotado o limite, o restante vai como literal.
+    """
+    index: Dict[int, Dict[str, int]] = {}
+    for number, (weak, strong) in enumerate(signatures):
+        index.setdefault(weak, {}).setdefault(strong, number)
+
+    ops: List[DeltaOp] = []
+    length = len(data)
+    if not index or length < block_size:
+        if data:
+            ops.append(base64.b64encode(data).decode('ascii'))
+        return ops
+
+    budget = length if max_scan is None else max_scan
+    last = length - block_size
+    literal_start = 0
+    pos = 0
+    while pos <= last:
+        # Janela nova: checksum em C
+        checksum = zlib.adler32(data[pos:pos + block_size])
+        if checksum not in index:
+            # Desliza a janela byte a byte (Adler-32: a e b módulo 65521) até achar um candidato
+            a = checksum & 0xffff
+            b = checksum >> 16
+            stop = min(last, pos + budget)
+            start = pos
+            checksum = None
+            for out_byte, in_byte in zip(islice(data, pos, stop), islice(data, pos + block_size, None)):
+                a = (a - out_byte + in_byte) % MOD_ADLER
+                b = (b - block_size * out_byte + a - 1) % MOD_ADLER
+                pos += 1
+                if (b << 16) | a in index:
+                    checksum = (b << 16) | a
+                    break
+            budget -= pos - start
+            if checksum is None:
+                # Fim dos dados ou do limite de varredura: o restante vai como literal
+                break
+        number = index[checksum].get(strong_checksum(data[pos:pos + block_size]))
+        if number is None:
+            # Colisão do checksum fraco: segue deslizando a partir do próximo byte
+            if budget <= 0:
+                break
+            pos += 1
+            budget -= 1
+            continue
+        if literal_start < pos:
+            ops.append(base64.b64encode(data[literal_start:pos]).decode('ascii'))
+        ops.append(number)
+        pos += block_size
+        literal_start = pos
+
+    if literal_start < length:
+        ops.append(base64.b64encode(data[literal_start:]).decode('ascii'))
+    return ops
+
+
+def apply_delta(base: bytes, ops: Sequence[DeltaOp], block_size: int) -> bytes:
+    """Reconstrói o arquivo a partir da cópia local e das operações do delta"""
+    parts = []
+    for op in ops:
+        if isinstance(op, int):
+            start = op * block_size
+            if start + block_size > len(base):
+                raise ValueError(f"Referência de bloco inválida: {op}")
+            parts.append(base[start:start + block_size])
+        else:
+            parts.append(base64.b64decode(op))
+    return b''.join(parts)
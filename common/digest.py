@@ -0,0 +1,198 @@
+"""
+Digests usados como versão de arquivos
+
+A versão identifica o algoritmo: "blake2b:<hex>" (MD5 legado continua sem
+prefixo). Assim o cliente descobre pelo próprio texto da versão qual hash
+calcular localmente para comparar com o servidor.
+
+Algoritmos "tree-<base>" dividem o conteúdo em blocos de TREE_CHUNK_SIZE,
+hasheados em paralelo, e a versão é o hash da concatenação dos hashes dos
+blocos (árvore de Merkle de dois níveis). Quando o conteúdo anterior está
+disponível, só os blocos alterados são rehasheados.
+"""
+import hashlib
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, List, Optional, Sequence, Tuple
+
+try:
+    import xxhash
+except ImportError:  # Dependência opcional
+    xxhash = None
+
+# Versão de arquivos vazios, independente do algoritmo
+EMPTY_VERSION = "empty_file"
+DEFAULT_ALGORITHM = 'blake2b'
+CHUNK_SIZE = 1024 * 1024
+TREE_CHUNK_SIZE = 1024 * 1024
+TREE_PREFIX = 'tree-'
+
+ALGORITHMS = {
+    'md5': hashlib.md5,
+    # 128 bits bastam para detectar mudanças e mantêm a versão curta
+    'blake2b': lambda: hashlib.blake2b(digest_size=16),
+    'sha256': hashlib.sha256
+}
+if xxhash is not None:
+    ALGORITHMS['xxh3_128'] = xxhash.xxh3_128
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    # hashlib libera o GIL em blocos grandes, então threads hasheiam em paralelo
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='digest')
+        return _executor
+
+
+class TreeHash:
+    """Hash em árvore com a interface de hashlib (update/digest/hexdigest)"""
+
+    def __init__(self, algorithm: str, chunk_size: int = TREE_CHUNK_SIZE):
+        self.algorithm = algorithm
+        self.chunk_size = chunk_size
+        self._buffer = bytearray()
+        # Folhas prontas (bytes) ou em cálculo (Future), na ordem dos blocos
+        self._pending = deque()
+        self._leaves = []
+        # Limita os blocos em memória aguardando hash
+        self._max_pending = 2 * (os.cpu_count() or 1)
+
+    def _leaf(self, chunk) -> bytes:
+        hasher = ALGORITHMS[self.algorithm]()
+        hasher.update(chunk)
+        return hasher.digest()
+
+    def _drain(self, keep: int):
+        while len(self._pending) > keep:
+            leaf = self._pending.popleft()
+            self._leaves.append(leaf.result() if isinstance(leaf, Future) else leaf)
+
+    def _submit(self, chunk):
+        self._pending.append(_pool().submit(self._leaf, chunk))
+        self._drain(self._max_pending)
+
+    def _reuse(self, leaf: bytes):
+        self._pending.append(leaf)
+        self._drain(self._max_pending)
+
+    def update(self, data):
+        # bytes são imutáveis: os blocos podem ser fatias sem cópia
+        view = memoryview(data if isinstance(data, bytes) else bytes(data))
+        if self._buffer:
+            take = self.chunk_size - len(self._buffer)
+            self._buffer += view[:take]
+            view = view[take:]
+            if len(self._buffer) < self.chunk_size:
+                return
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        while len(view) >= self.chunk_size:
+            self._submit(view[:self.chunk_size])
+            view = view[self.chunk_size:]
+        self._buffer += view
+
+    def leaves(self) -> List[bytes]:
+        if self._buffer:
+            self._pending.append(self._leaf(bytes(self._buffer)))
+            self._buffer = bytearray()
+        self._drain(0)
+        return self._leaves
+
+    def digest(self) -> bytes:
+        root = ALGORITHMS[self.algorithm]()
+        for leaf in self.leaves():
+            root.update(leaf)
+        return root.digest()
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+
+def is_tree(algorithm: Optional[str]) -> bool:
+    return bool(algorithm) and algorithm.startswith(TREE_PREFIX)
+
+
+def available_algorithms() -> List[str]:
+    return sorted(ALGORITHMS) + sorted(TREE_PREFIX + name for name in ALGORITHMS)
+
+
+def new_hasher(algorithm: str):
+    if is_tree(algorithm) and algorithm[len(TREE_PREFIX):] in ALGORITHMS:
+        return TreeHash(algorithm[len(TREE_PREFIX):])
+    try:
+        return ALGORITHMS[algorithm]()
+    except KeyError:
+        raise ValueError(f"Algoritmo de hash não suportado: {algorithm}") from None
+
+
+def format_version(algorithm: str, hexdigest: str) -> str:
+    return hexdigest if algorithm == 'md5' else f"{algorithm}:{hexdigest}"
+
+
+def short(version: Optional[str], length: int = 8) -> str:
+    """Forma curta da versão para logs, sem o prefixo do algoritmo"""
+    return version.rpartition(':')[2][:length] if version else 'None'
+
+
+def algorithm_of(version: Optional[str]) -> Optional[str]:
+    """Algoritmo que gerou a versão; None para versões sem hash (ex.: arquivo vazio)"""
+    if not version or version == EMPTY_VERSION:
+        return None
+    algorithm, sep, _ = version.partition(':')
+    return algorithm if sep else 'md5'
+
+
+def hash_bytes(data: bytes, algorithm: str = DEFAULT_ALGORITHM) -> str:
+    if not data:
+        return EMPTY_VERSION
+    hasher = new_hasher(algorithm)
+    hasher.update(data)
+    return format_version(algorithm, hasher.hexdigest())
+
+
+def tree_hash(data: bytes, algorithm: str,
+              previous: Optional[Tuple[bytes, Sequence[bytes]]] = None) -> Tuple[str, List[bytes]]:
+    """
+    Versão e folhas de um conteúdo em memória no modo árvore
+    previous=(conteúdo anterior, folhas anteriores): blocos com os mesmos bytes
+    reaproveitam a folha antiga em vez de serem rehasheados
+    """
+    if not data:
+        return EMPTY_VERSION, []
+    hasher = new_hasher(algorithm)
+    old_data, old_leaves = previous if previous else (b'', ())
+    view = memoryview(data)
+    size = hasher.chunk_size
+    for index, start in enumerate(range(0, len(data), size)):
+        chunk = view[start:start + size]
+        if len(chunk) < size:
+            # Último bloco, parcial
+            hasher.update(chunk.tobytes())
+        elif index < len(old_leaves) and old_data[start:start + size] == data[start:start + size]:
+            # Comparar bytes (memcmp) é bem mais barato que rehashear o bloco
+            hasher._reuse(old_leaves[index])
+        else:
+            hasher._submit(chunk)
+    return format_version(algorithm, hasher.hexdigest()), hasher.leaves()
+
+
+def hash_stream(f: BinaryIO, algorithm: str = DEFAULT_ALGORITHM, chunk_size: int = CHUNK_SIZE) -> str:
+    """Hash em blocos, com memória constante"""
+    hasher = new_hasher(algorithm)
+    size = 0
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        hasher.update(chunk)
+        size += len(chunk)
+    return format_version(algorithm, hasher.hexdigest()) if size else EMPTY_VERSION
+
+
+def hash_file(path, algorithm: str = DEFAULT_ALGORITHM, chunk_size: int = CHUNK_SIZE) -> str:
+    with open(path, 'rb') as f:
+        return hash_stream(f, algorithm, chunk_size)
@@ -0,0 +1,63 @@
+"""
+Protocolo binário do RMI: alternativa ao JSON sobre HTTP numa conexão TCP persistente
+
+Cada frame é um cabeçalho de tamanho fixo (HEADER), seguido dos metadados
+da chamada em JSON (método, token, parâmetros pequenos) e de um payload em
+bytes brutos. Conteúdos de arquivo viajam no payload, sem o escape e a
+inflação de uma string JSON; o campo PAYLOAD_FIELD dos metadados indica a
+qual parâmetro (ou campo da resposta) o payload corresponde.
+"""
+import json
+import struct
+from typing import List, Tuple
+
+MAGIC = b'RB'
+PROTOCOL_VERSION = 1
+REQUEST = 1
+RESPONSE = 2
+# magic, versão, tipo, status (HTTP), id da requisição, tamanho dos metadados, tamanho do payload
+HEADER = struct.Struct('!2sBBHIIQ')
+# Nome do campo que o payload preenche; ausente = payload é o arquivo em bytes (download)
+PAYLOAD_FIELD = '_payload'
+MAX_META_SIZE = 16 * 1024 * 1024
+MAX_PAYLOAD_SIZE = 512 * 1024 * 1024
+
+
+def encode_frame(kind: int, request_id: int, meta: dict, payload=b'', status: int = 0,
+                 payload_size: int = None) -> List[bytes]:
+    """
+    Partes do frame, para envio com writelines/sendmsg sem concatenar o payload
+    payload_size: tamanho de um payload enviado à parte (ex.: com sendfile)
+    """
+    meta_bytes = json.dumps(meta).encode('utf-8')
+    size = len(payload) if payload_size is None else payload_size
+    head = HEADER.pack(MAGIC, PROTOCOL_VERSION, kind, status, request_id, len(meta_bytes), size)
+    return [head, meta_bytes, payload] if payload else [head, meta_bytes]
+
+
+def decode_header(data) -> Tuple[int, int, int, int, int]:
+    """Retorna (tipo, status, id, tamanho dos metadados, tamanho do payload)"""
+    magic, version, kind, status, request_id, meta_len, payload_len = HEADER.unpack(data)
+    if magic != MAGIC or version != PROTOCOL_VERSION:
+        raise ValueError("Frame inválido ou versão de protocolo não suportada")
+    if meta_len > MAX_META_SIZE or payload_len > MAX_PAYLOAD_SIZE:
+        raise ValueError("Frame muito grande")
+    return kind, status, request_id, meta_len, payload_len
+
+
+def split_payload(data: dict, field: str) -> Tuple[dict, bytes]:
+    """Move data[field] (str ou bytes) para o payload"""
+    value = data.get(field)
+    if not isinstance(value, (str, bytes)):
+        return data, b''
+    meta = {key: item for key, item in data.items() if key != field}
+    meta[PAYLOAD_FIELD] = field
+    return meta, value.encode('utf-8') if isinstance(value, str) else value
+
+
+def merge_payload(meta: dict, payload) -> dict:
+    """Inverso de split_payload: devolve o payload, como texto, ao seu campo"""
+    field = meta.pop(PAYLOAD_FIELD, None)
+    if field is not None:
+        meta[field] = str(payload, 'utf-8')
+    return meta
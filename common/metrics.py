@@ -0,0 +1,186 @@
+"""
+Registro de métricas em processo (contadores, histogramas e gauges)
+
+Cada métrica tem um lock próprio e valores indexados pela tupla de rótulos,
+então registrar um valor custa uma busca em dicionário e, nos histogramas,
+uma busca binária nos limites dos buckets. REGISTRY é o registro global do
+processo; snapshot() alimenta o método remoto get_metrics e prometheus()
+gera o formato texto do Prometheus.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+# Segundos; cobre desde chamadas em memória até long-polls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {','.join(map(str, key)) or 'total': value for key, value in self._values.items()}
+
+    def prometheus(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+
+class Gauge(Counter):
+    """Valor instantâneo; com function, é lido na hora da coleta"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_text, labels)
+        self.function = function
+
+    def set(self, value: float, labels: Tuple = ()):
+        with self._lock:
+            self._values[labels] = value
+
+    def _collect(self):
+        if self.function is not None:
+            try:
+                self.set(self.function())
+            except Exception:
+                pass
+
+    def snapshot(self) -> dict:
+        self._collect()
+        return super().snapshot()
+
+    def prometheus(self):
+        self._collect()
+        return super().prometheus()
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # rótulos -> [contagem por bucket (+Inf no fim), soma, total]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Tuple = ()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, labels: Tuple = ()):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, labels)
+
+    def _quantile(self, counts, total, q) -> Optional[float]:
+        # Limite superior do bucket que contém o quantil (estimativa conservadora)
+        target, seen = q * total, 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            items = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()]
+        return {
+            ','.join(map(str, key)) or 'total': {
+                'count': total,
+                'sum': round(value_sum, 6),
+                'p50': self._quantile(counts, total, 0.5),
+                'p99': self._quantile(counts, total, 0.99)
+            }
+            for key, counts, value_sum, total in items
+        }
+
+    def prometheus(self):
+        with self._lock:
+            items = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()]
+        for key, counts, value_sum, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, [le])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {value_sum}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {total}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Métrica {name} já registrada com outro tipo")
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labels, function)
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labels, buckets)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def prometheus(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.prometheus())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
@@ -3,6 +3,10 @@ import logging
 from typing import Callable, Optional
 from functools import wraps
 import time
+from common.ack_queue import AckQueue, pending_acks_path
+from common.metrics import REGISTRY
+
+PROTOCOL_SECONDS = REGISTRY.histogram('protocol_sync_seconds', 'Duração das operações por protocolo', ('protocol',))
 
 class SyncProtocol(Enum):
     R = "Simple Request"
@@ -13,21 +17,26 @@ def log_protocol_usage(func: Callable):
     @wraps(func)
     def wrapper(*args, **kwargs):
         protocol = kwargs.get('protocol', SyncProtocol.R)
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         logging.info(f"Iniciando operação com protocolo {protocol.name} - {protocol.value}")
         result = func(*args, **kwargs)
         
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
+        PROTOCOL_SECONDS.observe(duration, (protocol.name,))
         logging.info(f"Operação {protocol.name} concluída em {duration:.2f}s")
         
         return result
     return wrapper
 
 class ProtocolHandler:
+    SLAVE_FILE = 'slave.txt'
+
     def __init__(self, stub):
         self.stub = stub
-        self.pending_acknowledgments = set()
+        # Confirmações RRA pendentes, enviadas em lote por uma única thread;
+        # a fila só é criada (e persistida) no primeiro uso do RRA
+        self.pending_acknowledgments: Optional[AckQueue] = None
     
     @log_protocol_usage
     def sync_file(self, protocol: SyncProtocol = SyncProtocol.R) -> bool:
@@ -47,7 +56,7 @@ class ProtocolHandler:
         if content is None:
             return False
 
-        with open('slave.txt', 'w') as f:
+        with open(self.SLAVE_FILE, 'w') as f:
             f.write(content)
         return True
     
@@ -56,27 +65,31 @@ class ProtocolHandler:
         content = self.stub.get_file_content()
         if content is None:
             return False
-        with open('slave.txt', 'w') as f:
+        with open(self.SLAVE_FILE, 'w') as f:
             f.write(content)
         return self.stub.confirm_sync('RR')
     
     def _request_response_async(self) -> bool:
         """Protocolo RRA: Requisição com confirmação assíncrona"""
-        content = self.stub.get_file_content()
+        version, content = self.stub.get_file_content_if_changed(None)
         if content is None:
             return False
-        with open('slave.txt', 'w') as f:
+        with open(self.SLAVE_FILE, 'w') as f:
             f.write(content)
-        self._schedule_async_acknowledgment()
+        self._schedule_async_acknowledgment(version)
         return True
     
-    def _schedule_async_acknowledgment(self):
-        import threading
-        def send_ack():
-            time.sleep(2)
-            self.stub.confirm_sync('RRA')
-        
-        threading.Thread(target=send_ack).start()
+    def _schedule_async_acknowledgment(self, version=None):
+        if self.pending_acknowledgments is None:
+            self.pending_acknowledgments = AckQueue(lambda confirmations: self.stub.confirm_syncs(confirmations),
+                                                    pending_acks_path(self.stub.server_url, self.SLAVE_FILE))
+        self.pending_acknowledgments.add('RRA', version)
+        self.pending_acknowledgments.start()
     
     def check_pending_acks(self) -> bool:
-        return len(self.pending_acknowledgments) > 0
\ No newline at end of file
+        return self.pending_acknowledgments is not None and self.pending_acknowledgments.pending() > 0
+
+    def close(self):
+        """Encerra a fila de confirmações, tentando enviar as pendentes"""
+        if self.pending_acknowledgments is not None:
+            self.pending_acknowledgments.stop()
\ No newline at end of file
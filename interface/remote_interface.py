@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import List, Optional, Tuple
 from common.protocol import SyncProtocol
 
 class RemoteInterface(ABC):
@@ -9,11 +9,38 @@ class RemoteInterface(ABC):
     """
     
     @abstractmethod
-    def get_file_content(self) -> Optional[str]:
+    def get_file_content(self, if_version_not: Optional[str] = None) -> Optional[str]:
         """
         Obtém o conteúdo atual do arquivo master do servidor
+        Args:
+            if_version_not: Se informado, o conteúdo só é enviado quando a versão for outra
         Retorna:
             str: Conteúdo do arquivo se bem-sucedido
+            None: Se falhar ou se a versão não mudou
+        """
+        pass
+    
+    @abstractmethod
+    def get_file_content_if_changed(self, local_version: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Busca condicional do conteúdo (If-None-Match com a versão local)
+        Args:
+            local_version: Versão (hash) da cópia local
+        Retorna:
+            tuple: (versão remota, conteúdo ou None se a versão não mudou)
+            (None, None): Se falhar
+        """
+        pass
+    
+    @abstractmethod
+    def get_file_delta(self, signatures: List[List], block_size: int) -> Optional[dict]:
+        """
+        Obtém apenas as diferenças do arquivo master em relação à cópia local
+        Args:
+            signatures: Lista [checksum fraco, hash forte] de cada bloco local
+            block_size: Tamanho dos blocos usados nas assinaturas
+        Retorna:
+            dict: {'delta': operações, 'version': versão} se bem-sucedido
             None: Se falhar
         """
         pass
@@ -28,6 +55,99 @@ class RemoteInterface(ABC):
         """
         pass
     
+    @abstractmethod
+    def wait_for_version(self, since: Optional[str], timeout: float = 30) -> Optional[str]:
+        """
+        Aguarda (long-poll) até a versão do master ser diferente de since
+        Args:
+            since: Última versão conhecida pelo cliente
+            timeout: Tempo máximo de espera em segundos
+        Retorna:
+            str: Versão atual (igual a since se o timeout expirou)
+            None: Se falhar
+        """
+        pass
+    
+    @abstractmethod
+    def get_tree_manifest(self, since: Optional[int] = None) -> Optional[dict]:
+        """
+        Obtém o manifesto da árvore sincronizada (caminho -> [tamanho, mtime, hash])
+        Args:
+            since: Última versão de manifesto conhecida; só as mudanças posteriores são enviadas
+        Retorna:
+            dict: {'version', 'full', 'entries'} (entradas None indicam remoção)
+            None: Se falhar
+        """
+        pass
+    
+    @abstractmethod
+    def list_versions(self, limit: Optional[int] = None) -> Optional[List[dict]]:
+        """
+        Lista as versões do master retidas no histórico, da mais recente para a mais antiga
+        Retorna:
+            list: Entradas {'seq', 'version', 'size', 'timestamp', 'author'}
+            None: Se falhar
+        """
+        pass
+    
+    @abstractmethod
+    def get_version_content(self, version: str) -> Optional[str]:
+        """
+        Obtém o conteúdo do master numa versão do histórico
+        Retorna:
+            str: Conteúdo da versão
+            None: Se falhar ou se a versão não estiver retida
+        """
+        pass
+    
+    @abstractmethod
+    def get_version_diff(self, from_version: str, to_version: Optional[str] = None) -> Optional[dict]:
+        """
+        Obtém o delta entre duas versões do histórico, sem enviar assinaturas
+        Args:
+            from_version: Versão da cópia local
+            to_version: Versão de destino (padrão: a atual)
+        Retorna:
+            dict: {'delta', 'block_size', 'version'} se bem-sucedido
+            None: Se falhar ou se from_version não estiver retida
+        """
+        pass
+    
+    @abstractmethod
+    def restore_version(self, version: str) -> bool:
+        """
+        Restaura uma versão do histórico como master atual (operação privilegiada)
+        Retorna:
+            bool: True se o rollback foi aplicado
+        """
+        pass
+    
+    @abstractmethod
+    def get_metrics(self) -> Optional[dict]:
+        """
+        Obtém o resumo das métricas do servidor
+        Retorna:
+            dict: Contadores e histogramas (contagem, soma, p50 e p99) por nome
+            None: Se falhar
+        """
+        pass
+    
+    @abstractmethod
+    def profiling(self, cpu: Optional[bool] = None, memory: Optional[bool] = None,
+                  report: bool = False, **options) -> Optional[dict]:
+        """
+        Liga/desliga o profiling do servidor em execução (operação privilegiada)
+        Args:
+            cpu: True liga o cProfile, False desliga e devolve o relatório
+            memory: True liga o tracemalloc, False desliga e devolve o relatório
+            report: Devolve os relatórios sem alterar o estado
+            options: top, sample_every e frames
+        Retorna:
+            dict: {'profiling': estado, 'cpu_report'?, 'memory_report'?}
+            None: Se falhar
+        """
+        pass
+    
     @abstractmethod
     def synchronize(self, protocol: SyncProtocol = SyncProtocol.R) -> bool:
         """
@@ -40,16 +160,28 @@ class RemoteInterface(ABC):
         pass
     
     @abstractmethod
-    def confirm_sync(self, protocol_type: str) -> bool:
+    def confirm_sync(self, protocol_type: str, version=None) -> bool:
         """
         Confirma a recepção e gravação do arquivo (usado nos protocolos RR e RRA)
         Args:
             protocol_type: Tipo de protocolo ('RR' ou 'RRA')
+            version: Versão gravada no slave (opcional)
         Retorna:
             bool: True se a confirmação foi registrada com sucesso
         """
         pass
     
+    @abstractmethod
+    def confirm_syncs(self, confirmations) -> bool:
+        """
+        Envia várias confirmações numa única chamada (fila de confirmações RRA)
+        Args:
+            confirmations: Lista de {'protocol', 'version', 'count', 'first_at', 'last_at'}
+        Retorna:
+            bool: True se todas foram registradas
+        """
+        pass
+    
     @abstractmethod
     def update_master_file(self, new_content: str, auth_token: str) -> bool:
         """
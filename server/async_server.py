@@ -0,0 +1,299 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from common.auth import authenticate
+from common.compression import negotiate
+from common.metrics import REGISTRY
+from server.dispatcher import PROMETHEUS_CONTENT_TYPE, REQUESTS, REQUEST_SECONDS, RemoteMethods, RequestRejected
+from server.file_handler import FileHandler
+from server.log_pipeline import REQUEST_LOG
+
+REASONS = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    403: 'Forbidden',
+    404: 'Not Found',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable'
+}
+
+
+class AsyncRequestDispatcher(RemoteMethods):
+    """
+    Dispatcher asyncio com a mesma tabela de métodos do RequestDispatcher
+    Métodos bloqueantes rodam no executor padrão; wait_for_version é
+    atendido no próprio loop, sem prender uma thread por cliente. Só a
+    autenticação e a leitura da versão (stat e hash do master) vão ao executor.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    async def dispatch(self, request_data):
+        loop = asyncio.get_running_loop()
+        if request_data.get('method') == 'wait_for_version':
+            # authenticate pode reler users.json: fora do loop
+            if await loop.run_in_executor(None, authenticate, request_data.get('auth_token')):
+                start = time.perf_counter()
+                status_code, response = await self._wait_version(request_data)
+                duration = time.perf_counter() - start
+                REQUESTS.inc(('wait_for_version', status_code))
+                REQUEST_SECONDS.observe(duration, ('wait_for_version',))
+                REQUEST_LOG.record('wait_for_version', status_code, duration)
+                return status_code, response
+        return await loop.run_in_executor(None, self._dispatch, request_data)
+
+    async def _wait_version(self, request_data):
+        since = request_data.get('since')
+        try:
+            timeout = float(request_data.get('timeout', FileHandler.MAX_WAIT_TIMEOUT))
+        except (TypeError, ValueError):
+            return 500, {'status': 'error', 'code': 'INTERNAL_ERROR', 'message': 'Timeout inválido'}
+
+        deadline = time.monotonic() + max(0.0, min(timeout, FileHandler.MAX_WAIT_TIMEOUT))
+        version = await self.server.current_version()
+        while version == since:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self.server.version_event().wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            version = await self.server.current_version()
+
+        if version in ["error", "permission_denied"]:
+            return 500, {
+                'status': 'error',
+                'code': 'INTERNAL_ERROR',
+                'message': f'Erro ao obter versão: {version}'
+            }
+        return 200, {
+            'status': 'success',
+            'version': version,
+            'changed': version != since,
+            'timestamp': datetime.now().isoformat()
+        }
+
+
+class AsyncRMIServer:
+    """Servidor HTTP/1.1 mínimo sobre asyncio, com keep-alive"""
+    ENGINE = 'asyncio'
+    SCHEME = 'http'
+    MAX_BODY_SIZE = RemoteMethods.MAX_BODY_SIZE
+    KEEP_ALIVE_TIMEOUT = 75
+
+    def __init__(self, host='localhost', port=8000, reuse_port=False):
+        self.host = host
+        self.port = port
+        # SO_REUSEPORT: vários processos escutam na mesma porta
+        self.reuse_port = reuse_port
+        self.dispatcher = AsyncRequestDispatcher(self)
+        self._loop = None
+        self._version_event = None
+        self._version = None
+        self._waiters = 0
+        self._connections = 0
+        self._requests = 0
+
+    def stats(self) -> dict:
+        return {
+            'engine': self.ENGINE,
+            'open_connections': self._connections,
+            'waiting_clients': self._waiters,
+            'requests': self._requests
+        }
+
+    async def current_version(self):
+        # Sem versão publicada, o stat (e talvez o hash) do master roda no executor
+        return self._version or await self._loop.run_in_executor(None, FileHandler.get_version)
+
+    def version_event(self):
+        return self._version_event
+
+    def _on_version_change(self, version):
+        # Chamado pela thread de verificação do FileHandler
+        self._loop.call_soon_threadsafe(self._publish_version, version)
+
+    def _publish_version(self, version):
+        self._version = version
+        event, self._version_event = self._version_event, asyncio.Event()
+        event.set()
+
+    async def _add_waiter(self):
+        self._waiters += 1
+        if self._waiters == 1:
+            FileHandler.add_version_listener(self._on_version_change)
+            version = await self._loop.run_in_executor(None, FileHandler.get_version)
+            # Uma publicação durante a leitura é mais recente; a saída de todos os clientes zera a versão
+            if self._version is None and self._waiters:
+                self._version = version
+
+    def _remove_waiter(self):
+        self._waiters -= 1
+        if self._waiters == 0:
+            FileHandler.remove_version_listener(self._on_version_change)
+            self._version = None
+
+    async def _read_request(self, reader):
+        request_line = await asyncio.wait_for(reader.readline(), self.KEEP_ALIVE_TIMEOUT)
+        if not request_line:
+            return None
+        method, path, version = request_line.decode('latin-1').split(None, 2)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', 0))
+        if length > self.MAX_BODY_SIZE:
+            raise RequestRejected(413, 'PAYLOAD_TOO_LARGE', f"Corpo maior que {self.MAX_BODY_SIZE} bytes")
+        body = await reader.readexactly(length) if length else b''
+        return method, path, version.strip(), headers, body
+
+    def _write_response(self, writer, status_code, response, keep_alive, codec=None, etag=None):
+        if status_code == 304:
+            body, encoding = b'', None
+        else:
+            body, encoding = self.dispatcher._encode_json(response, codec)
+        head = (
+            f"HTTP/1.1 {status_code} {REASONS.get(status_code, 'Unknown')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            + (f"Content-Encoding: {encoding}\r\n" if encoding else "")
+            + (f"ETag: {etag}\r\n" if etag else "") +
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode('ascii')
+        writer.write(head + body)
+
+    def _write_metrics(self, writer, keep_alive):
+        body = REGISTRY.prometheus().encode('utf-8')
+        head = (
+            "HTTP/1.1 200 OK\r\n"
+            f"Content-Type: {PROMETHEUS_CONTENT_TYPE}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode('ascii')
+        writer.write(head + body)
+
+    async def _write_stream(self, writer, response, keep_alive, codec=None):
+        f, offset, count = response.pop('stream')
+        with f:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(None, self.dispatcher._compressed_download, response, codec)
+            head = (
+                "HTTP/1.1 200 OK\r\n"
+                "Content-Type: application/octet-stream\r\n"
+                f"Content-Length: {count if data is None else len(data)}\r\n"
+                + (f"Content-Encoding: {codec}\r\n" if data is not None else "") +
+                f"X-Version: {response['version']}\r\n"
+                f"X-Size: {response['size']}\r\n"
+                f"ETag: \"{response['version']}\"\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+            ).encode('ascii')
+            writer.write(head)
+            if data is not None:
+                writer.write(data)
+                return
+            await writer.drain()
+            if count:
+                # loop.sendfile usa os.sendfile quando o transporte permite
+                await self._loop.sendfile(writer.transport, f, offset, count)
+
+    async def _handle_connection(self, reader, writer):
+        self._connections += 1
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except RequestRejected as e:
+                    self._write_response(writer, e.status_code, e.response, False)
+                    break
+                except ValueError as e:
+                    self._write_response(writer, 400, {
+                        'status': 'error',
+                        'code': 'BAD_REQUEST',
+                        'message': str(e)
+                    }, False)
+                    break
+                if request is None:
+                    break
+
+                method, path, http_version, headers, body = request
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (http_version == 'HTTP/1.1' or connection == 'keep-alive')
+
+                codec = negotiate(headers.get('accept-encoding'))
+                if method == 'GET' and path.split('?')[0] == '/metrics':
+                    self._write_metrics(writer, keep_alive)
+                    await writer.drain()
+                    if not keep_alive:
+                        break
+                    continue
+                status_code, response, etag = await self._process(method, body, headers)
+                if 'stream' in response:
+                    await self._write_stream(writer, response, keep_alive, codec)
+                else:
+                    self._write_response(writer, status_code, response, keep_alive, codec, etag)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._connections -= 1
+            writer.close()
+
+    async def _process(self, method, body, headers):
+        """Retorna (status HTTP, resposta, ETag)"""
+        self._requests += 1
+        if method != 'POST' or not body:
+            return 400, {'status': 'error', 'code': 'BAD_REQUEST', 'message': 'Use POST com corpo JSON'}, None
+        try:
+            if headers.get('content-encoding'):
+                # Validar o token e descomprimir são bloqueantes: executor
+                body = await self._loop.run_in_executor(None, self.dispatcher._decode_body, body,
+                                                        headers.get('content-encoding'), headers.get('authorization'))
+            request_data = json.loads(body)
+        except RequestRejected as e:
+            logging.warning(f"Requisição recusada: {str(e)}")
+            return e.status_code, e.response, None
+        except (ValueError, OSError) as je:
+            logging.error(f"JSON inválido: {str(je)}")
+            return 400, {'status': 'error', 'code': 'INVALID_JSON', 'message': 'Formato JSON inválido'}, None
+
+        conditional = self.dispatcher._apply_if_none_match(request_data, headers.get('if-none-match'))
+        status_code, response = await self._call(request_data)
+        if conditional and response.get('status') == 'not_modified':
+            status_code = 304
+        return status_code, response, self.dispatcher._etag_for(request_data, response)
+
+    async def _call(self, request_data):
+        """Despacha uma requisição já decodificada; retorna (status HTTP, resposta)"""
+        if request_data.get('method') != 'wait_for_version':
+            return await self.dispatcher.dispatch(request_data)
+        try:
+            await self._add_waiter()
+            return await self.dispatcher.dispatch(request_data)
+        finally:
+            self._remove_waiter()
+
+    async def serve_forever(self):
+        self._loop = asyncio.get_running_loop()
+        self._version_event = asyncio.Event()
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port, reuse_address=True,
+                                            reuse_port=self.reuse_port or None)
+        logging.info(f"Servidor RMI ({self.ENGINE}) rodando em {self.SCHEME}://{self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
@@ -0,0 +1,247 @@
+"""
+Log de auditoria append-only em JSON Lines
+
+Um único thread escritor recebe as entradas por uma fila, grava em lotes
+e rotaciona o arquivo por tamanho ou idade. Segmentos rotacionados recebem
+o sufixo .AAAAMMDD-HHMMSS e podem ser comprimidos com gzip.
+
+Vários processos do servidor (--processes) gravam no mesmo arquivo: cada
+escrita acontece com flock compartilhado em <log>.lock e a rotação com flock
+exclusivo. Antes de gravar, o escritor confere se o arquivo aberto ainda é o
+atual; se outro processo já rotacionou, reabre em vez de gravar no segmento
+antigo (que pode estar sendo comprimido).
+
+Consulta: python -m server.audit_log [--mode RR] [--since 2024-01-01] [--limit 50]
+"""
+import argparse
+import atexit
+import fcntl
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Optional
+
+
+class AuditLog:
+    BATCH_SIZE = 512
+
+    def __init__(self, path: Path, max_bytes=10 * 1024 * 1024, max_age=24 * 3600,
+                 compress=True, flush_interval=0.5):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._file = None
+        self._opened_at = 0.0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock_fd = os.open(self.path.with_name(f"{self.path.name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        self._thread = threading.Thread(target=self._writer_loop, name='audit-log', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, entry: dict):
+        self._queue.put(entry)
+
+    def append_many(self, entries):
+        """Entradas enviadas juntas são gravadas na mesma escrita"""
+        self._queue.put(list(entries))
+
+    def flush(self, timeout=5):
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(5)
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        # Idade do segmento conta a partir da abertura pelo processo atual
+        self._opened_at = time.time()
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _is_current(self) -> bool:
+        """Chamado com o lock: o arquivo aberto ainda é o log atual (não foi rotacionado por outro processo)?"""
+        try:
+            return os.stat(self.path).st_ino == os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _reopen_if_rotated(self):
+        if not self._is_current():
+            self._file.close()
+            self._open()
+
+    def _should_rotate(self) -> bool:
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            return False
+        return size >= self.max_bytes or time.time() - self._opened_at >= self.max_age
+
+    def _rotate(self):
+        with self._locked(exclusive=True):
+            if not self._is_current():
+                # Outro processo rotacionou primeiro
+                self._file.close()
+                self._open()
+                return
+            self._file.close()
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            target = self.path.with_name(f"{self.path.name}.{stamp}")
+            counter = 1
+            while target.exists() or Path(f"{target}.gz").exists():
+                target = self.path.with_name(f"{self.path.name}.{stamp}-{counter}")
+                counter += 1
+            os.replace(self.path, target)
+            self._open()
+        # Nenhum processo grava mais no segmento renomeado: a compressão fica fora do lock
+        if self.compress:
+            # Leitores só enxergam o .gz completo; até lá o segmento sem compressão continua listado
+            temp_path = f"{target}.gz.tmp"
+            with open(target, 'rb') as src, gzip.open(temp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(temp_path, f"{target}.gz")
+            os.remove(target)
+
+    def _writer_loop(self):
+        self._open()
+        running = True
+        while running:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            lines, waiters = [], []
+            # Drena o que estiver na fila para gravar em uma única escrita
+            while True:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif isinstance(item, list):
+                    lines.extend(json.dumps(entry, ensure_ascii=False) for entry in item)
+                else:
+                    lines.append(json.dumps(item, ensure_ascii=False))
+                if len(lines) >= self.BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            try:
+                if lines:
+                    with self._locked():
+                        self._reopen_if_rotated()
+                        self._file.write('\n'.join(lines) + '\n')
+                        self._file.flush()
+                if self._should_rotate():
+                    self._rotate()
+            except Exception as e:
+                logging.error(f"FALHA AO REGISTRAR LOG: {str(e)}")
+            for waiter in waiters:
+                waiter.set()
+        self._file.close()
+        os.close(self._lock_fd)
+
+
+# Sufixo dos segmentos rotacionados: .AAAAMMDD-HHMMSS[-N][.gz]
+SEGMENT_SUFFIX = re.compile(r'^(\d{8}-\d{6})(?:-(\d+))?(\.gz)?$')
+
+
+def segments(path: Path):
+    """Segmentos do log em ordem cronológica: rotacionados primeiro, depois o atual"""
+    path = Path(path)
+    rotated = {}
+    for candidate in path.parent.glob(f"{path.name}.*"):
+        match = SEGMENT_SUFFIX.match(candidate.name[len(path.name) + 1:])
+        if match is None:
+            # .lock, .gz.tmp de uma compressão em andamento etc.
+            continue
+        stamp, counter, _ = match.groups()
+        key = (stamp, int(counter or 0))
+        # Durante a compressão o mesmo segmento existe com e sem .gz: lê só um deles
+        if key not in rotated or candidate.suffix != '.gz':
+            rotated[key] = candidate
+    return [rotated[key] for key in sorted(rotated)] + ([path] if path.exists() else [])
+
+
+def _open_segment(segment: Path):
+    if segment.suffix == '.gz':
+        return gzip.open(segment, 'rt', encoding='utf-8')
+    try:
+        return open(segment, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        # Comprimido e removido depois da listagem
+        compressed = Path(f"{segment}.gz")
+        if compressed.exists():
+            return gzip.open(compressed, 'rt', encoding='utf-8')
+        raise
+
+
+def read_entries(path: Path, since: Optional[str] = None, until: Optional[str] = None,
+                 mode: Optional[str] = None) -> Iterator[dict]:
+    """Itera as entradas do log filtrando por intervalo ISO de timestamp e modo"""
+    for segment in segments(path):
+        with _open_segment(segment) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                timestamp = entry.get('timestamp', '')
+                if since and timestamp < since:
+                    continue
+                if until and timestamp > until:
+                    continue
+                if mode and entry.get('mode') != mode:
+                    continue
+                yield entry
+
+
+def main():
+    from server.file_handler import FileHandler
+
+    parser = argparse.ArgumentParser(description="Consulta o log de sincronizações")
+    parser.add_argument('--file', default=str(FileHandler.LOG_FILE), help='Arquivo de log')
+    parser.add_argument('--since', help='Timestamp ISO inicial')
+    parser.add_argument('--until', help='Timestamp ISO final')
+    parser.add_argument('--mode', help='Filtra pelo modo (R, RR, RRA)')
+    parser.add_argument('--limit', type=int, help='Mostra apenas as últimas N entradas')
+    args = parser.parse_args()
+
+    entries = read_entries(Path(args.file), args.since, args.until, args.mode)
+    if args.limit:
+        entries = deque(entries, maxlen=args.limit)
+    for entry in entries:
+        print(json.dumps(entry, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from common.framing import HEADER, REQUEST, RESPONSE, decode_header, encode_frame, merge_payload, split_payload
+from server.async_server import AsyncRMIServer, AsyncRequestDispatcher
+from server.dispatcher import PREPARED_KEY
+from server.file_handler import FileHandler
+
+# Resposta cujo conteúdo vai no payload do frame: (campo, bytes)
+RAW_KEY = '_raw'
+
+
+class BinaryRequestDispatcher(AsyncRequestDispatcher):
+    """
+    Mesma tabela de métodos, com respostas adequadas ao protocolo binário:
+    get_file_content entrega os bytes do snapshot, sem passar por JSON
+    """
+
+    def _handle_get_content(self, request_data):
+        content, version = FileHandler.get_snapshot()
+        if_version_not = request_data.get('if_version_not')
+        if if_version_not is not None and if_version_not == version:
+            return {
+                'status': 'not_modified',
+                'version': version,
+                'timestamp': datetime.now().isoformat()
+            }
+        if not content:
+            raise ValueError("Conteúdo do arquivo não disponível")
+        return {
+            'status': 'success',
+            'version': version,
+            'timestamp': datetime.now().isoformat(),
+            RAW_KEY: ('content', content)
+        }
+
+    def _handle_batch(self, request_data):
+        response = super()._handle_batch(request_data)
+        for result in response['results']:
+            raw = result.pop(RAW_KEY, None)
+            if raw is not None:
+                result[raw[0]] = raw[1].decode('utf-8')
+        return response
+
+
+class BinaryRMIServer(AsyncRMIServer):
+    """
+    Servidor do protocolo binário (common.framing) sobre asyncio
+    Cada conexão é persistente; as requisições são atendidas em ordem e a
+    resposta repete o id da requisição
+    """
+    ENGINE = 'binary'
+    SCHEME = 'rmi'
+
+    def __init__(self, host='localhost', port=8001, reuse_port=False):
+        super().__init__(host, port, reuse_port)
+        self.dispatcher = BinaryRequestDispatcher(self)
+
+    async def _read_frame(self, reader):
+        head = await asyncio.wait_for(reader.readexactly(HEADER.size), self.KEEP_ALIVE_TIMEOUT)
+        kind, _, request_id, meta_len, payload_len = decode_header(head)
+        if kind != REQUEST:
+            raise ValueError("Tipo de frame inesperado")
+        meta = json.loads(await reader.readexactly(meta_len))
+        if not isinstance(meta, dict):
+            raise ValueError("Metadados devem ser um objeto JSON")
+        payload = await reader.readexactly(payload_len) if payload_len else b''
+        return request_id, merge_payload(meta, payload)
+
+    async def _write_frame(self, writer, request_id, status_code, response):
+        if 'stream' in response:
+            # Download: o payload é o arquivo, enviado com sendfile
+            f, offset, count = response.pop('stream')
+            response.pop('compressible', None)
+            with f:
+                writer.writelines(encode_frame(RESPONSE, request_id, response, status=status_code,
+                                               payload_size=count))
+                await writer.drain()
+                if count:
+                    await self._loop.sendfile(writer.transport, f, offset, count)
+            return
+
+        prepared = response.pop(PREPARED_KEY, None)
+        if prepared is not None:
+            response = json.loads(prepared[1])
+        raw = response.pop(RAW_KEY, None)
+        if raw is not None:
+            meta, payload = split_payload({**response, raw[0]: raw[1]}, raw[0])
+        else:
+            meta, payload = split_payload(response, 'content')
+        writer.writelines(encode_frame(RESPONSE, request_id, meta, payload, status_code))
+
+    async def _handle_connection(self, reader, writer):
+        self._connections += 1
+        try:
+            while True:
+                try:
+                    request_id, request_data = await self._read_frame(reader)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except ValueError as e:
+                    # Fluxo dessincronizado: responde e encerra a conexão
+                    logging.error(f"Frame inválido: {e}")
+                    writer.writelines(encode_frame(RESPONSE, 0, {
+                        'status': 'error',
+                        'code': 'BAD_REQUEST',
+                        'message': str(e)
+                    }, status=400))
+                    break
+
+                self._requests += 1
+                status_code, response = await self._call(request_data)
+                await self._write_frame(writer, request_id, status_code, response)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._connections -= 1
+            writer.close()
@@ -1,131 +1,230 @@
 from datetime import datetime
 from http.server import BaseHTTPRequestHandler
+import hashlib
 import json
-import threading
 import logging
-from common.auth import authenticate
+import os
+import time
+from common.auth import create_session_token, resolve_token
+from common.compression import CODECS, MIN_COMPRESS_SIZE, DecompressionLimitExceeded, compress, decompress, negotiate
+from common.delta import compute_delta, MAX_SCAN, MIN_BLOCK_SIZE, MAX_BLOCK_SIZE
+from common.metrics import REGISTRY
 from server.file_handler import FileHandler
-from server.threads import RequestThread
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('dispatcher.log'),
-        logging.StreamHandler()
-    ]
-)
-
-class RequestDispatcher(BaseHTTPRequestHandler):
-    def _set_headers(self, status_code=200, extra_headers=None):
-        self.send_response(status_code)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Connection', 'keep-alive')
-        
-        if extra_headers:
-            for key, value in extra_headers.items():
-                self.send_header(key, value)
-                
-        self.end_headers()
-    
-    def do_POST(self):
-        try:
-            content_length = int(self.headers.get('Content-Length', 0))
-            if content_length == 0:
-                raise ValueError("Content-Length inválido")
-                
-            post_data = self.rfile.read(content_length)
+from server.history_store import VersionNotFound
+from server.log_pipeline import REQUEST_LOG
+from server.profiling import PROFILER
+from server.response_cache import ResponseCache
+
+REQUESTS = REGISTRY.counter('rmi_requests_total', 'Requisições RMI por método e status HTTP', ('method', 'status'))
+REQUEST_SECONDS = REGISTRY.histogram('rmi_request_seconds', 'Tempo de execução das requisições RMI', ('method',))
+AUTH = REGISTRY.counter('rmi_auth_total', 'Autenticações por resultado', ('result',))
+AUTH_SECONDS = REGISTRY.histogram('rmi_auth_seconds', 'Tempo de resolução do token')
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+USER_KEY = '_user'
+# Resposta já serializada: (chave no cache, corpo JSON em bytes)
+PREPARED_KEY = '_prepared'
+
+
+class RequestRejected(Exception):
+    """Requisição recusada antes de decodificar o corpo; carrega o status HTTP e a resposta"""
+
+    def __init__(self, status_code: int, code: str, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = {'status': 'error', 'code': code, 'message': message}
+
+class RemoteMethods:
+    """
+    Tabela de métodos remotos independente do transporte
+    Usada pelo dispatcher HTTP e pelo dispatcher asyncio; self.server deve
+    ser o servidor que atende a requisição
+    """
+    METHODS = {
+        'get_file_content': '_handle_get_content',
+        'get_file_delta': '_handle_get_delta',
+        'check_master_version': '_handle_check_version',
+        'wait_for_version': '_handle_wait_version',
+        'synchronize': '_handle_sync',
+        'confirm_sync': '_handle_confirm_sync',
+        'update_master_file': '_handle_update_file',
+        'get_server_stats': '_handle_server_stats',
+        'batch': '_handle_batch',
+        'open_session': '_handle_open_session',
+        'download_file': '_handle_download',
+        'get_tree_manifest': '_handle_tree_manifest',
+        'list_versions': '_handle_list_versions',
+        'get_version_content': '_handle_version_content',
+        'get_version_diff': '_handle_version_diff',
+        'restore_version': '_handle_restore_version',
+        'get_capabilities': '_handle_capabilities',
+        'get_metrics': '_handle_metrics',
+        'profiling': '_handle_profiling'
+    }
+    # Métodos cuja resposta é o arquivo em bytes, enviado pelo transporte
+    STREAM_METHODS = {'download_file'}
+    # Métodos que aceitam If-None-Match; o ETag é a versão do conteúdo
+    CONDITIONAL_METHODS = {'get_file_content', 'download_file'}
+    # Corpos de get_file_content por (método, versão, codec), compartilhados entre clientes
+    RESPONSE_CACHE = ResponseCache(128 * 1024 * 1024)
+    # Deltas por (versão, tamanho de bloco, assinaturas): raramente reaproveitados entre
+    # clientes, ficam num cache pequeno próprio para não expulsar os corpos acima
+    DELTA_CACHE = ResponseCache(16 * 1024 * 1024)
+    # Porta do protocolo binário (server.binary_server), anunciada em get_capabilities
+    BINARY_PORT = None
+    # Confirmações aceitas numa única chamada de confirm_sync
+    MAX_CONFIRMATIONS = 1000
+    # Espera sugerida ao cliente quando wait_for_version não pode bloquear (limite de long-polls)
+    WAIT_RETRY_AFTER = 5.0
+
+    # Limite do corpo da requisição, recebido e depois de descomprimido
+    MAX_BODY_SIZE = 512 * 1024 * 1024
+
+    @classmethod
+    def _decode_body(cls, body: bytes, content_encoding, authorization=None):
+        """
+        Descomprime o corpo da requisição conforme Content-Encoding
+        Corpo comprimido só é descomprimido com um token válido no cabeçalho
+        Authorization (Bearer), e a saída é limitada a MAX_BODY_SIZE
+        """
+        if content_encoding and content_encoding != 'identity':
+            if content_encoding not in CODECS:
+                raise ValueError(f"Content-Encoding não suportado: {content_encoding}")
+            scheme, _, token = (authorization or '').partition(' ')
+            if scheme.lower() != 'bearer' or resolve_token(token.strip()) is None:
+                raise RequestRejected(401, 'UNAUTHORIZED', 'Corpo comprimido exige credenciais no cabeçalho Authorization')
             try:
-                request_data = json.loads(post_data)
-            except json.JSONDecodeError as je:
-                logging.error(f"JSON inválido: {str(je)}")
-                self._set_headers(400)
-                response = {
-                    'status': 'error',
-                    'code': 'INVALID_JSON',
-                    'message': 'Formato JSON inválido'
-                }
-                self.wfile.write(json.dumps(response).encode())
-                return
-            
-            logging.info(f"Requisição recebida: {request_data.get('method')}")
-            
-            # Processa em uma thread separada
-            thread = RequestThread(self, request_data)
-            thread.start()
-            
-        except Exception as e:
-            logging.error(f"Erro ao processar requisição: {str(e)}", exc_info=True)
-            self._set_headers(500)
-            response = {
-                'status': 'error',
-                'code': 'SERVER_ERROR',
-                'message': 'Erro interno no servidor'
-            }
-            self.wfile.write(json.dumps(response).encode())
+                body = decompress(content_encoding, body, cls.MAX_BODY_SIZE)
+            except DecompressionLimitExceeded as e:
+                raise RequestRejected(413, 'PAYLOAD_TOO_LARGE', str(e))
+        return body
 
-    def handle_request(self, request_data):
+    @classmethod
+    def _encode_json(cls, response, codec):
+        """Serializa a resposta e a comprime se o cliente aceitar e compensar"""
+        prepared = response.get(PREPARED_KEY)
+        if prepared is not None:
+            key, body = prepared
+            if codec and len(body) >= MIN_COMPRESS_SIZE:
+                cache = cls.DELTA_CACHE if key[0] == 'get_file_delta' else cls.RESPONSE_CACHE
+                return cache.get_or_build(key + (codec,), lambda: compress(codec, body)), codec
+            return body, None
+
+        body = json.dumps(response).encode('utf-8')
+        if codec and len(body) >= MIN_COMPRESS_SIZE:
+            return compress(codec, body), codec
+        return body, None
+
+    @staticmethod
+    def _compressed_download(response, codec):
+        """Master comprimido do cache do FileHandler, se aplicável a este download"""
+        compressible = response.pop('compressible', False)
+        if not codec or not compressible or response['size'] < MIN_COMPRESS_SIZE:
+            return None
+        data, version = FileHandler.get_compressed(codec)
+        return data if version == response['version'] else None
+
+    @classmethod
+    def _apply_if_none_match(cls, request_data, if_none_match) -> bool:
+        """Converte If-None-Match em if_version_not; retorna True se a requisição ficou condicional"""
+        if not if_none_match or request_data.get('method') not in cls.CONDITIONAL_METHODS:
+            return False
+        tag = if_none_match.split(',')[0].strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        request_data['if_version_not'] = tag.strip('"')
+        return True
+
+    @classmethod
+    def _etag_for(cls, request_data, response):
+        """Valor do cabeçalho ETag para a resposta, ou None"""
+        if request_data.get('method') not in cls.CONDITIONAL_METHODS:
+            return None
+        if response.get('status') not in ('success', 'not_modified') or not response.get('version'):
+            return None
+        return f'"{response["version"]}"'
+
+    def _dispatch(self, request_data):
+        start = time.perf_counter()
+        with PROFILER.request():
+            status_code, response = self._authenticate_and_invoke(request_data)
+        # Métodos inexistentes não viram rótulos novos
+        method_name = request_data.get('method')
+        if method_name not in self.METHODS:
+            method_name = 'unknown'
+        duration = time.perf_counter() - start
+        REQUESTS.inc((method_name, status_code))
+        REQUEST_SECONDS.observe(duration, (method_name,))
+        REQUEST_LOG.record(method_name, status_code, duration)
+        return status_code, response
+
+    def _authenticate_and_invoke(self, request_data):
         try:
-            # Configurações de conexão
-            self.protocol_version = 'HTTP/1.1'
-            self.close_connection = False
-            
-            # 1. Autenticação
+            # 1. Autenticação (uma consulta ao índice em memória)
             auth_token = request_data.get('auth_token')
-            if not authenticate(auth_token):
-                logging.warning(f"Autenticação falhou para token: {auth_token[:8]}...")
-                self._set_headers(401)
-                return {
+            with AUTH_SECONDS.time():
+                user = resolve_token(auth_token)
+            AUTH.inc(('success' if user is not None else 'failure',))
+            if user is None:
+                logging.warning(f"Autenticação falhou para token: {str(auth_token)[:8]}...")
+                return 401, {
                     'status': 'error',
                     'code': 'UNAUTHORIZED',
                     'message': 'Credenciais inválidas'
                 }
 
+            # O usuário resolvido acompanha a requisição; sobrescreve qualquer valor do cliente
+            return self._invoke({**request_data, USER_KEY: user})
+
+        except Exception as e:
+            logging.error(f"Erro no handle_request: {str(e)}", exc_info=True)
+            return 500, {
+                'status': 'error',
+                'code': 'INTERNAL_ERROR',
+                'message': str(e)
+            }
+
+    def _invoke(self, request_data):
+        """Executa um método já autenticado e retorna (status HTTP, resposta)"""
+        try:
             # 2. Validação do método
             method_name = request_data.get('method')
             if not method_name:
                 logging.warning("Requisição sem método")
-                self._set_headers(400)
-                return {
+                return 400, {
                     'status': 'error',
                     'code': 'METHOD_REQUIRED',
                     'message': 'Parâmetro "method" é obrigatório'
                 }
 
             # 3. Roteamento para handlers
-            handlers = {
-                'get_file_content': self._handle_get_content,
-                'check_master_version': self._handle_check_version,
-                'synchronize': self._handle_sync,
-                'confirm_sync': self._handle_confirm_sync,
-                'update_master_file': self._handle_update_file
-            }
-
-            handler = handlers.get(method_name)
-            if not handler:
+            handler_name = self.METHODS.get(method_name)
+            if not handler_name:
                 logging.warning(f"Método não encontrado: {method_name}")
-                self._set_headers(404)
-                return {
+                return 404, {
                     'status': 'error',
                     'code': 'METHOD_NOT_FOUND',
                     'message': f'Método {method_name} não existe'
                 }
 
-            response = handler(request_data)
-            
-            # 5. Envio da resposta
-            response_data = json.dumps(response).encode('utf-8')
-            self._set_headers(extra_headers={
-                'Content-Length': str(len(response_data))
-            })
-            self.wfile.write(response_data)
-            
-            return response
+            return 200, getattr(self, handler_name)(request_data)
 
+        except PermissionError as e:
+            return 403, {
+                'status': 'error',
+                'code': 'FORBIDDEN',
+                'message': str(e)
+            }
+        except VersionNotFound as e:
+            return 404, {
+                'status': 'error',
+                'code': 'VERSION_NOT_FOUND',
+                'message': str(e)
+            }
         except Exception as e:
             logging.error(f"Erro no handle_request: {str(e)}", exc_info=True)
-            self._set_headers(500)
-            return {
+            return 500, {
                 'status': 'error',
                 'code': 'INTERNAL_ERROR',
                 'message': str(e)
@@ -133,22 +232,72 @@ class RequestDispatcher(BaseHTTPRequestHandler):
 
     def _handle_get_content(self, request_data):
         try:
-            content = FileHandler.get_content()
-            version = FileHandler.get_version()
+            # Conteúdo e versão vêm do mesmo snapshot, em uma única leitura
+            content, version = FileHandler.get_snapshot()
+            
+            # Forma condicional: só envia o conteúdo se a versão do cliente for outra
+            if_version_not = request_data.get('if_version_not')
+            if if_version_not is not None and if_version_not == version:
+                return {
+                    'status': 'not_modified',
+                    'version': version,
+                    'timestamp': datetime.now().isoformat()
+                }
             
-            if content is None:
+            if not content:
                 raise ValueError("Conteúdo do arquivo não disponível")
-                
-            return {
+            
+            # Serializado uma vez por versão; o timestamp é o da serialização
+            key = ('get_file_content', version)
+            body = self.RESPONSE_CACHE.get_or_build(key + (None,), lambda: json.dumps({
                 'status': 'success',
-                'content': content,
+                'content': content.decode('utf-8'),
                 'version': version,
                 'timestamp': datetime.now().isoformat()
+            }).encode('utf-8'))
+            return {
+                'status': 'success',
+                'version': version,
+                PREPARED_KEY: (key, body)
             }
         except Exception as e:
             logging.error(f"Erro no _handle_get_content: {str(e)}")
             raise
 
+    def _handle_get_delta(self, request_data):
+        try:
+            block_size = request_data.get('block_size')
+            signatures = request_data.get('signatures')
+            
+            if not isinstance(block_size, int) or not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+                raise ValueError("Tamanho de bloco inválido")
+            if not isinstance(signatures, list):
+                raise TypeError("Assinaturas devem ser uma lista")
+                
+            content, version = FileHandler.get_snapshot()
+            
+            # Clientes com a mesma cópia local enviam as mesmas assinaturas: o delta
+            # é calculado uma vez por (versão, tamanho de bloco, assinaturas), no DELTA_CACHE
+            def build():
+                return json.dumps({
+                    'status': 'success',
+                    'delta': compute_delta(content, signatures, block_size, MAX_SCAN),
+                    'block_size': block_size,
+                    'version': version,
+                    'timestamp': datetime.now().isoformat()
+                }).encode('utf-8')
+            
+            signatures_digest = hashlib.sha1(json.dumps(signatures, separators=(',', ':')).encode('utf-8')).hexdigest()
+            key = ('get_file_delta', version, block_size, signatures_digest)
+            return {
+                'status': 'success',
+                'version': version,
+                PREPARED_KEY: (key, self.DELTA_CACHE.get_or_build(key + (None,), build))
+            }
+        except Exception as e:
+            logging.error(f"Erro no _handle_get_delta: {str(e)}")
+            raise
+
     def _handle_check_version(self, request_data):
         try:
             version = FileHandler.get_version()
@@ -165,6 +314,35 @@ class RequestDispatcher(BaseHTTPRequestHandler):
             logging.error(f"Erro no _handle_check_version: {str(e)}")
             raise
 
+    def _handle_wait_version(self, request_data):
+        try:
+            since = request_data.get('since')
+            timeout = float(request_data.get('timeout', FileHandler.MAX_WAIT_TIMEOUT))
+            
+            version = FileHandler.wait_for_version(since, timeout)
+            retry_after = None
+            if version is None:
+                # Limite de long-polls do pool atingido: responde na hora com a versão atual
+                # e o cliente espera retry_after antes de perguntar de novo
+                version = FileHandler.get_version()
+                retry_after = min(max(0.0, timeout), self.WAIT_RETRY_AFTER)
+            
+            if version in ["error", "permission_denied"]:
+                raise RuntimeError(f"Erro ao obter versão: {version}")
+                
+            response = {
+                'status': 'success',
+                'version': version,
+                'changed': version != since,
+                'timestamp': datetime.now().isoformat()
+            }
+            if retry_after is not None:
+                response['retry_after'] = retry_after
+            return response
+        except Exception as e:
+            logging.error(f"Erro no _handle_wait_version: {str(e)}")
+            raise
+
     def _handle_sync(self, request_data):
         try:
             mode = request_data.get('mode', 'R')
@@ -182,18 +360,37 @@ class RequestDispatcher(BaseHTTPRequestHandler):
             raise
 
     def _handle_confirm_sync(self, request_data):
+        """
+        Uma confirmação (protocol, version opcional) ou várias de uma vez em
+        confirmations, como envia a fila de confirmações RRA do cliente
+        """
         try:
             protocol = request_data.get('protocol')
             auth_token = request_data.get('auth_token')
+            confirmations = request_data.get('confirmations')
             
-            if protocol not in ['RR', 'RRA']:
-                raise ValueError("Protocolo inválido")
-                
-            FileHandler.log_sync(auth_token, protocol)
+            if confirmations is None:
+                if protocol not in ['RR', 'RRA']:
+                    raise ValueError("Protocolo inválido")
+                FileHandler.log_sync(auth_token, protocol, request_data.get('version'))
+                confirmed = 1
+            else:
+                if not isinstance(confirmations, list) or not 0 < len(confirmations) <= self.MAX_CONFIRMATIONS:
+                    raise ValueError(f"confirmations deve ser uma lista com 1 a {self.MAX_CONFIRMATIONS} itens")
+                for item in confirmations:
+                    if not isinstance(item, dict) or item.get('protocol') not in ['RR', 'RRA']:
+                        raise ValueError("Protocolo inválido")
+                    count = item.get('count', 1)
+                    if not isinstance(count, int) or count < 1:
+                        raise ValueError("count deve ser um inteiro positivo")
+                FileHandler.log_sync(auth_token, protocol, confirmations=confirmations)
+                confirmed = sum(item.get('count', 1) for item in confirmations)
+                protocol = protocol or confirmations[0]['protocol']
             
             return {
                 'status': 'success',
                 'protocol': protocol,
+                'confirmed': confirmed,
                 'confirmed_at': datetime.now().isoformat()
             }
         except Exception as e:
@@ -202,16 +399,15 @@ class RequestDispatcher(BaseHTTPRequestHandler):
 
     def _handle_update_file(self, request_data):
         try:
-            auth_token = request_data.get('auth_token')
             new_content = request_data.get('new_content')
             
-            if not authenticate(auth_token, admin=True):
+            if not request_data[USER_KEY].admin:
                 raise PermissionError("Acesso administrativo requerido")
                 
             if not isinstance(new_content, str):
                 raise TypeError("Conteúdo deve ser uma string")
                 
-            success = FileHandler.update_content(new_content)
+            success = FileHandler.update_content(new_content, request_data[USER_KEY].username)
             
             return {
                 'status': 'success' if success else 'error',
@@ -219,4 +415,400 @@ class RequestDispatcher(BaseHTTPRequestHandler):
             }
         except Exception as e:
             logging.error(f"Erro no _handle_update_file: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def _handle_list_versions(self, request_data):
+        try:
+            limit = request_data.get('limit')
+            return {
+                'status': 'success',
+                'versions': FileHandler.list_versions(int(limit) if limit is not None else None),
+                'timestamp': datetime.now().isoformat()
+            }
+        except Exception as e:
+            logging.error(f"Erro no _handle_list_versions: {str(e)}")
+            raise
+
+    def _handle_version_content(self, request_data):
+        """Conteúdo do master numa versão anterior (content@version)"""
+        try:
+            version = request_data.get('version')
+            if not isinstance(version, str):
+                raise TypeError("Versão deve ser uma string")
+            
+            # Versões antigas não mudam: o corpo serializado fica no cache
+            key = ('get_version_content', version)
+            body = self.RESPONSE_CACHE.get_or_build(key + (None,), lambda: json.dumps({
+                'status': 'success',
+                'content': FileHandler.get_content_at(version).decode('utf-8'),
+                'version': version,
+                'timestamp': datetime.now().isoformat()
+            }).encode('utf-8'))
+            return {
+                'status': 'success',
+                'version': version,
+                PREPARED_KEY: (key, body)
+            }
+        except VersionNotFound:
+            raise
+        except Exception as e:
+            logging.error(f"Erro no _handle_version_content: {str(e)}")
+            raise
+
+    def _handle_version_diff(self, request_data):
+        """Delta entre duas versões do histórico (destino padrão: versão atual)"""
+        try:
+            from_version = request_data.get('from_version')
+            to_version = request_data.get('to_version') or FileHandler.get_snapshot()[1]
+            if not isinstance(from_version, str) or not isinstance(to_version, str):
+                raise TypeError("Versões devem ser strings")
+            
+            # Clientes parados na mesma versão recebem o mesmo delta, calculado uma vez
+            def build():
+                delta, block_size, version = FileHandler.diff_versions(from_version, to_version)
+                return json.dumps({
+                    'status': 'success',
+                    'delta': delta,
+                    'block_size': block_size,
+                    'from_version': from_version,
+                    'version': version,
+                    'timestamp': datetime.now().isoformat()
+                }).encode('utf-8')
+            
+            key = ('get_version_diff', from_version, to_version)
+            return {
+                'status': 'success',
+                'version': to_version,
+                PREPARED_KEY: (key, self.RESPONSE_CACHE.get_or_build(key + (None,), build))
+            }
+        except VersionNotFound:
+            raise
+        except Exception as e:
+            logging.error(f"Erro no _handle_version_diff: {str(e)}")
+            raise
+
+    def _handle_restore_version(self, request_data):
+        """Rollback instantâneo do master para uma versão do histórico"""
+        try:
+            version = request_data.get('version')
+            if not request_data[USER_KEY].admin:
+                raise PermissionError("Acesso administrativo requerido")
+            if not isinstance(version, str):
+                raise TypeError("Versão deve ser uma string")
+            
+            success = FileHandler.restore_version(version)
+            return {
+                'status': 'success' if success else 'error',
+                'version': FileHandler.get_version(),
+                'updated_at': datetime.now().isoformat()
+            }
+        except Exception as e:
+            logging.error(f"Erro no _handle_restore_version: {str(e)}")
+            raise
+
+    def _handle_batch(self, request_data):
+        """Executa em ordem uma lista de chamadas {method, params}, autenticadas uma única vez"""
+        try:
+            calls = request_data.get('calls')
+            if not isinstance(calls, list):
+                raise TypeError("Chamadas devem ser uma lista")
+                
+            results = []
+            for call in calls:
+                method_name = call.get('method') if isinstance(call, dict) else None
+                if method_name in self.STREAM_METHODS:
+                    results.append({
+                        'status': 'error',
+                        'code': 'NOT_BATCHABLE',
+                        'message': f'Método {method_name} não pode ser usado em lote'
+                    })
+                    continue
+                if method_name == 'batch':
+                    results.append({
+                        'status': 'error',
+                        'code': 'NESTED_BATCH',
+                        'message': 'Lotes aninhados não são permitidos'
+                    })
+                    continue
+                params = (call.get('params') or {}) if isinstance(call, dict) else {}
+                if not isinstance(params, dict):
+                    params = {}
+                _, response = self._invoke({
+                    **params,
+                    'method': method_name,
+                    'auth_token': request_data.get('auth_token'),
+                    USER_KEY: request_data[USER_KEY]
+                })
+                if PREPARED_KEY in response:
+                    response = json.loads(response[PREPARED_KEY][1])
+                results.append(response)
+            
+            return {
+                'status': 'success',
+                'results': results,
+                'timestamp': datetime.now().isoformat()
+            }
+        except Exception as e:
+            logging.error(f"Erro no _handle_batch: {str(e)}")
+            raise
+
+    def _handle_download(self, request_data):
+        """
+        Prepara o envio do master em bytes; o transporte escreve 'stream'
+        (arquivo, deslocamento, quantidade) direto no socket
+        """
+        try:
+            offset = int(request_data.get('offset', 0))
+            path = request_data.get('path')
+            if path is not None:
+                # Arquivo da árvore sincronizada
+                f, size, version = FileHandler.open_tree_file(str(path))
+            else:
+                f, size, version = FileHandler.open_master()
+            if not 0 <= offset <= size:
+                f.close()
+                raise ValueError("Deslocamento inválido")
+            if_version_not = request_data.get('if_version_not')
+            if if_version_not is not None and if_version_not == version:
+                f.close()
+                return {
+                    'status': 'not_modified',
+                    'version': version,
+                    'timestamp': datetime.now().isoformat()
+                }
+            return {
+                'status': 'success',
+                'version': version,
+                'size': size,
+                'compressible': path is None and offset == 0,
+                'stream': (f, offset, size - offset)
+            }
+        except Exception as e:
+            logging.error(f"Erro no _handle_download: {str(e)}")
+            raise
+
+    def _handle_tree_manifest(self, request_data):
+        try:
+            since = request_data.get('since')
+            manifest = FileHandler.get_tree_manifest(int(since) if since is not None else None)
+            return {
+                'status': 'success',
+                **manifest,
+                'timestamp': datetime.now().isoformat()
+            }
+        except Exception as e:
+            logging.error(f"Erro no _handle_tree_manifest: {str(e)}")
+            raise
+
+    def _handle_open_session(self, request_data):
+        try:
+            user = request_data[USER_KEY]
+            return {
+                'status': 'success',
+                'session_token': create_session_token(user),
+                'admin': user.admin,
+                'timestamp': datetime.now().isoformat()
+            }
+        except Exception as e:
+            logging.error(f"Erro no _handle_open_session: {str(e)}")
+            raise
+
+    def _handle_capabilities(self, request_data):
+        """Transportes e codecs disponíveis, para o cliente negociar o protocolo"""
+        return {
+            'status': 'success',
+            'binary_port': self.BINARY_PORT,
+            'codecs': sorted(CODECS),
+            'digest': FileHandler.DIGEST_ALGORITHM,
+            'methods': sorted(self.METHODS),
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def _handle_metrics(self, request_data):
+        return {
+            'status': 'success',
+            'metrics': REGISTRY.snapshot(),
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def _handle_profiling(self, request_data):
+        """
+        Liga/desliga cProfile (cpu) e tracemalloc (memory) sem reiniciar o servidor
+        O relatório de um profiler é devolvido quando ele é desligado ou com report=True
+        """
+        try:
+            if not request_data[USER_KEY].admin:
+                raise PermissionError("Acesso administrativo requerido")
+            top = int(request_data.get('top', 30))
+            cpu, memory = request_data.get('cpu'), request_data.get('memory')
+            report = bool(request_data.get('report'))
+            response = {'status': 'success'}
+
+            if cpu is True:
+                PROFILER.start_cpu(request_data.get('sample_every', 1))
+            elif cpu is False:
+                PROFILER.stop_cpu()
+            if cpu is False or report:
+                response['cpu_report'] = PROFILER.cpu_report(top)
+
+            if memory is False or report:
+                response['memory_report'] = PROFILER.memory_report(top)
+            if memory is True:
+                PROFILER.start_memory(int(request_data.get('frames', 10)))
+            elif memory is False:
+                PROFILER.stop_memory()
+
+            response['profiling'] = PROFILER.status()
+            return response
+        except Exception as e:
+            logging.error(f"Erro no _handle_profiling: {str(e)}")
+            raise
+
+    def _handle_server_stats(self, request_data):
+        stats = getattr(self.server, 'stats', None)
+        return {
+            'status': 'success',
+            'pid': os.getpid(),
+            'stats': stats() if stats else {},
+            'response_cache': self.RESPONSE_CACHE.stats(),
+            'delta_cache': self.DELTA_CACHE.stats(),
+            'timestamp': datetime.now().isoformat()
+        }
+
+
+REGISTRY.gauge('rmi_response_cache_bytes', 'Bytes no cache de respostas serializadas',
+               function=lambda: RemoteMethods.RESPONSE_CACHE.stats()['bytes'])
+
+
+class RequestDispatcher(RemoteMethods, BaseHTTPRequestHandler):
+    # HTTP/1.1 com keep-alive: toda resposta precisa de Content-Length
+    protocol_version = 'HTTP/1.1'
+    # Tempo máximo que uma conexão ociosa prende um worker
+    timeout = 15
+    # Cabeçalho e corpo saem em escritas separadas; sem isso o Nagle atrasa cada resposta
+    disable_nagle_algorithm = True
+
+    def _set_headers(self, status_code=200, extra_headers=None):
+        self.send_response(status_code)
+        if not extra_headers or 'Content-Type' not in extra_headers:
+            self.send_header('Content-type', 'application/json')
+        self.send_header('Connection', 'close' if self.close_connection else 'keep-alive')
+        
+        if extra_headers:
+            for key, value in extra_headers.items():
+                self.send_header(key, value)
+                
+        self.end_headers()
+
+    def _send_json(self, response, status_code=200, etag=None):
+        if status_code == 304:
+            # 304 não tem corpo; a versão vai no ETag
+            response_data, encoding = b'', None
+        else:
+            codec = negotiate(self.headers.get('Accept-Encoding'))
+            response_data, encoding = self._encode_json(response, codec)
+        headers = {'Content-Length': str(len(response_data))}
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        if etag:
+            headers['ETag'] = etag
+        self._set_headers(status_code, extra_headers=headers)
+        self.wfile.write(response_data)
+    
+    def log_request(self, code='-', size='-'):
+        # Cada requisição já entra no log estruturado (server.log_pipeline.REQUEST_LOG)
+        pass
+
+    def log_message(self, format, *args):
+        # Erros do http.server passam pela fila de log em vez de escrever direto no stderr
+        logging.warning(f"{self.address_string()} - {format % args}")
+
+    def do_GET(self):
+        """GET /metrics: métricas no formato texto do Prometheus"""
+        if self.path.split('?')[0] != '/metrics':
+            self._send_json({
+                'status': 'error',
+                'code': 'NOT_FOUND',
+                'message': 'Chamadas RMI usam POST; GET só atende /metrics'
+            }, 404)
+            return
+        body = REGISTRY.prometheus().encode('utf-8')
+        self._set_headers(200, {'Content-Type': PROMETHEUS_CONTENT_TYPE, 'Content-Length': str(len(body))})
+        self.wfile.write(body)
+
+    def do_POST(self):
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            if content_length == 0:
+                raise ValueError("Content-Length inválido")
+            if content_length > self.MAX_BODY_SIZE:
+                # O corpo não é lido: a conexão não pode ser reaproveitada
+                self.close_connection = True
+                raise RequestRejected(413, 'PAYLOAD_TOO_LARGE', f"Corpo maior que {self.MAX_BODY_SIZE} bytes")
+                
+            post_data = self._decode_body(
+                self.rfile.read(content_length),
+                self.headers.get('Content-Encoding'),
+                self.headers.get('Authorization')
+            )
+            try:
+                request_data = json.loads(post_data)
+            except json.JSONDecodeError as je:
+                logging.error(f"JSON inválido: {str(je)}")
+                self._send_json({
+                    'status': 'error',
+                    'code': 'INVALID_JSON',
+                    'message': 'Formato JSON inválido'
+                }, 400)
+                return
+            
+            # Processa no worker da conexão: o handler só libera o socket
+            # depois que a resposta foi escrita (necessário para long-poll)
+            self.handle_request(request_data)
+            
+        except RequestRejected as e:
+            logging.warning(f"Requisição recusada: {str(e)}")
+            self._send_json(e.response, e.status_code)
+        except Exception as e:
+            logging.error(f"Erro ao processar requisição: {str(e)}", exc_info=True)
+            self.close_connection = True
+            self._send_json({
+                'status': 'error',
+                'code': 'SERVER_ERROR',
+                'message': 'Erro interno no servidor'
+            }, 500)
+
+    def handle_request(self, request_data):
+        conditional = self._apply_if_none_match(request_data, self.headers.get('If-None-Match'))
+        status_code, response = self._dispatch(request_data)
+        if conditional and response.get('status') == 'not_modified':
+            status_code = 304
+        if 'stream' in response:
+            self._send_stream(response)
+        else:
+            self._send_json(response, status_code, self._etag_for(request_data, response))
+        return response
+
+    def _send_stream(self, response):
+        f, offset, count = response.pop('stream')
+        with f:
+            codec = negotiate(self.headers.get('Accept-Encoding'))
+            data = self._compressed_download(response, codec)
+            headers = {
+                'Content-Type': 'application/octet-stream',
+                'Content-Length': str(count if data is None else len(data)),
+                'X-Version': response['version'],
+                'X-Size': str(response['size']),
+                'ETag': f'"{response["version"]}"'
+            }
+            if data is not None:
+                # Representação comprimida cacheada por versão no FileHandler
+                headers['Content-Encoding'] = codec
+                self._set_headers(extra_headers=headers)
+                self.wfile.write(data)
+                return
+            
+            self._set_headers(extra_headers=headers)
+            # socket.sendfile usa os.sendfile (zero-copy) quando disponível
+            if count:
+                self.connection.sendfile(f, offset, count)
@@ -1,26 +1,82 @@
-from typing import Optional
+from typing import BinaryIO, Optional, Tuple
+import fcntl
 import os
-import hashlib
 import json
 import logging
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
+from common.compression import compress
+from common.digest import DEFAULT_ALGORITHM, algorithm_of, hash_bytes, hash_stream, is_tree, tree_hash
+from common.delta import MAX_SCAN, block_signatures, choose_block_size, compute_delta
+from common.metrics import REGISTRY
+from server.audit_log import AuditLog
+from server.history_store import HistoryStore
+from server.response_cache import ResponseCache
+from server.tree_index import TreeIndex
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('file_handler.log'),
-        logging.StreamHandler()
-    ]
-)
+FILE_READS = REGISTRY.counter('file_reads_total', 'Leituras completas do master')
+FILE_READ_BYTES = REGISTRY.counter('file_read_bytes_total', 'Bytes lidos do master')
+HASH_SECONDS = REGISTRY.histogram('file_hash_seconds', 'Tempo de cálculo da versão do master', ('mode',))
+FILE_WRITES = REGISTRY.counter('file_writes_total', 'Atualizações do master por resultado', ('result',))
+WRITE_SECONDS = REGISTRY.histogram('file_write_seconds', 'Tempo de update_content, incluindo o histórico')
 
 class FileHandler:
     BASE_DIR = Path(__file__).parent
     MASTER_FILE = BASE_DIR / 'master.txt'
     LOG_FILE = BASE_DIR / 'sync.log'
     USERS_FILE = BASE_DIR / 'users.json'
+    TREE_DIR = BASE_DIR / 'tree'
+    TREE_INDEX_FILE = BASE_DIR / 'tree_index.json'
+    HISTORY_DIR = BASE_DIR / 'history'
+
+    # Cache da versão do master: (chave de stat, bytes, hash)
+    # A chave (inode, tamanho, mtime_ns) invalida o cache quando o arquivo muda
+    _cache_lock = threading.Lock()
+    _cache = None
+    # Conteúdo acima deste tamanho não fica em memória; só o hash é guardado
+    CONTENT_CACHE_MAX = 64 * 1024 * 1024
+    HASH_CHUNK_SIZE = 1024 * 1024
+    # Algoritmo das versões; o prefixo na versão informa os clientes (ver common.digest)
+    DIGEST_ALGORITHM = DEFAULT_ALGORITHM
+    # Versão compartilhada entre processos do servidor (server.shared_state), se configurada
+    SHARED_STATE = None
+    # Modo árvore: (versão, folhas) do conteúdo em cache, para rehashear só os blocos alterados
+    _tree_leaves = None
+    # Representações comprimidas do master: (versão, codec) -> bytes, LRU limitado
+    _compressed = ResponseCache(CONTENT_CACHE_MAX)
+
+    # Long-poll: clientes aguardam nesta condição até a versão mudar
+    WATCH_INTERVAL = 0.05
+    MAX_WAIT_TIMEOUT = 60
+    # Threads bloqueadas ao mesmo tempo em wait_for_version (None: sem limite); o servidor
+    # com pool de threads limita para que long-polls não ocupem todos os workers
+    MAX_WAITERS = None
+    _version_changed = threading.Condition()
+    _waiters = 0
+    _watcher = None
+    _listeners = []
+
+    # Escritor único do sync.log, criado no primeiro registro
+    _audit_log = None
+    # Manifesto da árvore sincronizada, criado no primeiro uso
+    _tree_index = None
+    # Histórico de versões do master, criado no primeiro uso
+    _history_store = None
     
+    @classmethod
+    def use_data_dir(cls, data_dir):
+        """Guarda master, log, árvore e histórico em outro diretório; chamar antes do initialize"""
+        cls.BASE_DIR = Path(data_dir)
+        cls.BASE_DIR.mkdir(parents=True, exist_ok=True)
+        cls.MASTER_FILE = cls.BASE_DIR / 'master.txt'
+        cls.LOG_FILE = cls.BASE_DIR / 'sync.log'
+        cls.TREE_DIR = cls.BASE_DIR / 'tree'
+        cls.TREE_INDEX_FILE = cls.BASE_DIR / 'tree_index.json'
+        cls.HISTORY_DIR = cls.BASE_DIR / 'history'
+
     @classmethod
     def initialize(cls):
             # Cria master.txt com permissões adequadas
@@ -32,11 +88,12 @@ class FileHandler:
                 os.chmod(cls.MASTER_FILE, 0o644)
                 logging.info(f"Arquivo master criado em {cls.MASTER_FILE}")
             
-            # Inicializa log file como array JSON válido
+            # Log de sincronização em JSON Lines (append-only)
             if not cls.LOG_FILE.exists():
-                with open(cls.LOG_FILE, 'w', encoding='utf-8') as f:
-                    json.dump([], f)
+                cls.LOG_FILE.touch()
                 os.chmod(cls.LOG_FILE, 0o644)
+            else:
+                cls._migrate_legacy_log()
             
             # Configura usuários padrão
             if not cls.USERS_FILE.exists():
@@ -57,23 +114,148 @@ class FileHandler:
             logging.critical(f"FALHA NA INICIALIZAÇÃO: {str(e)}")
             raise
 
+    @staticmethod
+    def _key_of(st) -> Tuple[int, int, int]:
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    @classmethod
+    def _stat_key(cls) -> Tuple[int, int, int]:
+        try:
+            return cls._key_of(os.stat(cls.MASTER_FILE))
+        except FileNotFoundError:
+            cls.initialize()
+            return cls._key_of(os.stat(cls.MASTER_FILE))
+
+    @classmethod
+    def _store_snapshot(cls, key, content: Optional[bytes], digest: Optional[str] = None) -> Tuple[Optional[bytes], str]:
+        """Armazena conteúdo e hash para a chave informada; arquivos grandes guardam só o hash"""
+        if digest is None:
+            with HASH_SECONDS.time(('memory',)):
+                digest = cls._digest_content(content)
+        cached_content = content if content is not None and len(content) <= cls.CONTENT_CACHE_MAX else None
+        with cls._cache_lock:
+            previous = cls._cache
+            cls._cache = (key, cached_content, digest)
+        logging.debug(f"Cache de versão atualizado: {digest}")
+        if cls.SHARED_STATE is not None:
+            cls.SHARED_STATE.publish(key, digest)
+        
+        if previous is None or previous[2] != digest:
+            with cls._version_changed:
+                cls._version_changed.notify_all()
+                listeners = list(cls._listeners)
+            for listener in listeners:
+                listener(digest)
+        return content, digest
+
+    @classmethod
+    def _digest_content(cls, content: bytes) -> str:
+        if not is_tree(cls.DIGEST_ALGORITHM):
+            return hash_bytes(content, cls.DIGEST_ALGORITHM)
+        # Compara com o conteúdo anterior em cache e reaproveita as folhas dos blocos iguais
+        cached, leaves = cls._cache, cls._tree_leaves
+        previous = None
+        if cached is not None and cached[1] is not None and leaves is not None and leaves[0] == cached[2]:
+            previous = (cached[1], leaves[1])
+        digest, new_leaves = tree_hash(content, cls.DIGEST_ALGORITHM, previous)
+        cls._tree_leaves = (digest, new_leaves)
+        return digest
+
+    @classmethod
+    def _hash_stream(cls, f) -> str:
+        """Hash em blocos, com memória constante"""
+        with HASH_SECONDS.time(('stream',)):
+            return hash_stream(f, cls.DIGEST_ALGORITHM, cls.HASH_CHUNK_SIZE)
+
+    @classmethod
+    def _cached_digest(cls, key) -> Optional[str]:
+        cached = cls._cache
+        if cached is not None and cached[0] == key:
+            return cached[2]
+        shared = cls.SHARED_STATE.lookup(key) if cls.SHARED_STATE is not None else None
+        if shared is None or algorithm_of(shared) not in (None, cls.DIGEST_ALGORITHM):
+            return None
+        # Outro processo do servidor já hasheou este conteúdo
+        cls._store_snapshot(key, None, shared)
+        return shared
+
+    @classmethod
+    def get_snapshot(cls) -> Tuple[bytes, str]:
+        """Obtém (conteúdo, versão) consistentes, relendo o arquivo só se ele mudou"""
+        key = cls._stat_key()
+        cached = cls._cache
+        if cached is not None and cached[0] == key and cached[1] is not None:
+            return cached[1], cached[2]
+
+        with open(cls.MASTER_FILE, 'rb') as f:
+            content = f.read()
+            FILE_READS.inc()
+            FILE_READ_BYTES.inc(amount=len(content))
+            # Usa o stat do descritor aberto para que chave e conteúdo coincidam
+            key = cls._key_of(os.fstat(f.fileno()))
+        return cls._store_snapshot(key, content, cls._cached_digest(key))
+
+    @classmethod
+    def open_master(cls) -> Tuple[BinaryIO, int, str]:
+        """
+        Abre o master para envio em streaming
+        Retorna (arquivo posicionado no início, tamanho, versão do conteúdo aberto)
+        """
+        cls._stat_key()  # Garante que o master exista
+        f = open(cls.MASTER_FILE, 'rb')
+        try:
+            st = os.fstat(f.fileno())
+            key = cls._key_of(st)
+            digest = cls._cached_digest(key)
+            if digest is None:
+                digest = cls._hash_stream(f)
+                f.seek(0)
+                cls._store_snapshot(key, None, digest)
+            return f, st.st_size, digest
+        except Exception:
+            f.close()
+            raise
+
+    @classmethod
+    def get_compressed(cls, codec: str) -> Tuple[Optional[bytes], str]:
+        """
+        Conteúdo do master comprimido com codec, calculado uma vez por versão
+        Retorna (None, versão) para arquivos grandes demais para o cache
+        """
+        if cls._stat_key()[1] > cls.CONTENT_CACHE_MAX:
+            return None, cls.current_version()
+
+        content, version = cls.get_snapshot()
+        # Downloads simultâneos da mesma versão comprimem uma única vez
+        data = cls._compressed.get_or_build((version, codec), lambda: compress(codec, content))
+        return data, version
+
+    @classmethod
+    def current_version(cls) -> str:
+        """Versão atual; arquivos grandes são hasheados em blocos sem carregar o conteúdo"""
+        key = cls._stat_key()
+        digest = cls._cached_digest(key)
+        if digest is not None:
+            return digest
+        if key[1] <= cls.CONTENT_CACHE_MAX:
+            return cls.get_snapshot()[1]
+        f, _, digest = cls.open_master()
+        f.close()
+        return digest
+
+    @classmethod
+    def invalidate_cache(cls):
+        with cls._cache_lock:
+            cls._cache = None
+
     @classmethod
     def get_version(cls) -> str:
         """Obtém a versão atual com tratamento completo de erros"""
         try:
-            if not cls.MASTER_FILE.exists():
-                cls.initialize()
-                
-            file_size = os.path.getsize(cls.MASTER_FILE)
-            if file_size == 0:
+            version = cls.current_version()
+            if version == "empty_file":
                 logging.warning("Arquivo master.txt está vazio")
-                return "empty_file"
-                
-            with open(cls.MASTER_FILE, 'rb') as f:
-                content = f.read()
-                file_hash = hashlib.md5(content).hexdigest()
-                logging.debug(f"Hash calculado: {file_hash}")
-                return file_hash
+            return version
                 
         except PermissionError:
             logging.error("Permissão negada para ler master.txt")
@@ -82,75 +264,283 @@ class FileHandler:
             logging.error(f"ERRO NO GET_VERSION: {str(e)}")
             return "error"
 
+    @classmethod
+    def _cached_version(cls) -> Optional[str]:
+        cached = cls._cache
+        return cached[2] if cached is not None else None
+
+    @classmethod
+    def _watch_loop(cls):
+        """Verifica o master enquanto houver clientes aguardando uma nova versão"""
+        while True:
+            with cls._version_changed:
+                if cls._waiters == 0 and not cls._listeners:
+                    cls._watcher = None
+                    return
+            # current_version notifica os clientes se o arquivo mudou em disco
+            try:
+                cls.current_version()
+            except Exception as e:
+                logging.debug(f"Falha ao verificar master: {str(e)}")
+            time.sleep(cls.WATCH_INTERVAL)
+
+    @classmethod
+    def _ensure_watcher(cls):
+        # Deve ser chamado com _version_changed adquirido
+        if cls._watcher is None:
+            cls._watcher = threading.Thread(target=cls._watch_loop, daemon=True)
+            cls._watcher.start()
+
+    @classmethod
+    def add_version_listener(cls, listener):
+        """Registra um callback chamado com a nova versão sempre que o master mudar"""
+        with cls._version_changed:
+            cls._listeners.append(listener)
+            cls._ensure_watcher()
+
+    @classmethod
+    def remove_version_listener(cls, listener):
+        with cls._version_changed:
+            if listener in cls._listeners:
+                cls._listeners.remove(listener)
+
+    @classmethod
+    def wait_for_version(cls, since: Optional[str], timeout: float) -> Optional[str]:
+        """
+        Bloqueia até a versão ser diferente de since ou o timeout expirar
+        Retorna None sem esperar se já há MAX_WAITERS threads aguardando
+        """
+        version = cls.get_version()
+        if version != since:
+            return version
+        
+        deadline = time.monotonic() + max(0.0, min(timeout, cls.MAX_WAIT_TIMEOUT))
+        with cls._version_changed:
+            if cls.MAX_WAITERS is not None and cls._waiters >= cls.MAX_WAITERS:
+                return None
+            cls._waiters += 1
+            cls._ensure_watcher()
+            try:
+                while True:
+                    version = cls._cached_version() or version
+                    remaining = deadline - time.monotonic()
+                    if version != since or remaining <= 0:
+                        return version
+                    cls._version_changed.wait(remaining)
+            finally:
+                cls._waiters -= 1
+
     @classmethod
     def get_content(cls) -> Optional[str]:
         """Obtém o conteúdo do arquivo com tratamento de erros"""
         try:
-            if not cls.MASTER_FILE.exists():
-                cls.initialize()
-                
-            with open(cls.MASTER_FILE, 'r', encoding='utf-8') as f:
-                content = f.read()
-                return content if content else None
+            content, _ = cls.get_snapshot()
+            return content.decode('utf-8') if content else None
                 
         except Exception as e:
             logging.error(f"ERRO NO GET_CONTENT: {str(e)}")
             return None
 
     @classmethod
-    def log_sync(cls, auth_token: str, mode: str):
-        """Registra operações de sincronização de forma segura"""
+    def _migrate_legacy_log(cls):
+        """Converte o antigo sync.log (array JSON) para JSON Lines"""
+        with open(cls.LOG_FILE, 'r', encoding='utf-8') as f:
+            head = f.read(1)
+            if head != '[':
+                return
+            f.seek(0)
+            try:
+                entries = json.load(f)
+            except json.JSONDecodeError:
+                entries = []
+        temp_path = f"{cls.LOG_FILE}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(temp_path, cls.LOG_FILE)
+        logging.info(f"Log de sincronização migrado para JSON Lines ({len(entries)} entradas)")
+
+    @classmethod
+    def _audit(cls) -> AuditLog:
+        if cls._audit_log is None:
+            with cls._cache_lock:
+                if cls._audit_log is None:
+                    cls._audit_log = AuditLog(cls.LOG_FILE)
+        return cls._audit_log
+
+    @classmethod
+    def _tree(cls) -> TreeIndex:
+        if cls._tree_index is None:
+            with cls._cache_lock:
+                if cls._tree_index is None:
+                    cls._tree_index = TreeIndex(cls.TREE_DIR, cls.TREE_INDEX_FILE, cls.DIGEST_ALGORITHM)
+        return cls._tree_index
+
+    @classmethod
+    def _history(cls) -> HistoryStore:
+        if cls._history_store is None:
+            with cls._cache_lock:
+                if cls._history_store is None:
+                    cls._history_store = HistoryStore(cls.HISTORY_DIR)
+        return cls._history_store
+
+    @classmethod
+    def _record_current(cls, author: Optional[str] = None) -> str:
+        """Garante que a versão atual do master (inclusive edições externas) está no histórico"""
+        content, version = cls.get_snapshot()
+        latest = cls._history().latest()
+        if latest is None or latest['version'] != version:
+            cls._history().record(content, version, author)
+        return version
+
+    @classmethod
+    def adopt_version(cls, version: str, content: Optional[bytes] = None):
+        """
+        Publica uma versão já verificada por quem gravou o master (ex.: um relay),
+        sem rehashear o arquivo, e a guarda no histórico
+        """
+        algorithm = algorithm_of(version)
+        if algorithm is not None:
+            cls.DIGEST_ALGORITHM = algorithm
+        cls._store_snapshot(cls._stat_key(), content, version)
         try:
-            log_entry = {
-                'timestamp': datetime.now().isoformat(),
-                'auth_token': auth_token[:6] + '...',  # Reduz informação sensível
-                'mode': mode,
-                'status': 'success',
-                'client_ip': '127.0.0.1'
-            }
-            
-            # Cria backup do log atual
-            log_backup = cls.LOG_FILE.with_suffix('.bak')
-            if cls.LOG_FILE.exists():
-                os.replace(cls.LOG_FILE, log_backup)
-            
-            # Carrega logs existentes ou cria nova lista
-            logs = []
-            if log_backup.exists():
-                try:
-                    with open(log_backup, 'r', encoding='utf-8') as f:
-                        logs = json.load(f)
-                except json.JSONDecodeError:
-                    logs = []
-            
-            # Adiciona nova entrada e salva
-            logs.append(log_entry)
-            with open(cls.LOG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(logs, f, indent=2)
-                
+            cls._record_current()
+        except Exception as e:
+            logging.error(f"FALHA AO REGISTRAR HISTÓRICO: {str(e)}")
+
+    @classmethod
+    def list_versions(cls, limit: Optional[int] = None) -> list:
+        cls._record_current()
+        return cls._history().list_versions(limit)
+
+    @classmethod
+    def get_content_at(cls, version: str) -> bytes:
+        """Conteúdo do master numa versão retida no histórico"""
+        content, current = cls.get_snapshot()
+        if version == current:
+            return content
+        return cls._history().read(version)
+
+    @classmethod
+    def diff_versions(cls, from_version: str, to_version: Optional[str] = None) -> Tuple[list, int, str]:
+        """
+        Delta (formato de common.delta) que transforma from_version em to_version
+        (padrão: versão atual). Retorna (operações, tamanho de bloco, versão de destino)
+        """
+        if to_version is None:
+            target, to_version = cls.get_snapshot()
+        else:
+            target = cls.get_content_at(to_version)
+        base = cls.get_content_at(from_version)
+        block_size = choose_block_size(len(base))
+        return compute_delta(target, block_signatures(base, block_size), block_size, MAX_SCAN), block_size, to_version
+
+    @classmethod
+    def restore_version(cls, version: str) -> bool:
+        """Rollback: torna a versão do histórico o master atual"""
+        return cls.update_content(cls.get_content_at(version).decode('utf-8'))
+
+    @classmethod
+    def get_tree_manifest(cls, since: Optional[int] = None) -> dict:
+        """Manifesto (ou diff desde a versão since) da árvore em TREE_DIR"""
+        return cls._tree().manifest(since)
+
+    @classmethod
+    def open_tree_file(cls, rel_path: str) -> Tuple[BinaryIO, int, str]:
+        return cls._tree().open_file(rel_path)
+
+    @classmethod
+    def _log_entry(cls, auth_token: str, mode: str, version: Optional[str] = None, count: int = 1,
+                   confirmed_at: Optional[str] = None) -> dict:
+        entry = {
+            'timestamp': datetime.now().isoformat(),
+            'auth_token': str(auth_token)[:6] + '...',  # Reduz informação sensível
+            'mode': mode,
+            'status': 'success',
+            'client_ip': '127.0.0.1'
+        }
+        if version is not None:
+            entry['version'] = version
+        if count != 1:
+            # Confirmações da mesma versão agrupadas pelo cliente
+            entry['count'] = count
+        if confirmed_at is not None:
+            entry['confirmed_at'] = confirmed_at
+        return entry
+
+    @classmethod
+    def log_sync(cls, auth_token: str, mode: str, version: Optional[str] = None, confirmations=None):
+        """
+        Registra operações de sincronização no log append-only (escrita assíncrona)
+        confirmations: lista de {'protocol', 'version', 'count', 'last_at'} recebida
+        de uma vez; todas as entradas vão para o log na mesma escrita
+        """
+        try:
+            if confirmations is None:
+                cls._audit().append(cls._log_entry(auth_token, mode, version))
+                return
+            cls._audit().append_many(
+                cls._log_entry(auth_token, item['protocol'], item.get('version'), item.get('count', 1),
+                               item.get('last_at'))
+                for item in confirmations
+            )
         except Exception as e:
             logging.error(f"FALHA AO REGISTRAR LOG: {str(e)}")
 
     @classmethod
-    def update_content(cls, new_content: str) -> bool:
-        """Atualização segura do arquivo master com rollback"""
+    @contextmanager
+    def _master_write_lock(cls):
+        """
+        Serializa as atualizações do master entre threads e processos do servidor
+        (o .tmp e o .bak são compartilhados); cada chamada abre o próprio descritor,
+        então o flock também exclui threads do mesmo processo
+        """
+        with open(cls.BASE_DIR / 'master.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @classmethod
+    def update_content(cls, new_content: str, author: Optional[str] = None) -> bool:
+        """Atualização segura do arquivo master com rollback; versões ficam no histórico"""
+        with WRITE_SECONDS.time(), cls._master_write_lock():
+            success = cls._update_content(new_content, author)
+        FILE_WRITES.inc(('success' if success else 'failure',))
+        return success
+
+    @classmethod
+    def _update_content(cls, new_content: str, author: Optional[str] = None) -> bool:
+        backup_path = f"{cls.MASTER_FILE}.bak"
         try:
             if not isinstance(new_content, str):
                 raise ValueError("Conteúdo deve ser string")
+            
+            # A versão que será substituída também fica no histórico
+            try:
+                cls._record_current()
+            except Exception as e:
+                logging.error(f"FALHA AO REGISTRAR HISTÓRICO: {str(e)}")
                 
             temp_path = f"{cls.MASTER_FILE}.tmp"
-            backup_path = f"{cls.MASTER_FILE}.bak"
             
             # Cria backup
             if cls.MASTER_FILE.exists():
                 os.replace(cls.MASTER_FILE, backup_path)
             
             # Escreve novo conteúdo em arquivo temporário
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                f.write(new_content)
+            data = new_content.encode('utf-8')
+            with open(temp_path, 'wb') as f:
+                f.write(data)
             
-            # Substitui o arquivo original
+            # Substitui o arquivo original e já atualiza o cache de versão
             os.replace(temp_path, cls.MASTER_FILE)
+            _, version = cls._store_snapshot(cls._stat_key(), data)
+            try:
+                cls._history().record(data, version, author)
+            except Exception as e:
+                logging.error(f"FALHA AO REGISTRAR HISTÓRICO: {str(e)}")
             logging.info("Arquivo master atualizado com sucesso")
             return True
             
@@ -159,5 +549,6 @@ class FileHandler:
             # Tenta restaurar backup se existir
             if os.path.exists(backup_path):
                 os.replace(backup_path, cls.MASTER_FILE)
+                cls.invalidate_cache()
                 logging.warning("Rollback para versão anterior realizado")
             return False
\ No newline at end of file
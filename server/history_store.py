@@ -0,0 +1,250 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class VersionNotFound(LookupError):
+    """Versão inexistente ou já removida pela retenção"""
+
+
+class HistoryStore:
+    """
+    Histórico de versões do master endereçado por conteúdo
+
+    Cada versão é um manifesto com a lista de blocos que a compõem; blocos
+    são gravados uma única vez em chunks/<hash> e compartilhados entre
+    versões (copy-on-write). Os cortes são definidos pelo conteúdo: uma quebra
+    de linha vira corte conforme o hash da linha que ela encerra, e não pela
+    distância até o corte anterior. Inserções e remoções só mudam os blocos
+    ao redor delas; os cortes seguintes continuam nos mesmos lugares.
+    A retenção é limitada por número de versões e por bytes em disco; blocos
+    sem referência são removidos pela coleta de lixo.
+
+    Vários processos do servidor (--processes) podem compartilhar o mesmo
+    diretório: toda operação trava o arquivo .lock com flock (exclusivo para
+    gravar, compartilhado para ler) e recarrega o índice se outro processo
+    o regravou, então a sequência e as referências dos blocos vêm sempre do disco.
+    """
+    MIN_CHUNK = 2 * 1024
+    # Tamanho médio acima de MIN_CHUNK, independente do comprimento das linhas
+    AVG_CHUNK = 8 * 1024
+    MAX_CHUNK = 64 * 1024
+    # Bytes antes da quebra de linha que decidem o corte
+    CUT_WINDOW = 64
+
+    def __init__(self, root: Path, max_versions=50, max_bytes=256 * 1024 * 1024):
+        self.root = Path(root)
+        self.chunks_dir = self.root / 'chunks'
+        self.manifests_dir = self.root / 'manifests'
+        self.index_file = self.root / 'index.json'
+        self.max_versions = max_versions
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._versions: List[dict] = []
+        self._refs: Dict[str, int] = {}
+        self._sizes: Dict[str, int] = {}
+        self._next_seq = 1
+        # (inode, tamanho, mtime_ns) do índice carregado; outro valor no disco indica gravação de outro processo
+        self._index_key = None
+        self.chunks_dir.mkdir(parents=True, exist_ok=True)
+        self.manifests_dir.mkdir(parents=True, exist_ok=True)
+        self._lock_fd = os.open(self.root / '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _stat_index(self):
+        try:
+            st = os.stat(self.index_file)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _load(self):
+        self._index_key = self._stat_index()
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                self._versions = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._versions = []
+        self._refs, self._sizes = {}, {}
+        for entry in self._versions:
+            for chunk_id in self._manifest(entry['seq']):
+                self._ref(chunk_id)
+        self._next_seq = self._versions[-1]['seq'] + 1 if self._versions else 1
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        """Lock entre threads e entre processos; recarrega o índice se mudou no disco"""
+        with self._lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                if self._stat_index() != self._index_key:
+                    self._load()
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _save_index(self):
+        temp_path = f"{self.index_file}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._versions, f)
+        os.replace(temp_path, self.index_file)
+        self._index_key = self._stat_index()
+
+    def _chunk_path(self, chunk_id: str) -> Path:
+        return self.chunks_dir / chunk_id[:2] / chunk_id[2:]
+
+    def _manifest_path(self, seq: int) -> Path:
+        return self.manifests_dir / f"{seq}.json"
+
+    def _manifest(self, seq: int) -> List[str]:
+        with open(self._manifest_path(seq), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _ref(self, chunk_id: str):
+        if chunk_id not in self._refs:
+            self._refs[chunk_id] = 0
+            try:
+                self._sizes[chunk_id] = self._chunk_path(chunk_id).stat().st_size
+            except FileNotFoundError:
+                self._sizes[chunk_id] = 0
+        self._refs[chunk_id] += 1
+
+    def _split(self, data: bytes):
+        """
+        Divide em blocos com cortes definidos pelo conteúdo
+        Cada quebra de linha após MIN_CHUNK é candidata; o CRC-32 dos CUT_WINDOW
+        bytes que a antecedem decide o corte, com probabilidade proporcional ao
+        comprimento da linha (média de AVG_CHUNK bytes entre cortes). Trechos sem
+        quebra de linha são cortados em MAX_CHUNK.
+        """
+        start, length = 0, len(data)
+        while start < length:
+            limit = min(length, start + self.MAX_CHUNK)
+            end = limit
+            pos = data.find(b'\n', start + self.MIN_CHUNK - 1, limit)
+            while pos != -1:
+                line_start = data.rfind(b'\n', max(0, pos - self.MAX_CHUNK), pos) + 1
+                checksum = zlib.crc32(data[max(0, pos - self.CUT_WINDOW):pos + 1])
+                if checksum * self.AVG_CHUNK < (pos + 1 - line_start) << 32:
+                    end = pos + 1
+                    break
+                pos = data.find(b'\n', pos + 1, limit)
+            yield data[start:end]
+            start = end
+
+    def _write_chunk(self, chunk: bytes) -> str:
+        chunk_id = hashlib.blake2b(chunk, digest_size=20).hexdigest()
+        path = self._chunk_path(chunk_id)
+        if chunk_id not in self._refs and not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(chunk)
+            os.replace(temp_path, path)
+        return chunk_id
+
+    def _find(self, version: str) -> Optional[dict]:
+        for entry in reversed(self._versions):
+            if entry['version'] == version:
+                return entry
+        return None
+
+    def latest(self) -> Optional[dict]:
+        with self._locked():
+            return dict(self._versions[-1]) if self._versions else None
+
+    def record(self, data: bytes, version: str, author: Optional[str] = None) -> dict:
+        """Registra uma versão; se já for a mais recente, nada é gravado"""
+        with self._locked(exclusive=True):
+            if self._versions and self._versions[-1]['version'] == version:
+                return dict(self._versions[-1])
+
+            chunk_ids = [self._write_chunk(chunk) for chunk in self._split(data)]
+            seq = self._next_seq
+            temp_path = f"{self._manifest_path(seq)}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(chunk_ids, f)
+            os.replace(temp_path, self._manifest_path(seq))
+            for chunk_id in chunk_ids:
+                self._ref(chunk_id)
+
+            entry = {
+                'seq': seq,
+                'version': version,
+                'size': len(data),
+                'timestamp': datetime.now().isoformat(),
+                'author': author
+            }
+            self._versions.append(entry)
+            self._next_seq += 1
+            self._enforce_retention()
+            self._save_index()
+            return dict(entry)
+
+    def _stored_bytes(self) -> int:
+        return sum(self._sizes[chunk_id] for chunk_id in self._refs)
+
+    def _enforce_retention(self):
+        # Deve ser chamado com _locked(exclusive=True); a versão mais recente nunca é removida
+        removed = []
+        while len(self._versions) > 1 and (
+                len(self._versions) > self.max_versions or self._stored_bytes() > self.max_bytes):
+            entry = self._versions.pop(0)
+            for chunk_id in self._manifest(entry['seq']):
+                self._refs[chunk_id] -= 1
+            removed.append(entry['seq'])
+        if removed:
+            self._collect_garbage(removed)
+
+    def _collect_garbage(self, removed_seqs):
+        for seq in removed_seqs:
+            try:
+                self._manifest_path(seq).unlink()
+            except FileNotFoundError:
+                pass
+        for chunk_id in [c for c, refs in self._refs.items() if refs <= 0]:
+            del self._refs[chunk_id]
+            self._sizes.pop(chunk_id, None)
+            try:
+                self._chunk_path(chunk_id).unlink()
+            except FileNotFoundError:
+                pass
+        logging.info(f"Histórico: {len(removed_seqs)} versões antigas removidas")
+
+    def list_versions(self, limit: Optional[int] = None) -> List[dict]:
+        """Versões retidas, da mais recente para a mais antiga"""
+        with self._locked():
+            versions = [dict(entry) for entry in reversed(self._versions)]
+        return versions[:limit] if limit else versions
+
+    def read(self, version: str) -> bytes:
+        with self._locked():
+            entry = self._find(version)
+            if entry is None:
+                raise VersionNotFound(f"Versão não encontrada no histórico: {version}")
+            chunk_ids = self._manifest(entry['seq'])
+            parts = []
+            for chunk_id in chunk_ids:
+                with open(self._chunk_path(chunk_id), 'rb') as f:
+                    parts.append(f.read())
+        return b''.join(parts)
+
+    def contains(self, version: str) -> bool:
+        with self._locked():
+            return self._find(version) is not None
+
+    def stats(self) -> dict:
+        with self._locked():
+            return {
+                'versions': len(self._versions),
+                'chunks': len(self._refs),
+                'bytes': self._stored_bytes(),
+                'logical_bytes': sum(entry['size'] for entry in self._versions)
+            }
@@ -0,0 +1,247 @@
+"""
+Logging assíncrono do servidor
+
+As threads que atendem requisições só colocam o registro numa fila limitada
+(QueueHandler); a formatação e a escrita acontecem numa thread de fundo
+(QueueListener), que grava os registros acumulados em lote, com uma escrita
+por arquivo. Com a fila cheia, registros abaixo de WARNING são descartados
+na hora e os demais esperam um instante antes de serem descartados; os
+descartes são contados em log_records_dropped_total e avisados no log.
+
+Os logs por requisição vão para um logger próprio (rmi.requests), em JSON
+Lines, com o nível de detalhe configurável: off, errors, sampled ou all.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import threading
+import traceback
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from common.metrics import REGISTRY
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_QUEUE_SIZE = 10000
+REQUEST_LOGGER = 'rmi.requests'
+REQUEST_LOG_MODES = ('off', 'errors', 'sampled', 'all')
+
+LOG_DROPPED = REGISTRY.counter('log_records_dropped_total', 'Registros de log descartados com a fila cheia', ('level',))
+
+
+class _BatchMixin:
+    """Acumula as linhas formatadas; flush() grava o lote numa única escrita"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending = []
+
+    def emit(self, record):
+        try:
+            self._pending.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        with self.lock:
+            if not self._pending or self.stream is None:
+                return
+            data, self._pending = ''.join(self._pending), []
+            try:
+                self.stream.write(data)
+                self.stream.flush()
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc()
+
+
+class BatchStreamHandler(_BatchMixin, logging.StreamHandler):
+    pass
+
+
+class BatchFileHandler(_BatchMixin, logging.FileHandler):
+    def __init__(self, filename, mode='a', encoding='utf-8'):
+        super().__init__(filename, mode, encoding)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler que não bloqueia a requisição quando a fila está cheia"""
+    # Segundos que um WARNING ou acima espera por espaço antes de ser descartado
+    BLOCK_TIMEOUT = 0.05
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Fila em memória, sem pickle: a formatação fica para a thread de fundo
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if record.levelno >= logging.WARNING:
+            try:
+                self.queue.put(record, timeout=self.BLOCK_TIMEOUT)
+                return
+            except queue.Full:
+                pass
+        LOG_DROPPED.inc((record.levelname,))
+        with self._dropped_lock:
+            self._dropped += 1
+
+    def take_dropped(self) -> int:
+        with self._dropped_lock:
+            dropped, self._dropped = self._dropped, 0
+        return dropped
+
+
+class BatchQueueListener(QueueListener):
+    """
+    Esvazia a fila e grava em lote: os handlers são descarregados quando a
+    fila fica vazia ou a cada BATCH_SIZE registros
+    """
+    BATCH_SIZE = 256
+
+    def __init__(self, log_queue, source: DroppingQueueHandler, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.source = source
+        self._batch = 0
+
+    def dequeue(self, block):
+        if self._batch >= self.BATCH_SIZE:
+            self.flush()
+        try:
+            record = self.queue.get_nowait()
+        except queue.Empty:
+            # Fila vazia: grava o lote antes de esperar o próximo registro
+            self.flush()
+            record = self.queue.get(block)
+        self._batch += 1
+        return record
+
+    def flush(self):
+        self._batch = 0
+        dropped = self.source.take_dropped()
+        if dropped:
+            self.handle(logging.makeLogRecord({
+                'name': 'root',
+                'levelno': logging.WARNING,
+                'levelname': 'WARNING',
+                'msg': f"{dropped} registros de log descartados (fila cheia)"
+            }))
+        for handler in self.handlers:
+            handler.flush()
+
+    def stop(self):
+        super().stop()
+        self.flush()
+
+
+class RequestLog:
+    """
+    Log estruturado das requisições RMI (uma linha JSON por requisição)
+
+    off: nada; errors: só respostas >= 400 e requisições lentas;
+    sampled: erros e lentas sempre, as demais com probabilidade sample_rate;
+    all: todas. Registros de requisições bem-sucedidas usam DEBUG, então
+    sampled com uma taxa baixa equivale a um debug amostrado.
+    """
+    SLOW_SECONDS = 1.0
+
+    def __init__(self):
+        self.logger = logging.getLogger(REQUEST_LOGGER)
+        self.logger.propagate = False
+        self.mode = 'off'
+        self.sample_rate = 1.0
+
+    def configure(self, mode: str = 'all', sample_rate: float = 1.0, slow_seconds: Optional[float] = None):
+        if mode not in REQUEST_LOG_MODES:
+            raise ValueError(f"Modo de log de requisições inválido: {mode}")
+        self.mode = mode
+        self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+        if slow_seconds is not None:
+            self.SLOW_SECONDS = slow_seconds
+
+    def record(self, method: str, status: int, duration: float):
+        mode = self.mode
+        if mode == 'off':
+            return
+        notable = status >= 400 or duration >= self.SLOW_SECONDS
+        if not notable:
+            if mode == 'errors' or (mode == 'sampled' and random.random() >= self.sample_rate):
+                return
+        entry = {'method': method, 'status': status, 'ms': round(duration * 1000, 3)}
+        if mode == 'sampled' and not notable:
+            entry['sample_rate'] = self.sample_rate
+        self.logger.log(logging.WARNING if notable else logging.DEBUG, '', extra={'request': entry})
+
+
+class RequestFormatter(logging.Formatter):
+    def format(self, record):
+        entry = getattr(record, 'request', None) or {'message': record.getMessage()}
+        return json.dumps({'timestamp': datetime.fromtimestamp(record.created).isoformat(), **entry})
+
+
+REQUEST_LOG = RequestLog()
+
+_listener: Optional[BatchQueueListener] = None
+
+
+def configure_logging(log_file='server.log', level=logging.INFO, request_log='all', request_sample=1.0,
+                      request_log_file='requests.log', queue_size=LOG_QUEUE_SIZE):
+    """
+    Instala a fila de log no logger raiz e no de requisições e inicia a thread de gravação
+    Pode ser chamada de novo: a configuração anterior é encerrada e substituída
+    """
+    global _listener
+    shutdown_logging()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    server_handlers = [BatchFileHandler(log_file), BatchStreamHandler()]
+    for handler in server_handlers:
+        handler.setFormatter(formatter)
+    request_handler = BatchFileHandler(request_log_file)
+    request_handler.setFormatter(RequestFormatter())
+    # O listener entrega cada registro a todos os handlers; o filtro separa os dois destinos
+    request_handler.addFilter(lambda record: record.name == REQUEST_LOGGER)
+    for handler in server_handlers:
+        handler.addFilter(lambda record: record.name != REQUEST_LOGGER)
+
+    log_queue = queue.Queue(queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    REGISTRY.gauge('log_queue_size', 'Registros aguardando gravação', function=log_queue.qsize)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    REQUEST_LOG.configure(request_log, request_sample)
+    REQUEST_LOG.logger.handlers = [queue_handler]
+    REQUEST_LOG.logger.setLevel(logging.DEBUG)
+
+    _listener = BatchQueueListener(log_queue, queue_handler, *server_handlers, request_handler)
+    _listener.start()
+    return _listener
+
+
+@atexit.register
+def shutdown_logging():
+    """Grava o que estiver na fila e encerra a thread de log"""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is None:
+        return
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
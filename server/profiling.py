@@ -0,0 +1,101 @@
+import cProfile
+import io
+import itertools
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+
+class RuntimeProfiler:
+    """
+    cProfile e tracemalloc ligados e desligados em tempo de execução (método remoto profiling)
+
+    O cProfile só mede a thread em que foi ativado, então cada requisição
+    amostrada ganha um perfil próprio, somado a um único pstats.Stats assim
+    que a requisição termina: a memória não cresce com o número de amostras.
+    sample_every=N perfila 1 a cada N requisições para limitar o custo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Soma dos perfis amostrados desde start_cpu (None até a primeira amostra)
+        self._stats = None
+        self._samples = 0
+        self._counter = itertools.count()
+        self.cpu_enabled = False
+        self.sample_every = 1
+
+    @contextmanager
+    def request(self):
+        if not self.cpu_enabled or next(self._counter) % self.sample_every:
+            yield
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Outro profiler já ativo nesta thread
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            # Converter o perfil é a parte cara; fora do lock
+            sample = pstats.Stats(profile)
+            with self._lock:
+                if self._stats is None:
+                    self._stats = sample
+                else:
+                    self._stats.add(sample)
+                self._samples += 1
+
+    def start_cpu(self, sample_every: int = 1):
+        with self._lock:
+            self._stats = None
+            self._samples = 0
+            self.sample_every = max(1, int(sample_every))
+            self.cpu_enabled = True
+
+    def stop_cpu(self):
+        self.cpu_enabled = False
+
+    def cpu_report(self, top: int = 30) -> str:
+        output = io.StringIO()
+        with self._lock:
+            if self._stats is None:
+                return ''
+            self._stats.stream = output
+            self._stats.sort_stats('cumulative').print_stats(top)
+            samples = self._samples
+        return f"{samples} requisições amostradas\n" + output.getvalue()
+
+    @staticmethod
+    def start_memory(frames: int = 10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    @staticmethod
+    def stop_memory():
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @staticmethod
+    def memory_report(top: int = 30) -> list:
+        if not tracemalloc.is_tracing():
+            return []
+        current, peak = tracemalloc.get_traced_memory()
+        statistics = tracemalloc.take_snapshot().statistics('lineno')[:top]
+        return [f"atual={current} pico={peak}"] + [str(stat) for stat in statistics]
+
+    def status(self) -> dict:
+        return {
+            'cpu': self.cpu_enabled,
+            'sample_every': self.sample_every,
+            'samples': self._samples,
+            'memory': tracemalloc.is_tracing()
+        }
+
+
+PROFILER = RuntimeProfiler()
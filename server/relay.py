@@ -0,0 +1,147 @@
+"""
+Relay (nó de borda): replica o master de um servidor de origem e o serve localmente
+
+O relay é um cliente da origem (FileSyncStub + SyncMonitor em long-poll)
+cujo "slave" é o próprio master local. Cada versão nova é buscada uma única
+vez, pelo monitor, e então servida pelo dispatcher a todos os clientes
+locais, com o mesmo ETag da origem. Escritas (update_master_file,
+restore_version) são repassadas à origem com o token de quem chamou.
+
+Uso: python -m server.relay --port 8101 --upstream http://localhost:8000 --user admin --password admin123
+Relays podem ser encadeados apontando --upstream para outro relay.
+"""
+import argparse
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from client.stub import FileSyncStub
+from client.sync_monitor import SyncMonitor
+from server.dispatcher import RequestDispatcher, USER_KEY
+from server.file_handler import FileHandler
+from server.history_store import VersionNotFound
+from server.server_main import run_server
+
+
+class RelayMonitor(SyncMonitor):
+    """Mantém o master local igual ao da origem e publica cada versão ao FileHandler"""
+
+    def __init__(self, stub, interval=5):
+        super().__init__(stub, 'R', interval, long_poll=True, slave_file=FileHandler.MASTER_FILE)
+        self.fetches = 0
+        # Long-poll e escritas repassadas podem disparar ciclos simultâneos
+        self._lock = threading.Lock()
+
+    def _sync_file(self, remote_version=None):
+        with self._lock:
+            super()._sync_file(remote_version)
+
+    def _write_slave(self, data: bytes, version=None):
+        super()._write_slave(data, version)
+        self.fetches += 1
+        FileHandler.adopt_version(self._state['version'], data)
+
+    def _record_download(self, version):
+        super()._record_download(version)
+        self.fetches += 1
+        FileHandler.adopt_version(version)
+
+    def stats(self) -> dict:
+        return {
+            'upstream': self.stub.server_url,
+            'version': self._state.get('version'),
+            'upstream_fetches': self.fetches
+        }
+
+
+class RelayRequestDispatcher(RequestDispatcher):
+    """Dispatcher HTTP do relay: leituras locais, escritas repassadas à origem"""
+    # Definido por run_relay
+    MONITOR = None
+
+    def _forward(self, method_name, request_data, **params):
+        # A origem autentica e autoriza com o token original do cliente
+        response = self.MONITOR.stub._make_request(method_name, auth_token=request_data.get('auth_token'), **params)
+        if response.get('status') != 'success':
+            message = response.get('message', 'Falha na origem')
+            if response.get('code') == 'FORBIDDEN':
+                raise PermissionError(message)
+            if response.get('code') == 'VERSION_NOT_FOUND':
+                raise VersionNotFound(message)
+            raise RuntimeError(message)
+        # Busca a nova versão já, sem esperar o próximo long-poll
+        self.MONITOR._sync_file()
+        return response
+
+    def _handle_update_file(self, request_data):
+        try:
+            if not request_data[USER_KEY].admin:
+                raise PermissionError("Acesso administrativo requerido")
+            if not isinstance(request_data.get('new_content'), str):
+                raise TypeError("Conteúdo deve ser uma string")
+            self._forward('update_master_file', request_data, new_content=request_data['new_content'])
+            return {
+                'status': 'success',
+                'updated_at': datetime.now().isoformat()
+            }
+        except Exception as e:
+            logging.error(f"Erro no _handle_update_file (relay): {str(e)}")
+            raise
+
+    def _handle_restore_version(self, request_data):
+        try:
+            if not request_data[USER_KEY].admin:
+                raise PermissionError("Acesso administrativo requerido")
+            self._forward('restore_version', request_data, version=request_data.get('version'))
+            return {
+                'status': 'success',
+                'version': FileHandler.get_version(),
+                'updated_at': datetime.now().isoformat()
+            }
+        except Exception as e:
+            logging.error(f"Erro no _handle_restore_version (relay): {str(e)}")
+            raise
+
+    def _handle_server_stats(self, request_data):
+        response = super()._handle_server_stats(request_data)
+        response['relay'] = self.MONITOR.stats()
+        return response
+
+
+def run_relay(upstream, username, password, host='localhost', port=8100, data_dir=None,
+              workers=None, queue_size=64, interval=5):
+    FileHandler.use_data_dir(data_dir or Path('relay_data') / str(port))
+    stub = FileSyncStub(upstream, username, password)
+    monitor = RelayMonitor(stub, interval)
+    RelayRequestDispatcher.MONITOR = monitor
+
+    # Primeira sincronização antes de aceitar clientes; depois, long-poll na origem
+    monitor._sync_file()
+    monitor.start()
+    try:
+        run_server(host, port, workers, queue_size, digest=FileHandler.DIGEST_ALGORITHM,
+                   handler_class=RelayRequestDispatcher)
+    finally:
+        monitor.running = False
+        stub.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay de sincronização de arquivos RMI")
+    parser.add_argument('--upstream', default='http://localhost:8000', help='Servidor de origem (ou outro relay)')
+    parser.add_argument('--user', required=True, help='Usuário na origem')
+    parser.add_argument('--password', required=True, help='Senha na origem')
+    parser.add_argument('--host', default='localhost', help='Endereço de escuta')
+    parser.add_argument('--port', type=int, default=8100, help='Porta de escuta')
+    parser.add_argument('--data-dir', help='Diretório do cache local (padrão: relay_data/<porta>)')
+    parser.add_argument('--workers', type=int, default=None, help='Número de workers do pool')
+    parser.add_argument('--queue-size', type=int, default=64, help='Tamanho máximo da fila de conexões')
+    parser.add_argument('--interval', type=int, default=5, help='Espera após falha de comunicação com a origem')
+
+    args = parser.parse_args()
+    run_relay(args.upstream, args.user, args.password, args.host, args.port, args.data_dir,
+              args.workers, args.queue_size, args.interval)
+
+
+if __name__ == '__main__':
+    main()
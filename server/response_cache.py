@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class _Build:
+    """Construção em andamento; outras threads com a mesma chave aguardam o resultado"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    Cache LRU de corpos de resposta já serializados, limitado em bytes
+
+    Chamadas concorrentes para uma chave ausente são coalescidas: apenas a
+    primeira executa build, as demais esperam e recebem o mesmo objeto.
+    Valores maiores que max_bytes são entregues mas não ficam no cache.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._building = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+
+    def get_or_build(self, key: Hashable, build: Callable[[], bytes]) -> bytes:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return value
+            pending = self._building.get(key)
+            if pending is None:
+                pending = self._building[key] = _Build()
+                owner = True
+                self._misses += 1
+            else:
+                owner = False
+                self._coalesced += 1
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            pending.value = build()
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._building[key]
+                if pending.error is None:
+                    self._store(key, pending.value)
+            pending.done.set()
+        return pending.value
+
+    def _store(self, key, value: bytes):
+        # Deve ser chamado com _lock adquirido
+        if len(value) > self.max_bytes:
+            return
+        self._entries[key] = value
+        self._size += len(value)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'coalesced': self._coalesced
+            }
@@ -1,27 +1,143 @@
+import argparse
+import asyncio
+import json
 from http.server import HTTPServer
-from server.dispatcher import RequestDispatcher
+from server.async_server import AsyncRMIServer
+from server.binary_server import BinaryRMIServer
+from server.dispatcher import RemoteMethods, RequestDispatcher
+from server.threads import IdleConnections, WorkerPool
 import logging
 from server.file_handler import FileHandler
+from server.log_pipeline import REQUEST_LOG_MODES, configure_logging
+from server.shared_state import SharedVersionState
+from server.supervisor import Supervisor
+from common.digest import DEFAULT_ALGORITHM, available_algorithms
+import os
+import secrets
 import socket
+import threading
 
 class MyHTTPServer(HTTPServer):
     """Classe customizada para melhor controle do servidor HTTP"""
-    def __init__(self, server_address, RequestHandlerClass):
+    # Segundos sugeridos ao cliente quando a fila está cheia
+    RETRY_AFTER = 1
+    # Conexão keep-alive ociosa por mais que isso é fechada (o pool do cliente descarta as suas em 10 s)
+    KEEP_ALIVE_TIMEOUT = 30
+
+    def __init__(self, server_address, RequestHandlerClass, workers=None, queue_size=64, reuse_port=False):
+        # SO_REUSEPORT: vários processos escutam na mesma porta e o kernel distribui as conexões
+        self.reuse_port = reuse_port
         super().__init__(server_address, RequestHandlerClass)
         self.request_queue_size = 20
-        self.timeout = 60 
-        self.max_packet_size = 8192 
-
-def run_server():
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('server.log'),
-            logging.StreamHandler()
-        ]
-    )
+        self.timeout = 60
+        self.max_packet_size = 8192
+        self.worker_pool = WorkerPool(self._process_in_worker, workers, queue_size)
+        self.worker_pool.start()
+        self.idle_connections = IdleConnections(self._submit, self._close_handler, self.KEEP_ALIVE_TIMEOUT)
+        self.idle_connections.start()
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        # Cada requisição (não a conexão inteira) ocupa um worker. A conexão nova e,
+        # entre requisições, a keep-alive esperam em IdleConnections sem prender uma
+        # thread; só vão ao pool quando há bytes para ler
+        handler = self.RequestHandlerClass.__new__(self.RequestHandlerClass)
+        handler.request, handler.client_address, handler.server = request, client_address, self
+        handler.setup()
+        self.idle_connections.park(request, handler)
+
+    def _submit(self, handler):
+        if not self.worker_pool.submit(handler):
+            logging.warning(f"Fila cheia, rejeitando conexão de {handler.client_address[0]}")
+            self._close_handler(handler, reject=True)
+
+    def _process_in_worker(self, handler):
+        try:
+            handler.handle_one_request()
+        except Exception:
+            self.handle_error(handler.request, handler.client_address)
+            handler.close_connection = True
+        if handler.close_connection:
+            self._close_handler(handler)
+        elif self._has_buffered_request(handler):
+            # Requisições em pipeline já lidas para o buffer não disparam o selector
+            self._submit(handler)
+        else:
+            self.idle_connections.park(handler.request, handler)
+
+    @staticmethod
+    def _has_buffered_request(handler) -> bool:
+        """Há bytes no buffer do rfile ou no socket? (sem bloquear)"""
+        sock = handler.request
+        try:
+            sock.setblocking(False)
+            return bool(handler.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            try:
+                sock.settimeout(handler.timeout)
+            except OSError:
+                pass
+
+    def _close_handler(self, handler, reject=False):
+        try:
+            handler.finish()
+        except Exception:
+            pass
+        if reject:
+            self._reject(handler.request)
+        else:
+            self.shutdown_request(handler.request)
 
+    def _reject(self, request):
+        body = json.dumps({
+            'status': 'error',
+            'code': 'SERVER_BUSY',
+            'message': 'Servidor sobrecarregado, tente novamente'
+        }).encode('utf-8')
+        head = (
+            "HTTP/1.1 503 Service Unavailable\r\n"
+            f"Retry-After: {self.RETRY_AFTER}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode('ascii')
+        try:
+            request.sendall(head + body)
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def stats(self) -> dict:
+        return {**self.worker_pool.stats(), 'idle_connections': len(self.idle_connections)}
+
+    def server_close(self):
+        super().server_close()
+        self.idle_connections.close()
+        self.worker_pool.shutdown(wait=False)
+
+def start_binary_server(host, port, reuse_port=False):
+    """Protocolo binário num loop asyncio próprio, ao lado do servidor HTTP"""
+    server = BinaryRMIServer(host, port, reuse_port)
+    RemoteMethods.BINARY_PORT = port
+    threading.Thread(target=asyncio.run, args=(server.serve_forever(),), daemon=True,
+                     name='binary-server').start()
+    return server
+
+def run_server(host='localhost', port=8000, workers=None, queue_size=64, use_async=False,
+               digest=DEFAULT_ALGORITHM, binary_port=None, handler_class=RequestDispatcher,
+               reuse_port=False, shared_state=None, log_level='INFO', request_log='all', request_sample=1.0):
+    configure_logging(level=log_level, request_log=request_log, request_sample=request_sample)
+
+    FileHandler.DIGEST_ALGORITHM = digest
+    if shared_state:
+        FileHandler.SHARED_STATE = SharedVersionState(shared_state)
     try:
         FileHandler.initialize()
         logging.info("Arquivos do servidor inicializados com sucesso")
@@ -29,13 +145,28 @@ def run_server():
         logging.critical(f"Falha na inicialização: {e}")
         return
 
-    server_address = ('localhost', 8000)
-    
+    if binary_port:
+        start_binary_server(host, binary_port, reuse_port)
+
+    if use_async:
+        try:
+            asyncio.run(AsyncRMIServer(host, port, reuse_port).serve_forever())
+        except KeyboardInterrupt:
+            logging.info("\nEncerrando servidor graciosamente...")
+        finally:
+            logging.info("Servidor encerrado")
+        return
+
+    server_address = (host, port)
+    httpd = None
+
     try:
-        httpd = MyHTTPServer(server_address, RequestDispatcher)
+        httpd = MyHTTPServer(server_address, handler_class, workers, queue_size, reuse_port)
+        # Long-polls prendem um worker cada: no máximo metade do pool espera em wait_for_version
+        FileHandler.MAX_WAITERS = max(1, httpd.worker_pool.workers // 2)
         # Configuração adicional do socket
         httpd.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
+
         logging.info(f"Servidor RMI rodando em http://{server_address[0]}:{server_address[1]}")
         logging.info("Pressione Ctrl+C para encerrar...")
 
@@ -45,8 +176,62 @@ def run_server():
     except Exception as e:
         logging.critical(f"Erro fatal no servidor: {e}")
     finally:
-        httpd.server_close()
+        if httpd:
+            httpd.server_close()
         logging.info("Servidor encerrado")
 
+def run_multiprocess(processes, **server_kwargs):
+    """
+    N processos do servidor na mesma porta (SO_REUSEPORT), sob um supervisor
+    A versão do master é compartilhada por um arquivo mapeado em memória:
+    só o processo que vê a mudança primeiro hasheia o arquivo
+    """
+    configure_logging(level=server_kwargs.get('log_level', 'INFO'), request_log='off')
+    try:
+        FileHandler.initialize()
+    except Exception as e:
+        logging.critical(f"Falha na inicialização: {e}")
+        return
+    # Sessões abertas num processo precisam ser aceitas pelos demais
+    os.environ.setdefault('RMI_SESSION_SECRET', secrets.token_hex(32))
+    state_path = FileHandler.BASE_DIR / 'version_state.bin'
+    state = SharedVersionState(state_path)
+    state.reset()
+    state.close()
+
+    logging.info(f"Iniciando {processes} processos do servidor na porta {server_kwargs.get('port')}")
+    Supervisor(run_server, {**server_kwargs, 'reuse_port': True, 'shared_state': str(state_path)}, processes).run()
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de sincronização de arquivos RMI")
+    parser.add_argument('--host', default='localhost', help='Endereço de escuta')
+    parser.add_argument('--port', type=int, default=8000, help='Porta de escuta')
+    parser.add_argument('--workers', type=int, default=None, help='Número de workers do pool')
+    parser.add_argument('--queue-size', type=int, default=64, help='Tamanho máximo da fila de conexões')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Usa o servidor asyncio')
+    parser.add_argument('--digest', choices=available_algorithms(), default=DEFAULT_ALGORITHM,
+                        help='Algoritmo de hash das versões')
+    parser.add_argument('--binary-port', type=int, default=None,
+                        help='Porta do protocolo binário (desativado se omitida)')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Processos do servidor na mesma porta, reiniciados por um supervisor')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO',
+                        help='Nível do log do servidor')
+    parser.add_argument('--request-log', choices=REQUEST_LOG_MODES, default='all',
+                        help='Log por requisição (requests.log): off, errors, sampled ou all')
+    parser.add_argument('--request-sample', type=float, default=0.01,
+                        help='Fração das requisições bem-sucedidas registradas com --request-log sampled')
+
+    args = parser.parse_args()
+    if args.processes > 1:
+        run_multiprocess(args.processes, host=args.host, port=args.port, workers=args.workers,
+                         queue_size=args.queue_size, use_async=args.use_async, digest=args.digest,
+                         binary_port=args.binary_port, log_level=args.log_level,
+                         request_log=args.request_log, request_sample=args.request_sample)
+        return
+    run_server(args.host, args.port, args.workers, args.queue_size, args.use_async, args.digest,
+               args.binary_port, log_level=args.log_level, request_log=args.request_log,
+               request_sample=args.request_sample)
+
 if __name__ == '__main__':
-    run_server()
\ No newline at end of file
+    main()
@@ -0,0 +1,81 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+
+class SharedVersionState:
+    """
+    Versão do master compartilhada entre os processos do servidor
+
+    Um arquivo mapeado em memória guarda a chave de stat (inode, tamanho,
+    mtime_ns) e a versão calculada para ela. O processo que hasheia o master
+    publica o resultado; os demais encontram a versão pela mesma chave e não
+    rehasheiam. Escritas são serializadas com flock; leituras não travam e
+    usam um contador de sequência (ímpar durante uma escrita).
+    """
+    # sequência, inode, tamanho, mtime_ns, tamanho da versão
+    LAYOUT = struct.Struct('=QQQqH')
+    SEQUENCE = struct.Struct('=Q')
+    MAX_VERSION = 256
+    SIZE = 4096
+    READ_ATTEMPTS = 16
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < self.SIZE:
+            os.ftruncate(self._fd, self.SIZE)
+        self._map = mmap.mmap(self._fd, self.SIZE)
+        # flock não exclui threads do mesmo processo (mesmo descritor)
+        self._lock = threading.Lock()
+
+    def _read(self) -> Optional[Tuple[Tuple[int, int, int], str]]:
+        for _ in range(self.READ_ATTEMPTS):
+            seq, ino, size, mtime_ns, length = self.LAYOUT.unpack_from(self._map, 0)
+            if seq % 2:
+                continue
+            start = self.LAYOUT.size
+            version = bytes(self._map[start:start + min(length, self.MAX_VERSION)])
+            if self.SEQUENCE.unpack_from(self._map, 0)[0] == seq:
+                return ((ino, size, mtime_ns), version.decode('ascii')) if seq else None
+        return None
+
+    def lookup(self, key) -> Optional[str]:
+        """Versão publicada para a chave de stat, ou None"""
+        entry = self._read()
+        if entry is None or entry[0] != tuple(key):
+            return None
+        return entry[1]
+
+    def publish(self, key, version: str):
+        data = version.encode('ascii')
+        if len(data) > self.MAX_VERSION:
+            return
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                if self._read() == (tuple(key), version):
+                    return
+                seq = self.SEQUENCE.unpack_from(self._map, 0)[0]
+                self.SEQUENCE.pack_into(self._map, 0, seq + 1)
+                self.LAYOUT.pack_into(self._map, 0, seq + 1, *key, len(data))
+                self._map[self.LAYOUT.size:self.LAYOUT.size + len(data)] = data
+                self.SEQUENCE.pack_into(self._map, 0, seq + 2)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def reset(self):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                self._map[:self.LAYOUT.size] = bytes(self.LAYOUT.size)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
@@ -0,0 +1,81 @@
+import logging
+import multiprocessing
+import signal
+import time
+
+
+class Supervisor:
+    """
+    Mantém N processos do servidor no ar, reiniciando os que terminarem
+    Um processo que cai logo após iniciar é reiniciado com espera crescente,
+    para que um erro de configuração não vire um loop de reinícios
+    """
+    CHECK_INTERVAL = 0.5
+    # Processos que rodaram pelo menos este tempo são reiniciados imediatamente
+    MIN_UPTIME = 5
+    MAX_BACKOFF = 30
+
+    def __init__(self, target, kwargs, processes):
+        # spawn: cada processo começa limpo, sem threads ou caches herdados
+        self._context = multiprocessing.get_context('spawn')
+        self.target = target
+        self.kwargs = kwargs
+        self.processes = processes
+        self.restarts = 0
+        self._slots = []
+        self._stopping = False
+
+    def _spawn(self, index):
+        process = self._context.Process(target=self.target, kwargs=self.kwargs, name=f"rmi-server-{index}")
+        process.start()
+        logging.info(f"Processo {index} iniciado (pid {process.pid})")
+        return {'process': process, 'started': time.monotonic(), 'backoff': 0, 'restart_at': None}
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def _check(self):
+        now = time.monotonic()
+        for index, slot in enumerate(self._slots):
+            process = slot['process']
+            if slot['restart_at'] is None:
+                if process.is_alive():
+                    continue
+                if now - slot['started'] < self.MIN_UPTIME:
+                    slot['backoff'] = min(self.MAX_BACKOFF, max(1, slot['backoff'] * 2))
+                else:
+                    slot['backoff'] = 0
+                slot['restart_at'] = now + slot['backoff']
+                logging.warning(
+                    f"Processo {index} (pid {process.pid}) terminou com código {process.exitcode}; "
+                    f"reiniciando em {slot['backoff']} s"
+                )
+            elif now >= slot['restart_at']:
+                backoff = slot['backoff']
+                self._slots[index] = self._spawn(index)
+                self._slots[index]['backoff'] = backoff
+                self.restarts += 1
+
+    def _shutdown(self):
+        processes = [slot['process'] for slot in self._slots]
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        logging.info(f"Supervisor encerrado ({self.restarts} reinícios)")
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._request_stop)
+        self._slots = [self._spawn(index) for index in range(self.processes)]
+        try:
+            while not self._stopping:
+                time.sleep(self.CHECK_INTERVAL)
+                self._check()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._shutdown()
@@ -1,10 +1,173 @@
+import logging
+import os
+import queue
+import selectors
+import socket
 import threading
+import time
 
-class RequestThread(threading.Thread):
-    def __init__(self, dispatcher, request_data):
-        super().__init__()
-        self.dispatcher = dispatcher
-        self.request_data = request_data
-    
-    def run(self):
-        self.dispatcher.handle_request(self.request_data)
\ No newline at end of file
+
+class WorkerPool:
+    """
+    Pool fixo de workers alimentado por uma fila limitada de conexões
+    Quando a fila está cheia, submit retorna False e o servidor aplica backpressure
+    """
+
+    def __init__(self, handler, workers=None, queue_size=64):
+        self.handler = handler
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.queue_size = queue_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._completed = 0
+        self._rejected = 0
+        self._max_queue_depth = 0
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"Pool iniciado com {self.workers} workers e fila de {self.queue_size}")
+
+    def submit(self, *args) -> bool:
+        try:
+            self._queue.put_nowait(args)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+        with self._lock:
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return True
+
+    def _worker_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            with self._lock:
+                self._busy += 1
+            try:
+                self.handler(*item)
+            except Exception as e:
+                logging.error(f"Erro no worker: {str(e)}", exc_info=True)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                    self._completed += 1
+                self._queue.task_done()
+
+    def shutdown(self, wait=True):
+        for _ in self._threads:
+            # Sentinelas podem bloquear se a fila estiver cheia; os workers a esvaziam
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'busy_workers': self._busy,
+                'utilization': self._busy / self.workers,
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self.queue_size,
+                'max_queue_depth': self._max_queue_depth,
+                'completed': self._completed,
+                'rejected': self._rejected
+            }
+
+
+class IdleConnections:
+    """
+    Conexões ociosas, fora dos workers
+    Conexões recém-aceitas e, entre uma requisição e outra, as keep-alive
+    ficam num selector; quando há dados, on_readable(obj) as entrega ao pool. Conexões paradas há mais
+    de idle_timeout segundos são entregues a on_expire(obj) para fechamento.
+    """
+
+    def __init__(self, on_readable, on_expire, idle_timeout=30):
+        self.on_readable = on_readable
+        self.on_expire = on_expire
+        self.idle_timeout = idle_timeout
+        self._selector = selectors.DefaultSelector()
+        # O selector só é alterado pela própria thread; as demais usam a fila e o wakeup
+        self._incoming = queue.SimpleQueue()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._parked = {}
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="idle-connections", daemon=True)
+        self._thread.start()
+
+    def park(self, sock, obj):
+        self._incoming.put((sock, obj))
+        try:
+            self._wakeup_w.send(b'\0')
+        except OSError:
+            pass
+
+    def _register_incoming(self):
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except OSError:
+            pass
+        now = time.monotonic()
+        while True:
+            try:
+                sock, obj = self._incoming.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self._selector.register(sock, selectors.EVENT_READ, obj)
+            except (ValueError, OSError):
+                # Socket já fechado
+                self.on_expire(obj)
+                continue
+            self._parked[sock] = now
+
+    def _loop(self):
+        while self._running:
+            for key, _ in self._selector.select(timeout=1):
+                if key.fileobj is self._wakeup_r:
+                    self._register_incoming()
+                    continue
+                self._selector.unregister(key.fileobj)
+                self._parked.pop(key.fileobj, None)
+                self.on_readable(key.data)
+            deadline = time.monotonic() - self.idle_timeout
+            for sock, parked_at in list(self._parked.items()):
+                if parked_at < deadline:
+                    obj = self._selector.unregister(sock).data
+                    del self._parked[sock]
+                    self.on_expire(obj)
+
+    def __len__(self):
+        return len(self._parked)
+
+    def close(self):
+        self._running = False
+        try:
+            self._wakeup_w.send(b'\0')
+        except OSError:
+            pass
+        if self._thread is not None:
+            self._thread.join(2)
+        for sock in list(self._parked):
+            self.on_expire(self._selector.unregister(sock).data)
+        self._parked.clear()
+        self._selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
@@ -0,0 +1,232 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple
+from common.digest import DEFAULT_ALGORITHM, hash_file
+
+
+class TreeIndex:
+    """
+    Manifesto incremental de uma árvore de diretórios: caminho -> (tamanho, mtime_ns, hash)
+
+    Cada alteração recebe um número de sequência crescente e entra num diário
+    ordenado; o diff desde a versão N é uma busca binária no diário, com custo
+    proporcional às mudanças. A varredura só refaz o hash de arquivos cujo
+    (tamanho, mtime) mudou, e o índice é persistido para não rehashear tudo ao reiniciar.
+
+    A cada RESCAN_INTERVAL só os diretórios cujo mtime mudou são listados (o
+    mtime muda quando entradas são criadas, removidas ou renomeadas); os demais
+    custam um stat. Escrever num arquivo existente sem renomear não muda o
+    diretório, então essas edições aparecem na varredura completa, feita a cada
+    FULL_RESCAN_INTERVAL ou com rescan(force=True).
+    """
+    HASH_CHUNK_SIZE = 1024 * 1024
+    RESCAN_INTERVAL = 2.0
+    FULL_RESCAN_INTERVAL = 60.0
+    # mtime de diretório mais recente que isto não é confiável (resolução do sistema de arquivos)
+    DIR_MTIME_SLACK_NS = 2 * 10 ** 9
+    # Diário mais longo que isto é compactado; clientes mais antigos recebem o manifesto completo
+    MAX_JOURNAL = 100000
+
+    def __init__(self, root: Path, index_file: Path, algorithm: str = DEFAULT_ALGORITHM):
+        self.root = Path(root)
+        self.index_file = Path(index_file)
+        self.algorithm = algorithm
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._entries: Dict[str, list] = {}
+        self._journal_seqs = []
+        self._journal_paths = []
+        self._journal_start = 0
+        self._version = 0
+        self._scanned_at = 0.0
+        self._full_scanned_at = 0.0
+        # Diretório relativo -> (mtime_ns ou None, subdiretórios, arquivos) da última listagem
+        self._dirs: Dict[str, tuple] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._version = data['version']
+            # Hashes de outro algoritmo não servem: a próxima varredura refaz todos
+            self._entries = data['entries'] if data.get('algorithm', 'md5') == self.algorithm else {}
+            # Sem diário persistido, clientes anteriores ao reinício recebem o manifesto completo
+            self._journal_start = self._version
+        except (FileNotFoundError, KeyError, json.JSONDecodeError):
+            self._entries = {}
+
+    def _save(self):
+        temp_path = f"{self.index_file}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self._version, 'algorithm': self.algorithm, 'entries': self._entries}, f)
+        os.replace(temp_path, self.index_file)
+
+    def _hash_file(self, path: Path) -> str:
+        # Mesma convenção do master: arquivo vazio não tem hash
+        return hash_file(path, self.algorithm, self.HASH_CHUNK_SIZE)
+
+    def _record(self, rel_path: str, entry: Optional[list]):
+        # Deve ser chamado com _lock adquirido; entry None marca remoção
+        self._version += 1
+        if entry is None:
+            self._entries.pop(rel_path, None)
+        else:
+            self._entries[rel_path] = entry + [self._version]
+        self._journal_seqs.append(self._version)
+        self._journal_paths.append(rel_path)
+        if len(self._journal_seqs) > self.MAX_JOURNAL:
+            drop = len(self._journal_seqs) - self.MAX_JOURNAL
+            self._journal_start = self._journal_seqs[drop - 1]
+            del self._journal_seqs[:drop]
+            del self._journal_paths[:drop]
+
+    def rescan(self, force=False) -> int:
+        """Sincroniza o índice com o disco; retorna o número de alterações"""
+        with self._scan_lock:
+            now = time.monotonic()
+            if not force and now - self._scanned_at < self.RESCAN_INTERVAL:
+                return 0
+            self._scanned_at = now
+            full = force or now - self._full_scanned_at >= self.FULL_RESCAN_INTERVAL
+            if full:
+                self._full_scanned_at = now
+            return self._scan(full)
+
+    def _index_file(self, rel_path: str, item: os.DirEntry) -> bool:
+        """Atualiza a entrada de um arquivo listado; retorna True se houve alteração"""
+        st = item.stat()
+        current = self._entries.get(rel_path)
+        if current and current[0] == st.st_size and current[1] == st.st_mtime_ns:
+            return False
+        try:
+            digest = self._hash_file(Path(item.path))
+        except OSError as e:
+            logging.warning(f"Falha ao indexar {rel_path}: {str(e)}")
+            return False
+        # mtime mudou mas o conteúdo não: troca a entrada (sob o lock) sem gerar alteração
+        if current and current[2] == digest:
+            with self._lock:
+                self._entries[rel_path] = [st.st_size, st.st_mtime_ns, digest, current[3]]
+            return False
+        with self._lock:
+            self._record(rel_path, [st.st_size, st.st_mtime_ns, digest])
+        return True
+
+    def _scan(self, full=True) -> int:
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        dirs = {}
+        removed = []
+        changes = 0
+        stack = ['']
+        while stack:
+            rel_dir = stack.pop()
+            directory = self.root / rel_dir if rel_dir else self.root
+            prefix = f"{rel_dir}/" if rel_dir else ''
+            known = self._dirs.get(rel_dir)
+            try:
+                # stat antes de listar: uma mudança durante a listagem deixa o mtime diferente na próxima
+                st = os.stat(directory)
+            except OSError:
+                continue
+            if not full and known and known[0] == st.st_mtime_ns:
+                dirs[rel_dir] = known
+                stack.extend(known[1])
+                continue
+
+            subdirs, files = [], []
+            try:
+                with os.scandir(directory) as it:
+                    for item in it:
+                        if item.is_dir(follow_symlinks=False):
+                            subdirs.append(prefix + item.name)
+                        elif item.is_file(follow_symlinks=False):
+                            files.append(item.name)
+                            if self._index_file(prefix + item.name, item):
+                                changes += 1
+            except OSError as e:
+                logging.warning(f"Falha ao listar {directory}: {str(e)}")
+                if known:
+                    dirs[rel_dir] = known
+                    stack.extend(known[1])
+                continue
+
+            if known:
+                listed = set(files)
+                removed.extend(prefix + name for name in known[2] if name not in listed)
+            recent = time.time_ns() - st.st_mtime_ns < self.DIR_MTIME_SLACK_NS
+            dirs[rel_dir] = (None if recent else st.st_mtime_ns, subdirs, files)
+            stack.extend(subdirs)
+
+        with self._lock:
+            if full:
+                # Varredura completa: confere todas as entradas, inclusive as anteriores a _dirs
+                listed = {f"{rel_dir}/{name}" if rel_dir else name for rel_dir, entry in dirs.items() for name in entry[2]}
+                removed = [p for p in self._entries if p not in listed]
+            else:
+                # Diretórios que sumiram levam seus arquivos
+                for rel_dir, entry in self._dirs.items():
+                    if rel_dir not in dirs:
+                        prefix = f"{rel_dir}/" if rel_dir else ''
+                        removed.extend(prefix + name for name in entry[2])
+            for rel_path in removed:
+                if rel_path in self._entries:
+                    self._record(rel_path, None)
+                    changes += 1
+            self._dirs = dirs
+            if changes:
+                self._save()
+        if changes:
+            logging.info(f"Índice da árvore atualizado: {changes} alterações (versão {self._version})")
+        return changes
+
+    def manifest(self, since: Optional[int] = None) -> dict:
+        """
+        Diferença do manifesto desde a versão since
+        Entradas removidas aparecem com valor None; sem since (ou since antigo demais)
+        o manifesto completo é retornado com full=True
+        """
+        self.rescan()
+        with self._lock:
+            if since is None or since < self._journal_start or since > self._version:
+                return {
+                    'version': self._version,
+                    'full': True,
+                    'entries': {path: entry[:3] for path, entry in self._entries.items()}
+                }
+            start = bisect.bisect_right(self._journal_seqs, since)
+            entries = {}
+            for rel_path in self._journal_paths[start:]:
+                entry = self._entries.get(rel_path)
+                entries[rel_path] = entry[:3] if entry else None
+            return {'version': self._version, 'full': False, 'entries': entries}
+
+    def resolve(self, rel_path: str) -> Path:
+        """Converte um caminho do manifesto em caminho local, recusando saídas da raiz"""
+        root = self.root.resolve()
+        target = (root / rel_path).resolve()
+        if root not in target.parents:
+            raise PermissionError(f"Caminho fora da árvore: {rel_path}")
+        return target
+
+    def open_file(self, rel_path: str) -> Tuple[BinaryIO, int, str]:
+        target = self.resolve(rel_path)
+        f = open(target, 'rb')
+        try:
+            st = os.fstat(f.fileno())
+            with self._lock:
+                entry = self._entries.get(rel_path)
+            if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                digest = entry[2]
+            else:
+                digest = self._hash_file(target)
+            return f, st.st_size, digest
+        except Exception:
+            f.close()
+            raise